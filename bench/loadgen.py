@@ -0,0 +1,365 @@
+"""
+Load generator and end-to-end latency benchmark for the pub/sub path.
+
+Drives the publisher's HTTP `/publish` endpoint and/or direct STOMP SENDs at a
+configurable rate and concurrency, runs instrumented consumers (modelled on
+sub/consumer.py) on the same queue, and prints one JSON document with
+throughput, p50/p95/p99 latencies and error rates.
+
+    # direct STOMP, 2000 msg/s for 30 s, 8 producer threads, 2 consumers
+    python loadgen.py --mode stomp --rate 2000 --duration 30 --concurrency 8 --consumers 2
+
+    # through pub/app.py as fast as it will go
+    python loadgen.py --mode http --publish-url http://localhost:5001/publish \
+                      --queue /queue/order.processing --count 20000 --concurrency 32
+
+Broker settings come from the same variables the services use (ACTIVEMQ_URL,
+ACTIVEMQ_PORT, ACTIVEMQ_USERNAME, ACTIVEMQ_PASSWORD, USE_SSL, ACTIVEMQ_QUEUE),
+loaded from --env-file when given. With --standin-broker the run needs no broker
+at all: an in-process stand-in (stomp_broker.py) is started on a free port.
+
+End-to-end latency needs producers and consumers on the same clock, so run
+everything on one host. STOMP messages carry their send time in a header; for
+HTTP the publisher's "Message #N" body is matched to the request that produced it.
+"""
+import argparse
+import http.client
+import json
+import os
+import ssl
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import stomp
+from dotenv import load_dotenv
+
+SENT_HEADER = 'bench-sent-ns'
+RUN_HEADER = 'bench-run'
+
+
+def percentiles(values):
+    """p50/p95/p99/max in milliseconds for a list of second-valued samples"""
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+    values = sorted(values)
+
+    def pick(pct):
+        return round(values[min(len(values) - 1, int(pct / 100 * len(values)))] * 1000, 3)
+
+    return {'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99), 'max_ms': round(values[-1] * 1000, 3)}
+
+
+class Pacer:
+    """Spaces calls evenly to hit `rate` per second (0 means as fast as possible)"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = time.perf_counter()
+
+    def wait(self):
+        if not self.interval:
+            return
+        delay = self.next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at += self.interval
+
+
+class Budget:
+    """Shared stop condition: a message count and/or a deadline"""
+
+    def __init__(self, count, duration):
+        self.remaining = count if count else None
+        self.deadline = time.perf_counter() + duration if duration else None
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return False
+        if self.remaining is None:
+            return True
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def open_stomp(args, listener=None, name=''):
+    hosts = [(args.host, args.port)]
+    conn = stomp.Connection(hosts, heartbeats=(10000, 10000), auto_decode=False)
+    if args.ssl:
+        conn.set_ssl(for_hosts=hosts, ssl_version=ssl.PROTOCOL_TLS)
+    if listener is not None:
+        conn.set_listener(name, listener)
+    conn.connect(args.user, args.password, wait=True, headers={'heart-beat': '10000,10000'})
+    return conn
+
+
+class BenchConsumer(stomp.ConnectionListener):
+    """Instrumented subscriber: records arrival times for this run's messages"""
+
+    def __init__(self, run_id, results):
+        self.run_id = run_id
+        self.results = results
+
+    def on_message(self, frame):
+        received = time.time_ns()
+        headers = frame.headers
+        sent = headers.get(SENT_HEADER)
+        if sent is not None:
+            if headers.get(RUN_HEADER) == self.run_id:
+                self.results.record_stomp(int(sent), received, headers.get('timestamp'))
+            return
+        # Published through HTTP - the body is the publisher's "Message #N"
+        self.results.record_http_arrival(bytes(frame.body), received, headers.get('timestamp'))
+
+    def on_error(self, frame):
+        self.results.record_consumer_error()
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.send_errors = 0
+        self.send_latencies = []
+        self.received = 0
+        self.e2e = []
+        self.to_broker = []
+        self.from_broker = []
+        self.consumer_errors = 0
+        # HTTP correlation: body -> send time, body -> (arrival time, broker timestamp)
+        self.http_sent = {}
+        self.http_arrived = {}
+
+    def record_send(self, latency, ok):
+        with self.lock:
+            if ok:
+                self.sent += 1
+                self.send_latencies.append(latency)
+            else:
+                self.send_errors += 1
+
+    def _record_e2e(self, sent_ns, received_ns, broker_ms):
+        self.received += 1
+        self.e2e.append((received_ns - sent_ns) / 1e9)
+        if broker_ms:
+            broker_ns = int(broker_ms) * 1_000_000
+            self.to_broker.append(max(broker_ns - sent_ns, 0) / 1e9)
+            self.from_broker.append(max(received_ns - broker_ns, 0) / 1e9)
+
+    def record_stomp(self, sent_ns, received_ns, broker_ms):
+        with self.lock:
+            self._record_e2e(sent_ns, received_ns, broker_ms)
+
+    def record_http_sent(self, body, sent_ns):
+        with self.lock:
+            arrival = self.http_arrived.pop(body, None)
+            if arrival is None:
+                self.http_sent[body] = sent_ns
+            else:
+                self._record_e2e(sent_ns, *arrival)
+
+    def record_http_arrival(self, body, received_ns, broker_ms):
+        with self.lock:
+            sent_ns = self.http_sent.pop(body, None)
+            if sent_ns is None:
+                # The consumer can see the message before the HTTP response returns
+                self.http_arrived[body] = (received_ns, broker_ms)
+            else:
+                self._record_e2e(sent_ns, received_ns, broker_ms)
+
+    def record_consumer_error(self):
+        with self.lock:
+            self.consumer_errors += 1
+
+
+def stomp_producer(args, run_id, budget, pacer, results):
+    conn = open_stomp(args)
+    payload = b'x' * args.payload_bytes
+    try:
+        while budget.take():
+            pacer.wait()
+            started = time.perf_counter()
+            try:
+                conn.send(destination=args.queue, body=payload,
+                          headers={SENT_HEADER: str(time.time_ns()), RUN_HEADER: run_id})
+                results.record_send(time.perf_counter() - started, True)
+            except Exception:
+                results.record_send(0, False)
+                if not conn.is_connected():
+                    conn = open_stomp(args)
+    finally:
+        if conn.is_connected():
+            conn.disconnect()
+
+
+def http_producer(args, budget, pacer, results):
+    url = urlsplit(args.publish_url)
+    conn_cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_cls(url.hostname, url.port, timeout=30)
+    while budget.take():
+        pacer.wait()
+        sent_ns = time.time_ns()
+        started = time.perf_counter()
+        try:
+            conn.request('POST', url.path or '/publish', body=b'', headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            data = json.loads(response.read() or b'{}')
+            ok = response.status < 300 and data.get('status') == 'success'
+            results.record_send(time.perf_counter() - started, ok)
+            if ok:
+                # 202 from a write-behind publisher carries the counter too; its latency includes the buffering
+                results.record_http_sent(f"Message #{data['counter']}".encode('utf-8'), sent_ns)
+        except Exception:
+            results.record_send(0, False)
+            conn.close()
+            conn = conn_cls(url.hostname, url.port, timeout=30)
+    conn.close()
+
+
+def run(args):
+    run_id = uuid.uuid4().hex[:12]
+    results = Results()
+
+    consumers = []
+    for i in range(args.consumers):
+        conn = open_stomp(args, BenchConsumer(run_id, results), 'bench')
+        conn.subscribe(destination=args.queue, id=i + 1, ack='auto',
+                       headers={'activemq.prefetchSize': str(args.prefetch)})
+        consumers.append(conn)
+
+    budget = Budget(args.count, args.duration)
+    per_thread_rate = args.rate / args.concurrency if args.rate else 0
+    modes = ['stomp', 'http'] if args.mode == 'both' else [args.mode]
+
+    threads = []
+    started = time.perf_counter()
+    for i in range(args.concurrency):
+        mode = modes[i % len(modes)]
+        if mode == 'stomp':
+            target = stomp_producer
+            thread_args = (args, run_id, budget, Pacer(per_thread_rate), results)
+        else:
+            target = http_producer
+            thread_args = (args, budget, Pacer(per_thread_rate), results)
+        t = threading.Thread(target=target, args=thread_args, name=f'producer-{i}', daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    publish_seconds = time.perf_counter() - started
+
+    # Let consumers catch up with everything that was sent
+    drain_deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < drain_deadline:
+        with results.lock:
+            if results.received >= results.sent:
+                break
+        time.sleep(0.05)
+    total_seconds = time.perf_counter() - started
+
+    for conn in consumers:
+        if conn.is_connected():
+            conn.disconnect()
+
+    with results.lock:
+        attempted = results.sent + results.send_errors
+        return {
+            'run_id': run_id,
+            'config': {
+                'mode': args.mode,
+                'queue': args.queue,
+                'broker': f'{args.host}:{args.port}',
+                'publish_url': args.publish_url if args.mode != 'stomp' else None,
+                'target_rate': args.rate or None,
+                'concurrency': args.concurrency,
+                'consumers': args.consumers,
+                'prefetch': args.prefetch,
+                'payload_bytes': args.payload_bytes if args.mode != 'http' else None,
+            },
+            'publish': {
+                'attempted': attempted,
+                'succeeded': results.sent,
+                'errors': results.send_errors,
+                'error_rate': round(results.send_errors / attempted, 6) if attempted else 0.0,
+                'seconds': round(publish_seconds, 3),
+                'throughput_per_sec': round(results.sent / publish_seconds, 1) if publish_seconds else 0.0,
+                'latency': percentiles(results.send_latencies),
+            },
+            'consume': {
+                'received': results.received,
+                'missing': max(results.sent - results.received, 0),
+                'consumer_errors': results.consumer_errors,
+                'seconds': round(total_seconds, 3),
+                'throughput_per_sec': round(results.received / total_seconds, 1) if total_seconds else 0.0,
+            },
+            'latency': {
+                'end_to_end': percentiles(results.e2e),
+                'publish_to_broker': percentiles(results.to_broker),
+                'broker_to_consume': percentiles(results.from_broker),
+            },
+        }
+
+
+def parse_args(argv=None):
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument('--env-file')
+    known, _ = pre.parse_known_args(argv)
+    load_dotenv(known.env_file) if known.env_file else load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Pub/sub load generator and latency benchmark', parents=[pre])
+    parser.add_argument('--mode', choices=['stomp', 'http', 'both'], default='stomp')
+    parser.add_argument('--host', default=os.getenv('ACTIVEMQ_URL', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('ACTIVEMQ_PORT', 61614)))
+    parser.add_argument('--user', default=os.getenv('ACTIVEMQ_USERNAME', 'admin'))
+    parser.add_argument('--password', default=os.getenv('ACTIVEMQ_PASSWORD', 'admin'))
+    parser.add_argument('--ssl', action=argparse.BooleanOptionalAction,
+                        default=os.getenv('USE_SSL', 'true').lower() == 'true')
+    parser.add_argument('--queue', default=os.getenv('ACTIVEMQ_QUEUE', '/queue/bench'))
+    parser.add_argument('--publish-url', default='http://localhost:5001/publish')
+    parser.add_argument('--rate', type=float, default=0, help='target messages/s across all producers (0 = unlimited)')
+    parser.add_argument('--concurrency', type=int, default=4, help='producer threads')
+    parser.add_argument('--count', type=int, default=0, help='total messages to send')
+    parser.add_argument('--duration', type=float, default=0, help='seconds to send for')
+    parser.add_argument('--consumers', type=int, default=1, help='instrumented consumer connections')
+    parser.add_argument('--prefetch', type=int, default=1000, help='activemq.prefetchSize for consumers')
+    parser.add_argument('--payload-bytes', type=int, default=256, help='body size for direct STOMP sends')
+    parser.add_argument('--drain-timeout', type=float, default=30, help='seconds to wait for consumers to catch up')
+    parser.add_argument('--standin-broker', action='store_true',
+                        help='run against an in-process stand-in broker instead of ACTIVEMQ_URL')
+    parser.add_argument('--output', help='write the JSON report to this file as well')
+    args = parser.parse_args(argv)
+
+    if not args.count and not args.duration:
+        args.count = 10000
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    broker = None
+    if args.standin_broker:
+        from stomp_broker import StandInBroker
+        broker = StandInBroker(port=0)
+        args.host, args.port = broker.start_in_thread()
+        args.ssl = False
+    try:
+        report = run(args)
+    finally:
+        if broker is not None:
+            broker.stop()
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 0 if report['publish']['errors'] == 0 and report['consume']['missing'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
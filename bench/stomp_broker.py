@@ -0,0 +1,785 @@
+"""
+Lightweight in-process STOMP 1.2 broker stand-in for offline tests and benchmarks.
+
+Speaks enough of the ActiveMQ flavour of STOMP for pub/, sub/ and monitor/ to run
+against it without a real AWS MQ / ActiveMQ broker:
+
+- queues (competing consumers, round-robin) and topics (fan-out), with ActiveMQ
+  style wildcards ('*' for one segment, '>' for the rest) on SUBSCRIBE
+- SEND / SUBSCRIBE / UNSUBSCRIBE / ACK / NACK with auto, client (cumulative) and
+  client-individual ack modes and the `activemq.prefetchSize` header
+- BEGIN / COMMIT / ABORT transactions covering SEND and ACK
+- `/temp-queue/...` reply queues, rewritten to `/remote-temp-queue/...` in
+  `reply-to` the same way ActiveMQ does
+- heart-beat negotiation in both directions and RECEIPT frames
+- a fake StatisticsBrokerPlugin answering `ActiveMQ.Statistics.Destination.<pattern>`
+  and `ActiveMQ.Statistics.Broker` with the jms-map-xml `<map>` bodies the monitor parses
+
+Plain TCP only - run the clients with USE_SSL=false.
+
+    python stomp_broker.py --port 61613
+
+or embedded:
+
+    broker = StandInBroker(port=0)
+    host, port = broker.start_in_thread()
+    ...
+    broker.stop()
+"""
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+
+STATISTICS_DESTINATION_PREFIX = 'ActiveMQ.Statistics.Destination.'
+STATISTICS_BROKER = 'ActiveMQ.Statistics.Broker'
+DEFAULT_PREFETCH = 1000
+
+
+def escape_header(value):
+    return str(value).replace('\\', '\\\\').replace('\r', '\\r').replace('\n', '\\n').replace(':', '\\c')
+
+
+def unescape_header(value):
+    out = []
+    chars = iter(value)
+    for c in chars:
+        if c != '\\':
+            out.append(c)
+            continue
+        n = next(chars, '')
+        out.append({'r': '\r', 'n': '\n', 'c': ':', '\\': '\\'}.get(n, n))
+    return ''.join(out)
+
+
+def encode_frame(command, headers=None, body=b''):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    lines = [command]
+    for key, value in (headers or {}).items():
+        if command == 'CONNECTED':
+            lines.append(f'{key}:{value}')
+        else:
+            lines.append(f'{escape_header(key)}:{escape_header(value)}')
+    if body and 'content-length' not in (headers or {}):
+        lines.append(f'content-length:{len(body)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8') + body + b'\x00'
+
+
+def parse_destination(destination):
+    """Split a STOMP destination into (kind, name); bare names are queues as in ActiveMQ"""
+    for prefix, kind in (('/queue/', 'queue'), ('/topic/', 'topic'),
+                         ('/temp-queue/', 'temp-queue'), ('/remote-temp-queue/', 'remote-temp-queue'),
+                         ('/temp-topic/', 'temp-topic')):
+        if destination.startswith(prefix):
+            return kind, destination[len(prefix):]
+    return 'queue', destination
+
+
+def wildcard_match(pattern, name):
+    """ActiveMQ wildcard match: '.' separates segments, '*' is one segment, '>' is the rest"""
+    if '*' not in pattern and '>' not in pattern:
+        return pattern == name
+    p_parts = pattern.split('.')
+    n_parts = name.split('.')
+    for i, part in enumerate(p_parts):
+        if part == '>':
+            return True
+        if i >= len(n_parts):
+            return False
+        if part != '*' and part != n_parts[i]:
+            return False
+    return len(p_parts) == len(n_parts)
+
+
+def map_xml(entries):
+    """Render a jms-map-xml body like ActiveMQ's MapMessage transformation"""
+    parts = ['<map>']
+    for key, value in entries.items():
+        if isinstance(value, bool):
+            tag, text = 'boolean', str(value).lower()
+        elif isinstance(value, int):
+            tag, text = 'long', str(value)
+        elif isinstance(value, float):
+            tag, text = 'double', repr(value)
+        else:
+            tag, text = 'string', str(value)
+        parts.append(f'\n  <entry>\n    <string>{key}</string>\n    <{tag}>{text}</{tag}>\n  </entry>')
+    parts.append('\n</map>')
+    return ''.join(parts)
+
+
+class Message:
+    __slots__ = ('message_id', 'headers', 'body', 'redelivered', 'enqueued_at')
+
+    def __init__(self, message_id, headers, body):
+        self.message_id = message_id
+        self.headers = headers
+        self.body = body
+        self.redelivered = False
+        self.enqueued_at = time.time()
+
+
+class Destination:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.pending = deque()
+        self.subscriptions = []
+        self.rr = 0
+        self.enqueue_count = 0
+        self.dequeue_count = 0
+        self.dispatch_count = 0
+        self.expired_count = 0
+        self.producers = set()
+        self.total_enqueue_time = 0.0
+        self.min_enqueue_time = 0.0
+        self.max_enqueue_time = 0.0
+        self.total_size = 0
+        self.min_size = 0
+        self.max_size = 0
+
+    @property
+    def stats_name(self):
+        prefix = 'topic://' if self.kind in ('topic', 'temp-topic') else 'queue://'
+        return prefix + self.name
+
+    def record_dequeue(self, message):
+        self.dequeue_count += 1
+        elapsed = (time.time() - message.enqueued_at) * 1000
+        self.total_enqueue_time += elapsed
+        self.min_enqueue_time = elapsed if self.dequeue_count == 1 else min(self.min_enqueue_time, elapsed)
+        self.max_enqueue_time = max(self.max_enqueue_time, elapsed)
+
+
+class Subscription:
+    def __init__(self, session, sub_id, kind, pattern, ack, prefetch, selector_headers):
+        self.session = session
+        self.id = sub_id
+        self.kind = kind
+        self.pattern = pattern
+        self.ack = ack
+        self.prefetch = max(1, prefetch)
+        self.headers = selector_headers
+        # ack id -> (destination, message), in delivery order
+        self.unacked = {}
+
+    def matches(self, destination):
+        kind = destination.kind
+        if self.kind in ('temp-queue', 'remote-temp-queue'):
+            return kind == 'temp-queue' and destination.name == self.pattern
+        return kind == self.kind and wildcard_match(self.pattern, destination.name)
+
+    @property
+    def has_capacity(self):
+        return len(self.unacked) < self.prefetch
+
+
+class Session:
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.id = f'ID:standin-{next(broker.session_ids)}'
+        self.subscriptions = {}
+        self.transactions = {}
+        self.connected = False
+        self.version = '1.2'
+        self.closed = False
+        self.last_received = time.monotonic()
+        self.send_interval = 0
+        self.receive_timeout = 0
+        self.tasks = []
+
+    # -- wire ---------------------------------------------------------------
+
+    def write(self, data):
+        if self.closed:
+            return
+        try:
+            self.writer.write(data)
+        except Exception:
+            self.close()
+
+    def send_frame(self, command, headers=None, body=b''):
+        self.write(encode_frame(command, headers, body))
+
+    def send_error(self, message, frame_headers=None, detail=''):
+        headers = {'message': message}
+        if frame_headers and 'receipt' in frame_headers:
+            headers['receipt-id'] = frame_headers['receipt']
+        self.send_frame('ERROR', headers, detail)
+
+    async def read_frames(self):
+        buf = b''
+        while not self.closed:
+            chunk = await self.reader.read(65536)
+            if not chunk:
+                return
+            self.last_received = time.monotonic()
+            buf += chunk
+            while True:
+                # Heart-beats and padding between frames
+                stripped = buf.lstrip(b'\r\n')
+                buf = stripped
+                if not buf:
+                    break
+                header_end = buf.find(b'\n\n')
+                crlf_end = buf.find(b'\r\n\r\n')
+                if crlf_end != -1 and (header_end == -1 or crlf_end < header_end):
+                    header_end, sep_len = crlf_end, 4
+                else:
+                    sep_len = 2
+                if header_end == -1:
+                    break
+                head = buf[:header_end].decode('utf-8').replace('\r\n', '\n').split('\n')
+                command = head[0]
+                headers = {}
+                for line in head[1:]:
+                    key, _, value = line.partition(':')
+                    if command not in ('CONNECT', 'STOMP'):
+                        key, value = unescape_header(key), unescape_header(value)
+                    headers.setdefault(key, value)
+                body_start = header_end + sep_len
+                if 'content-length' in headers:
+                    length = int(headers['content-length'])
+                    if len(buf) < body_start + length + 1:
+                        break
+                    body = buf[body_start:body_start + length]
+                    buf = buf[body_start + length + 1:]
+                else:
+                    nul = buf.find(b'\x00', body_start)
+                    if nul == -1:
+                        break
+                    body = buf[body_start:nul]
+                    buf = buf[nul + 1:]
+                yield command, headers, body
+
+    # -- lifecycle ------------------------------------------------------------
+
+    async def run(self):
+        try:
+            async for command, headers, body in self.read_frames():
+                handler = getattr(self, f'on_{command.lower()}', None)
+                if handler is None:
+                    self.send_error(f'Unknown command {command}', headers)
+                    continue
+                if command not in ('CONNECT', 'STOMP') and not self.connected:
+                    self.send_error('Not connected', headers)
+                    continue
+                handler(headers, body)
+                if 'receipt' in headers and command not in ('CONNECT', 'STOMP'):
+                    self.send_frame('RECEIPT', {'receipt-id': headers['receipt']})
+                    if command == 'DISCONNECT':
+                        await self.drain()
+                        break
+                await self.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.close()
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except Exception:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for task in self.tasks:
+            task.cancel()
+        for sub in list(self.subscriptions.values()):
+            self.broker.remove_subscription(sub)
+        self.subscriptions.clear()
+        self.transactions.clear()
+        self.broker.sessions.discard(self)
+        for dest in self.broker.destinations.values():
+            dest.producers.discard(self)
+        self.broker.drop_temp_destinations(self)
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+    async def heartbeat_sender(self):
+        while not self.closed:
+            await asyncio.sleep(self.send_interval / 1000)
+            self.write(b'\n')
+
+    async def heartbeat_monitor(self):
+        while not self.closed:
+            await asyncio.sleep(self.receive_timeout / 1000)
+            if time.monotonic() - self.last_received > self.receive_timeout / 1000:
+                self.close()
+
+    # -- frames ---------------------------------------------------------------
+
+    def on_connect(self, headers, body):
+        users = self.broker.users
+        if users is not None and users.get(headers.get('login')) != headers.get('passcode'):
+            self.send_error('User name [%s] or password is invalid.' % headers.get('login'))
+            self.close()
+            return
+        cx, cy = (int(v) for v in headers.get('heart-beat', '0,0').split(','))
+        sx, sy = self.broker.heartbeats
+        # Server sends every max(sx, cy), expects client frames every max(cx, sy)
+        self.send_interval = max(sx, cy) if sx and cy else 0
+        self.receive_timeout = max(cx, sy) * 2 if cx and sy else 0
+        self.connected = True
+        self.broker.sessions.add(self)
+        # STOMP 1.1 clients (stomp.Connection's default) ack by message-id + subscription
+        accepted = headers.get('accept-version', '1.0').split(',')
+        self.version = '1.2' if '1.2' in accepted else '1.1'
+        self.send_frame('CONNECTED', {
+            'version': self.version,
+            'session': self.id,
+            'server': 'ActiveMQ-StandIn/1.0',
+            'heart-beat': f'{sx},{sy}',
+        })
+        loop = asyncio.get_running_loop()
+        if self.send_interval:
+            self.tasks.append(loop.create_task(self.heartbeat_sender()))
+        if self.receive_timeout:
+            self.tasks.append(loop.create_task(self.heartbeat_monitor()))
+
+    on_stomp = on_connect
+
+    def on_disconnect(self, headers, body):
+        if 'receipt' not in headers:
+            self.close()
+
+    def on_send(self, headers, body):
+        if 'destination' not in headers:
+            self.send_error('No destination header', headers)
+            return
+        tx = headers.get('transaction')
+        if tx:
+            if tx not in self.transactions:
+                self.send_error(f'Invalid transaction id: {tx}', headers)
+                return
+            self.transactions[tx].append(('send', dict(headers), body))
+            return
+        self.broker.publish(self, headers, body)
+
+    def on_subscribe(self, headers, body):
+        sub_id = headers.get('id')
+        if sub_id is None or 'destination' not in headers:
+            self.send_error('SUBSCRIBE requires id and destination', headers)
+            return
+        kind, name = parse_destination(headers['destination'])
+        if kind == 'temp-queue':
+            name = self.broker.temp_name(self, name)
+        prefetch = int(headers.get('activemq.prefetchSize', DEFAULT_PREFETCH))
+        sub = Subscription(self, sub_id, kind, name, headers.get('ack', 'auto'), prefetch, headers)
+        self.subscriptions[sub_id] = sub
+        self.broker.add_subscription(sub)
+
+    def on_unsubscribe(self, headers, body):
+        sub = self.subscriptions.pop(headers.get('id'), None)
+        if sub is not None:
+            self.broker.remove_subscription(sub)
+
+    def on_ack(self, headers, body):
+        self._ack_or_nack('ack', headers)
+
+    def on_nack(self, headers, body):
+        self._ack_or_nack('nack', headers)
+
+    def _ack_or_nack(self, kind, headers):
+        ack_id = headers.get('id') if self.version == '1.2' else headers.get('message-id')
+        tx = headers.get('transaction')
+        if tx:
+            if tx not in self.transactions:
+                self.send_error(f'Invalid transaction id: {tx}', headers)
+                return
+            self.transactions[tx].append((kind, dict(headers), None))
+            return
+        if not self.broker.acknowledge(self, ack_id, nack=(kind == 'nack')):
+            self.send_error(f'Unexpected {kind.upper()} received for message-id [{ack_id}]', headers)
+
+    def on_begin(self, headers, body):
+        tx = headers.get('transaction')
+        if not tx or tx in self.transactions:
+            self.send_error(f'Invalid transaction id: {tx}', headers)
+            return
+        self.transactions[tx] = []
+
+    def on_commit(self, headers, body):
+        ops = self.transactions.pop(headers.get('transaction'), None)
+        if ops is None:
+            self.send_error(f'Invalid transaction id: {headers.get("transaction")}', headers)
+            return
+        for op, op_headers, op_body in ops:
+            op_headers.pop('transaction', None)
+            if op == 'send':
+                self.broker.publish(self, op_headers, op_body)
+            else:
+                self.broker.acknowledge(self, op_headers.get('id'), nack=(op == 'nack'))
+
+    def on_abort(self, headers, body):
+        if self.transactions.pop(headers.get('transaction'), None) is None:
+            self.send_error(f'Invalid transaction id: {headers.get("transaction")}', headers)
+
+
+class StandInBroker:
+    def __init__(self, host='127.0.0.1', port=61613, heartbeats=(10000, 10000), users=None,
+                 broker_name='localhost', advisory_topics=True):
+        self.host = host
+        self.port = port
+        self.heartbeats = heartbeats
+        self.users = users
+        self.broker_name = broker_name
+        self.advisory_topics = advisory_topics
+        self.destinations = {}
+        self.sessions = set()
+        self.session_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.ack_ids = itertools.count(1)
+        self.started_at = time.time()
+        self.server = None
+        self.loop = None
+        self._thread = None
+
+    # -- destinations ---------------------------------------------------------
+
+    def temp_name(self, session, name):
+        return f'{session.id}:{name}'
+
+    def destination(self, kind, name, create=True):
+        if kind == 'remote-temp-queue':
+            kind = 'temp-queue'
+        key = (kind, name)
+        dest = self.destinations.get(key)
+        if dest is None and create:
+            dest = self.destinations[key] = Destination(kind, name)
+            if kind in ('queue', 'topic') and not name.startswith('ActiveMQ.') and self.advisory_topics:
+                advisory = f'ActiveMQ.Advisory.{"Queue" if kind == "queue" else "Topic"}'
+                self.destination('topic', advisory)
+            for session in list(self.sessions):
+                for sub in session.subscriptions.values():
+                    if sub.matches(dest) and sub not in dest.subscriptions:
+                        dest.subscriptions.append(sub)
+        return dest
+
+    def drop_temp_destinations(self, session):
+        prefix = f'{session.id}:'
+        for key in [k for k in self.destinations if k[0] == 'temp-queue' and k[1].startswith(prefix)]:
+            del self.destinations[key]
+
+    def add_subscription(self, sub):
+        if sub.kind in ('temp-queue', 'remote-temp-queue'):
+            dest = self.destination('temp-queue', sub.pattern)
+            if sub not in dest.subscriptions:
+                dest.subscriptions.append(sub)
+            self.dispatch(dest)
+            return
+        if '*' not in sub.pattern and '>' not in sub.pattern:
+            self.destination(sub.kind, sub.pattern)
+        for dest in list(self.destinations.values()):
+            if sub.matches(dest) and sub not in dest.subscriptions:
+                dest.subscriptions.append(sub)
+                self.dispatch(dest)
+
+    def remove_subscription(self, sub):
+        for dest in self.destinations.values():
+            if sub in dest.subscriptions:
+                dest.subscriptions.remove(sub)
+        # Unacked messages go back to the head of their queue, flagged as redelivered
+        for dest, message in reversed(list(sub.unacked.values())):
+            if dest.kind != 'topic':
+                message.redelivered = True
+                dest.pending.appendleft(message)
+        touched = {id(d): d for d, _ in sub.unacked.values()}
+        sub.unacked.clear()
+        for dest in touched.values():
+            self.dispatch(dest)
+
+    # -- messaging ------------------------------------------------------------
+
+    def publish(self, session, headers, body):
+        kind, name = parse_destination(headers['destination'])
+        if kind == 'temp-queue':
+            name = self.temp_name(session, name)
+
+        if kind == 'queue' and name.startswith(STATISTICS_DESTINATION_PREFIX):
+            self.answer_statistics(session, headers, name[len(STATISTICS_DESTINATION_PREFIX):])
+            return
+        if kind == 'queue' and name == STATISTICS_BROKER:
+            self.answer_statistics(session, headers, None)
+            return
+
+        dest = self.destination(kind, name)
+        dest.producers.add(session)
+        message_headers = {k: v for k, v in headers.items()
+                           if k not in ('receipt', 'transaction', 'content-length')}
+        if 'reply-to' in message_headers:
+            reply_kind, reply_name = parse_destination(message_headers['reply-to'])
+            if reply_kind == 'temp-queue':
+                message_headers['reply-to'] = f'/remote-temp-queue/{self.temp_name(session, reply_name)}'
+        message_headers.setdefault('timestamp', str(int(time.time() * 1000)))
+        message_headers.setdefault('expires', '0')
+        message_headers.setdefault('priority', '4')
+        message_headers.setdefault('persistent', 'false')
+        message_id = f'{session.id}:1:1:1:{next(self.message_ids)}'
+        message_headers['message-id'] = message_id
+        self.enqueue(dest, Message(message_id, message_headers, body))
+
+    def enqueue(self, dest, message):
+        dest.enqueue_count += 1
+        size = len(message.body)
+        dest.total_size += size
+        dest.min_size = size if dest.enqueue_count == 1 else min(dest.min_size, size)
+        dest.max_size = max(dest.max_size, size)
+        if dest.kind in ('topic', 'temp-topic'):
+            for sub in list(dest.subscriptions):
+                self.deliver(dest, sub, message)
+            dest.dequeue_count += len(dest.subscriptions)
+            return
+        dest.pending.append(message)
+        self.dispatch(dest)
+
+    def dispatch(self, dest):
+        if dest.kind in ('topic', 'temp-topic'):
+            return
+        subs = dest.subscriptions
+        while dest.pending and subs:
+            for _ in range(len(subs)):
+                dest.rr = (dest.rr + 1) % len(subs)
+                sub = subs[dest.rr]
+                if sub.has_capacity:
+                    break
+            else:
+                return
+            message = dest.pending.popleft()
+            self.deliver(dest, sub, message)
+
+    def deliver(self, dest, sub, message):
+        ack_id = str(next(self.ack_ids)) if sub.session.version == '1.2' else message.message_id
+        headers = dict(message.headers)
+        headers['subscription'] = sub.id
+        headers['destination'] = self.client_destination(dest)
+        if message.redelivered:
+            headers['redelivered'] = 'true'
+        if sub.ack != 'auto':
+            if sub.session.version == '1.2':
+                headers['ack'] = ack_id
+            sub.unacked[ack_id] = (dest, message)
+        else:
+            if dest.kind not in ('topic', 'temp-topic'):
+                dest.record_dequeue(message)
+        dest.dispatch_count += 1
+        sub.session.send_frame('MESSAGE', headers, message.body)
+
+    def client_destination(self, dest):
+        if dest.kind == 'temp-queue':
+            return f'/remote-temp-queue/{dest.name}'
+        return f'/{dest.kind}/{dest.name}'
+
+    def acknowledge(self, session, ack_id, nack=False):
+        for sub in session.subscriptions.values():
+            if ack_id not in sub.unacked:
+                continue
+            if sub.ack == 'client' and not nack:
+                # Cumulative: everything delivered on this subscription up to ack_id
+                acked = []
+                for key in list(sub.unacked):
+                    acked.append(sub.unacked.pop(key))
+                    if key == ack_id:
+                        break
+            else:
+                acked = [sub.unacked.pop(ack_id)]
+            touched = {}
+            for dest, message in acked:
+                touched[id(dest)] = dest
+                if nack:
+                    message.redelivered = True
+                    dest.pending.appendleft(message)
+                elif dest.kind not in ('topic', 'temp-topic'):
+                    dest.record_dequeue(message)
+            # The freed prefetch window is shared by every queue a wildcard subscription matches
+            for dest in self.destinations.values():
+                if sub in dest.subscriptions:
+                    touched[id(dest)] = dest
+            for dest in touched.values():
+                self.dispatch(dest)
+            return True
+        return False
+
+    # -- statistics plugin ----------------------------------------------------
+
+    def destination_stats(self, dest):
+        inflight = sum(1 for sub in dest.subscriptions for d, _ in sub.unacked.values() if d is dest)
+        count = dest.enqueue_count
+        return {
+            'brokerName': self.broker_name,
+            'brokerId': 'ID:standin-broker',
+            'destinationName': dest.stats_name,
+            'size': len(dest.pending) + inflight if dest.kind != 'topic' else 0,
+            'enqueueCount': dest.enqueue_count,
+            'dequeueCount': dest.dequeue_count,
+            'dispatchCount': dest.dispatch_count,
+            'expiredCount': dest.expired_count,
+            'inflightCount': inflight,
+            'messagesCached': len(dest.pending),
+            'consumerCount': len(dest.subscriptions),
+            'producerCount': len(dest.producers),
+            'averageEnqueueTime': (dest.total_enqueue_time / dest.dequeue_count) if dest.dequeue_count else 0.0,
+            'minEnqueueTime': int(dest.min_enqueue_time),
+            'maxEnqueueTime': int(dest.max_enqueue_time),
+            'averageMessageSize': (dest.total_size // count) if count else 0,
+            'minMessageSize': dest.min_size,
+            'maxMessageSize': dest.max_size,
+            'memoryUsage': sum(len(m.body) for m in dest.pending),
+            'memoryPercentUsage': 0,
+            'memoryLimit': 1 << 30,
+        }
+
+    def broker_stats(self):
+        totals = [self.destination_stats(d) for d in self.destinations.values() if d.kind == 'queue']
+        return {
+            'brokerName': self.broker_name,
+            'brokerId': 'ID:standin-broker',
+            'size': sum(s['size'] for s in totals),
+            'enqueueCount': sum(s['enqueueCount'] for s in totals),
+            'dequeueCount': sum(s['dequeueCount'] for s in totals),
+            'dispatchCount': sum(s['dispatchCount'] for s in totals),
+            'inflightCount': sum(s['inflightCount'] for s in totals),
+            'expiredCount': 0,
+            'consumerCount': sum(s['consumerCount'] for s in totals),
+            'producerCount': sum(s['producerCount'] for s in totals),
+            'memoryUsage': sum(s['memoryUsage'] for s in totals),
+            'memoryLimit': 1 << 30,
+            'memoryPercentUsage': 0,
+            'storeUsage': 0,
+            'storeLimit': 1 << 34,
+            'storePercentUsage': 0,
+            'tempUsage': 0,
+            'tempLimit': 1 << 32,
+            'tempPercentUsage': 0,
+            'averageEnqueueTime': 0.0,
+            'uptime': f'{int(time.time() - self.started_at)} seconds',
+            'stomp': f'stomp://{self.host}:{self.port}',
+            'vm': 'vm://localhost',
+            'dataDirectory': '/tmp/standin',
+        }
+
+    def answer_statistics(self, session, headers, pattern):
+        reply_to = headers.get('reply-to')
+        if not reply_to:
+            return
+        kind, name = parse_destination(reply_to)
+        if kind == 'temp-queue':
+            name = self.temp_name(session, name)
+        reply_dest = self.destination(kind, name)
+
+        if pattern is None:
+            payloads = [self.broker_stats()]
+        else:
+            payloads = [self.destination_stats(d) for d in list(self.destinations.values())
+                        if d.kind in ('queue', 'topic') and wildcard_match(pattern, d.name)]
+
+        for payload in payloads:
+            reply_headers = {
+                'destination': self.client_destination(reply_dest),
+                'transformation': 'jms-map-xml',
+                'timestamp': str(int(time.time() * 1000)),
+                'expires': '0',
+                'priority': '4',
+                'message-id': f'ID:standin-broker:1:1:1:{next(self.message_ids)}',
+            }
+            if 'correlation-id' in headers:
+                reply_headers['correlation-id'] = headers['correlation-id']
+            body = map_xml(payload).encode('utf-8')
+            reply_dest.enqueue_count += 1
+            if reply_dest.kind in ('topic', 'temp-topic'):
+                for sub in list(reply_dest.subscriptions):
+                    self.deliver(reply_dest, sub, Message(reply_headers['message-id'], reply_headers, body))
+            else:
+                reply_dest.pending.append(Message(reply_headers['message-id'], reply_headers, body))
+                self.dispatch(reply_dest)
+
+    # -- server ---------------------------------------------------------------
+
+    async def _handle(self, reader, writer):
+        await Session(self, reader, writer).run()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"[INFO] Stand-in STOMP broker listening on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_in_thread(self):
+        """Run the broker on a private event loop in a daemon thread; returns (host, port)"""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='stomp-standin-broker', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.host, self.port
+
+    def call(self, fn, *args):
+        """Run `fn(*args)` on the broker loop from another thread and return its result"""
+        async def wrapper():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(wrapper(), self.loop).result()
+
+    def drop_connections(self):
+        """Close every client connection, as a broker failover would"""
+        self.call(lambda: [s.close() for s in list(self.sessions)])
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            for session in list(self.sessions):
+                session.close()
+            self.server.close()
+            await self.server.wait_closed()
+
+        if self._thread is not None:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in STOMP 1.2 broker for offline tests and benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=61613)
+    parser.add_argument('--heartbeat-ms', type=int, default=10000,
+                        help='heart-beat interval offered to clients in both directions (0 disables)')
+    parser.add_argument('--user', action='append', default=[], metavar='LOGIN:PASSCODE',
+                        help='accept only these credentials (repeatable); any login is accepted if omitted')
+    args = parser.parse_args()
+
+    users = dict(u.split(':', 1) for u in args.user) if args.user else None
+    broker = StandInBroker(args.host, args.port, (args.heartbeat_ms, args.heartbeat_ms), users)
+    try:
+        asyncio.run(broker.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,19 @@
 import os
 import time
+import signal
 import ssl
+import threading
 import uuid
 import stomp
 from dotenv import load_dotenv
+from stats_parser import parse_destination_stats, parse_map
+from timeseries import TimeSeriesStore
+from structured_log import get_logger, setup_logging, flush as flush_logs
+
+log = get_logger('monitor')
 
 load_dotenv()
+setup_logging()
 
 ACTIVEMQ_URL = os.getenv('ACTIVEMQ_URL', 'localhost')
 ACTIVEMQ_URL_SECONDARY = os.getenv('ACTIVEMQ_URL_SECONDARY', '')
@@ -18,30 +26,119 @@ BROKER_HOSTS = [(ACTIVEMQ_URL, ACTIVEMQ_PORT)]
 if ACTIVEMQ_URL_SECONDARY:
     BROKER_HOSTS.append((ACTIVEMQ_URL_SECONDARY, ACTIVEMQ_PORT))
 
+# Daemon mode: > 0 keeps the connection open and re-requests statistics every this many seconds
+# (0 runs one discovery and prints the report, as before)
+MONITOR_INTERVAL_SECONDS = float(os.getenv('MONITOR_INTERVAL_SECONDS', 0))
+# Destinations not reported for this many intervals (deleted queues) leave the snapshot
+MONITOR_STALE_INTERVALS = int(os.getenv('MONITOR_STALE_INTERVALS', 3))
+# Print the full report every this many intervals in daemon mode (0 = summary log line only)
+MONITOR_REPORT_EVERY = int(os.getenv('MONITOR_REPORT_EVERY', 0))
+
+# Replies to a statistics request are complete once the expected number arrived, or once none came for a
+# quiet period of QUIET_FACTOR x the longest gap seen so far (the first gap is the broker's response time),
+# kept between QUIET_MIN_MS and QUIET_MAX_SECONDS; the wait gives up after REPLY_TIMEOUT_SECONDS
+MONITOR_REPLY_TIMEOUT_SECONDS = float(os.getenv('MONITOR_REPLY_TIMEOUT_SECONDS', 15))
+MONITOR_QUIET_MIN_MS = float(os.getenv('MONITOR_QUIET_MIN_MS', 100))
+MONITOR_QUIET_MAX_SECONDS = float(os.getenv('MONITOR_QUIET_MAX_SECONDS', 3))
+QUIET_FACTOR = 4
+
+# Targeted mode: query only these destinations instead of every one on the broker. Comma-separated names or
+# wildcards (orders.>), queues unless prefixed topic://; each request gives up after QUERY_TIMEOUT_SECONDS
+MONITOR_DESTINATIONS = [d.strip() for d in os.getenv('MONITOR_DESTINATIONS', '').split(',') if d.strip()]
+MONITOR_QUERY_TIMEOUT_SECONDS = float(os.getenv('MONITOR_QUERY_TIMEOUT_SECONDS', 5))
+
+# Every destination reply is also a sample in a time series: the latest HISTORY_SAMPLES per destination are
+# kept in memory (and appended to columnar files in HISTORY_DIR when set, so history survives restarts and
+# one-shot runs), and rates, backlog growth and drain time are computed over the last RATE_WINDOW_SECONDS
+MONITOR_HISTORY_SAMPLES = int(os.getenv('MONITOR_HISTORY_SAMPLES', 720))
+MONITOR_HISTORY_DIR = os.getenv('MONITOR_HISTORY_DIR', '')
+MONITOR_RATE_WINDOW_SECONDS = float(os.getenv('MONITOR_RATE_WINDOW_SECONDS', 300))
+
+STATISTICS_PREFIX = 'ActiveMQ.Statistics.Destination.'
+STATISTICS_WILDCARD = STATISTICS_PREFIX + '>'
+STATISTICS_BROKER = 'ActiveMQ.Statistics.Broker'
+
+
+def quiet_period(max_gap):
+    return min(MONITOR_QUIET_MAX_SECONDS, max(MONITOR_QUIET_MIN_MS / 1000, QUIET_FACTOR * max_gap))
+
+
+def statistics_destination(name):
+    """Where to send the statistics request for one target: queues by default, `topic://name` for topics"""
+    if name.startswith('topic://'):
+        return f'/topic/{STATISTICS_PREFIX}{name[len("topic://"):]}'
+    if name.startswith('queue://'):
+        name = name[len('queue://'):]
+    return STATISTICS_PREFIX + name
+
+
+class StatisticsRequest:
+    """A targeted statistics request and the replies matched to it by correlation-id"""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.correlation_id = f'stats-{uuid.uuid4().hex[:12]}'
+        # A wildcard gets one reply per matching destination; a plain name at most one
+        self.wildcard = '>' in name or '*' in name
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+        self.replies = []
+        self.last_reply_at = None
+        self.max_gap = 0.0
+        # 'complete', 'quiet' (wildcard replies dried up) or 'timeout' once settled
+        self.status = None
+
+
+class Snapshot:
+    """Copy of the statistics known at one moment (what print_results() reads)"""
+
+    def __init__(self, queues, topics, broker, updated, store=None):
+        self.queues = queues
+        self.topics = topics
+        self.broker = broker
+        # Destination name -> monotonic time of its latest reply
+        self.updated = updated
+        # TimeSeriesStore with the samples behind the rates, if any
+        self.store = store
+        self.taken_at = time.monotonic()
+
+
 class StatisticsListener(stomp.ConnectionListener):
-    def __init__(self):
+    def __init__(self, store=None):
         self.queues = {}
         self.topics = {}
+        # Broker-level statistics (ActiveMQ.Statistics.Broker reply)
+        self.broker = {}
+        self.updated = {}
+        self.replies = 0
         self.connected = False
-        self.response_received = False
         self.any_response_received = False
         self.raw_response = None
+        # Replies arrive on the receiver thread while the daemon reads snapshots
+        self._lock = threading.Lock()
+        # Signalled on every reply; see wait_for_round()
+        self._replied = threading.Condition(self._lock)
+        self.round_started = time.monotonic()
+        self.round_replies = 0
+        self.round_destinations = 0
+        self.last_reply_at = None
+        self.max_gap = 0.0
+        # Targeted requests in flight, by correlation-id
+        self.requests = {}
+        # Every destination reply is recorded here (TimeSeriesStore) when set
+        self.store = store
 
     def on_error(self, frame):
-        print(f"\n[ERROR FRAME RECEIVED]")
-        print(f"  Body: {frame.body}")
-        print(f"  Headers: {frame.headers}")
-        print("\n  ^^ This error might indicate:")
-        print("     - Permission denied for Statistics destination")
-        print("     - Statistics plugin not responding")
-        print("     - Invalid destination format")
+        log.error("ERROR frame received (permission denied for Statistics destination, "
+                  "Statistics plugin not responding, or invalid destination format?)",
+                  body=frame.body, headers=frame.headers)
 
     def on_connected(self, frame):
-        print("[INFO] Connected to broker")
+        log.info("Connected to broker")
         self.connected = True
 
     def on_disconnected(self):
-        print("[INFO] Disconnected from broker")
+        log.info("Disconnected from broker")
         self.connected = False
 
     def on_message(self, frame):
@@ -49,57 +146,262 @@ class StatisticsListener(stomp.ConnectionListener):
         Handle MapMessage response from StatisticsBrokerPlugin.
         AWS MQ returns statistics as XML in the message body when transformation: jms-map-xml
         """
-        print("[INFO] Received statistics response")
-        self.response_received = True
+        log.debug("Received statistics response", category='stats')
         self.any_response_received = True
         self.raw_response = frame
 
         try:
             # AWS MQ returns MapMessage as XML when transformation: jms-map-xml
-            if frame.body and '<map>' in frame.body:
-                # Parse XML to extract statistics
-                import xml.etree.ElementTree as ET
-                root = ET.fromstring(frame.body)
-
-                # Extract all map entries into a dict
-                stats = {}
-                destination_name = None
-
-                # Each entry has: <string>key</string><type>value</type>
-                # where type can be: string, long, int, double, etc.
-                for entry in root.findall('.//entry'):
-                    children = list(entry)
-                    if len(children) >= 2:
-                        key_elem = children[0]
-                        value_elem = children[1]
-
-                        if key_elem.tag == 'string' and key_elem.text:
-                            key_name = key_elem.text
-                            value = value_elem.text if value_elem.text is not None else ''
-                            stats[key_name] = value
-
-                            # Extract destination name
-                            if key_name == 'destinationName':
-                                destination_name = value
-
-                # If this response has a destinationName, it's a specific queue/topic
-                if destination_name:
-                    # Parse destination name: "queue://queue1" or "topic://topicName"
-                    if destination_name.startswith('queue://'):
-                        queue_name = destination_name.replace('queue://', '')
-                        self.queues[queue_name] = stats
-                        print(f"  -> Found queue: {queue_name} with {len(stats)} metrics")
-                    elif destination_name.startswith('topic://'):
-                        topic_name = destination_name.replace('topic://', '')
-                        self.topics[topic_name] = stats
-                        print(f"  -> Found topic: {topic_name} with {len(stats)} metrics")
+            stats = parse_destination_stats(frame.body)
+            broker = parse_map(frame.body) if stats is None else None
+            found = False
+            with self._lock:
+                if stats is not None:
+                    self.round_destinations += 1
+                    if stats.kind == 'queue':
+                        found = stats.name not in self.queues
+                        self.queues[stats.name] = stats
+                        self.updated[(stats.kind, stats.name)] = time.monotonic()
+                    elif stats.kind == 'topic':
+                        found = stats.name not in self.topics
+                        self.topics[stats.name] = stats
+                        self.updated[(stats.kind, stats.name)] = time.monotonic()
+                elif broker:
+                    self.broker = broker
+                request = self.requests.get(frame.headers.get('correlation-id'))
+                if request is not None:
+                    self._request_reply_locked(request, stats)
+                self._reply_locked()
+            if stats is not None and self.store is not None and stats.kind in ('queue', 'topic'):
+                self.store.record(stats.kind, stats.name, stats)
+            if found:
+                log.info(f"Found {stats.kind}: {stats.name}", category='discovery', metrics=len(stats.keys()))
 
         except Exception as e:
-            print(f"[WARN] Error processing statistics response: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception(f"Error processing statistics response: {e}")
+
+    def _reply_locked(self):
+        now = time.monotonic()
+        self.max_gap = max(self.max_gap, now - (self.last_reply_at or self.round_started))
+        self.last_reply_at = now
+        self.replies += 1
+        self.round_replies += 1
+        self._replied.notify_all()
+
+    def _request_reply_locked(self, request, stats):
+        now = time.monotonic()
+        if stats is None:
+            # A reply without a destination closes the request (no match)
+            request.status = 'complete'
+            return
+        request.max_gap = max(request.max_gap, now - (request.last_reply_at or request.sent_at))
+        request.last_reply_at = now
+        request.replies.append(stats)
+        if not request.wildcard:
+            request.status = 'complete'
+
+    def expect(self, name, timeout=MONITOR_QUERY_TIMEOUT_SECONDS):
+        """Register a targeted request before it is sent, so its replies cannot arrive first"""
+        request = StatisticsRequest(name, timeout)
+        with self._lock:
+            self.requests[request.correlation_id] = request
+        return request
+
+    def wait_for_requests(self, requests):
+        """
+        Block until every request has settled: a plain name once it has its
+        reply, a wildcard once its replies stop for the quiet period, and any
+        request at its own deadline. Returns the requests.
+        """
+        with self._replied:
+            while True:
+                now = time.monotonic()
+                wake = None
+                for request in requests:
+                    if request.status:
+                        continue
+                    if now >= request.deadline:
+                        request.status = 'timeout'
+                        continue
+                    check = request.deadline
+                    if request.wildcard and request.replies:
+                        quiet_until = request.last_reply_at + quiet_period(request.max_gap)
+                        if now >= quiet_until:
+                            request.status = 'quiet'
+                            continue
+                        check = min(check, quiet_until)
+                    wake = check if wake is None else min(wake, check)
+                if wake is None:
+                    break
+                self._replied.wait(wake - now)
+            for request in requests:
+                self.requests.pop(request.correlation_id, None)
+        return requests
+
+    def begin_round(self):
+        """Start counting replies for a request about to be sent"""
+        with self._lock:
+            self.round_started = time.monotonic()
+            self.round_replies = self.round_destinations = 0
+            self.last_reply_at = None
+            self.max_gap = 0.0
+
+    def wait_for_round(self, expected=None, timeout=MONITOR_REPLY_TIMEOUT_SECONDS):
+        """
+        Block until the replies since begin_round() look complete.
 
-def discover_destinations():
+        Returns 'expected' once `expected` destinations have replied, 'quiet'
+        when replies stopped for the adaptive quiet period, or 'timeout'. The
+        wait wakes on every reply rather than polling.
+        """
+        with self._replied:
+            deadline = self.round_started + timeout
+            while True:
+                now = time.monotonic()
+                if expected and self.round_destinations >= expected:
+                    return 'expected'
+                if now >= deadline:
+                    return 'timeout'
+                wake = deadline
+                if self.round_replies:
+                    quiet = quiet_period(self.max_gap)
+                    if now >= self.last_reply_at + quiet:
+                        return 'quiet'
+                    wake = min(wake, self.last_reply_at + quiet)
+                self._replied.wait(wake - now)
+
+    def snapshot(self):
+        with self._lock:
+            return Snapshot(dict(self.queues), dict(self.topics), dict(self.broker), dict(self.updated), self.store)
+
+    def prune(self, max_age):
+        """Forget destinations whose latest reply is older than `max_age` seconds; returns how many"""
+        cutoff = time.monotonic() - max_age
+        with self._lock:
+            stale = [key for key, updated in self.updated.items() if updated < cutoff]
+            for kind, name in stale:
+                del self.updated[(kind, name)]
+                (self.queues if kind == 'queue' else self.topics).pop(name, None)
+        for kind, name in stale:
+            log.info(f"Dropped {kind}: {name} (no statistics for {max_age:g}s)", category='discovery')
+        return len(stale)
+
+
+def send_queries(conn, listener, reply_queue, names, timeout=MONITOR_QUERY_TIMEOUT_SECONDS):
+    """Send a targeted statistics request per name, all at once; returns the StatisticsRequests to wait for"""
+    requests = []
+    for name in names:
+        request = listener.expect(name, timeout)
+        conn.send(body='', destination=statistics_destination(name),
+                  headers={'reply-to': reply_queue, 'correlation-id': request.correlation_id})
+        requests.append(request)
+    return requests
+
+
+def log_queries(requests):
+    for request in requests:
+        if request.status == 'timeout' and not request.replies:
+            log.warning(f"No statistics for {request.name} within {request.deadline - request.sent_at:g}s "
+                        f"(no such destination, or no reply)", category='discovery')
+    answered = [r for r in requests if r.replies]
+    log.info(f"{len(answered)}/{len(requests)} targeted requests answered", category='discovery',
+             destinations=sum(len(r.replies) for r in requests),
+             slowest_ms=round(max((r.last_reply_at - r.sent_at for r in answered), default=0) * 1000, 1))
+
+
+class StatisticsMonitor:
+    """
+    Daemon mode: one connection and one reply subscription, kept open.
+
+    Every `interval` seconds the statistics requests are sent again on the same
+    connection, and each reply updates the listener as it arrives, so
+    `snapshot()` is never much older than one interval. The TLS handshake and
+    reply-queue setup are paid once, and again only after the connection drops.
+
+    With `targets`, each round asks for those destinations only (see
+    send_queries) instead of every destination on the broker.
+    """
+
+    def __init__(self, interval, stale_intervals=3, report_every=0, targets=(), store=None):
+        self.interval = interval
+        self.stale_after = interval * max(1, stale_intervals)
+        self.report_every = report_every
+        self.targets = list(targets)
+        self.requests = (STATISTICS_BROKER,) if self.targets else (STATISTICS_WILDCARD, STATISTICS_BROKER)
+        self.pending = []
+        self.listener = StatisticsListener(store)
+        self.conn = None
+        self.reply_queue = None
+        self.cycles = 0
+        self._stop = threading.Event()
+
+    def _connect(self):
+        conn = stomp.Connection(BROKER_HOSTS, heartbeats=(10000, 10000))
+        if USE_SSL:
+            conn.set_ssl(for_hosts=BROKER_HOSTS, ssl_version=ssl.PROTOCOL_TLS)
+        conn.set_listener('statistics', self.listener)
+        started = time.monotonic()
+        conn.connect(USER, PASSWORD, wait=True, headers={'heart-beat': '10000,10000'})
+        self.reply_queue = f'/temp-queue/stats.reply.{uuid.uuid4().hex[:8]}'
+        conn.subscribe(destination=self.reply_queue, id=1, ack='auto')
+        self.conn = conn
+        log.info(f"Connected in {time.monotonic() - started:.3f}s, replies on {self.reply_queue}")
+
+    def poll(self):
+        """Send one round of statistics requests, reconnecting first if the connection is gone"""
+        if self.conn is None or not self.conn.is_connected():
+            self._connect()
+        self.listener.begin_round()
+        if self.targets:
+            self.pending = send_queries(self.conn, self.listener, self.reply_queue, self.targets,
+                                        min(MONITOR_QUERY_TIMEOUT_SECONDS, self.interval))
+        for destination in self.requests:
+            self.conn.send(body='', destination=destination, headers={'reply-to': self.reply_queue})
+
+    def snapshot(self):
+        return self.listener.snapshot()
+
+    def run(self):
+        log.info(f"Monitoring every {self.interval:g}s", brokers=', '.join(f"{h}:{p}" for h, p in BROKER_HOSTS))
+        # Destinations in the last complete round: a round is over once they have all replied again
+        expected = None
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                log.warning(f"Statistics request failed, retrying in {self.interval:g}s: {e or type(e).__name__}")
+                self.conn = None
+                self._stop.wait(self.interval)
+                continue
+            if self.targets:
+                requests = self.listener.wait_for_requests(self.pending)
+                status = 'timeout' if any(r.status == 'timeout' and not r.replies for r in requests) else 'complete'
+            else:
+                status = self.listener.wait_for_round(expected, timeout=self.interval)
+            round_seconds = time.monotonic() - started
+            if status != 'timeout':
+                expected = self.listener.round_destinations
+            self.cycles += 1
+
+            self.listener.prune(self.stale_after)
+            snapshot = self.snapshot()
+            log.info(f"{len(snapshot.queues)} queues, {len(snapshot.topics)} topics", category='snapshot',
+                     replies=self.listener.round_replies, complete=status, round_ms=round(round_seconds * 1000, 1),
+                     pending=sum(s.size or 0 for name, s in snapshot.queues.items() if not name.startswith('ActiveMQ.')),
+                     growing=len(growing_queues(snapshot)))
+            if self.report_every and self.cycles % self.report_every == 0:
+                flush_logs()
+                print_results(snapshot)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        if self.conn is not None and self.conn.is_connected():
+            self.conn.disconnect()
+
+    def stop(self):
+        self._stop.set()
+
+
+def discover_destinations(store=None):
     """
     Discover all queues and topics using StatisticsBrokerPlugin request/response pattern.
 
@@ -110,12 +412,9 @@ def discover_destinations():
     4. Parse the MapMessage (data is in headers, not body)
     """
     broker_list = ', '.join([f"{h}:{p}" for h, p in BROKER_HOSTS])
-    print(f"\n[INFO] Starting destination discovery (SSL: {USE_SSL})")
-    print(f"[INFO] Broker(s): {broker_list}")
-    print(f"[INFO] Using credentials for user: {USER}")
-    print("=" * 80)
+    log.info(f"Starting destination discovery (SSL: {USE_SSL})", brokers=broker_list, user=USER)
 
-    listener = StatisticsListener()
+    listener = StatisticsListener(store)
     conn = stomp.Connection(BROKER_HOSTS, heartbeats=(10000, 10000))
 
     if USE_SSL:
@@ -124,17 +423,17 @@ def discover_destinations():
     conn.set_listener('statistics', listener)
 
     try:
-        print("[INFO] Connecting to broker...")
+        log.info("Connecting to broker...")
         conn.connect(USER, PASSWORD, wait=True, headers={'heart-beat': '10000,10000'})
 
         # Create unique reply queue for this session
         reply_queue = f'/temp-queue/stats.reply.{uuid.uuid4().hex[:8]}'
-        print(f"[INFO] Created reply queue: {reply_queue}")
+        log.info(f"Created reply queue: {reply_queue}")
 
         # Subscribe to reply queue FIRST (before sending request)
-        print(f"[INFO] Subscribing to reply queue...")
+        log.debug("Subscribing to reply queue...")
         conn.subscribe(destination=reply_queue, id=1, ack='auto')
-        print("[INFO] Subscribed to reply queue")
+        log.info("Subscribed to reply queue")
 
         # Send request to StatisticsBrokerPlugin
         # Request destination can be:
@@ -142,6 +441,11 @@ def discover_destinations():
         # - ActiveMQ.Statistics.Destination.<queue-name> (for specific destination)
         # - ActiveMQ.Statistics.Destination.> (wildcard for all destinations?)
 
+        if MONITOR_DESTINATIONS:
+            log.info(f"Querying {len(MONITOR_DESTINATIONS)} destination(s)", targets=', '.join(MONITOR_DESTINATIONS))
+            log_queries(listener.wait_for_requests(send_queries(conn, listener, reply_queue, MONITOR_DESTINATIONS)))
+            return listener
+
         # Try multiple statistics destinations
         statistics_destinations = [
             'ActiveMQ.Statistics.Destination.>',  # Wildcard - try this first
@@ -149,78 +453,89 @@ def discover_destinations():
         ]
 
         for idx, statistics_destination in enumerate(statistics_destinations, start=1):
-            print(f"\n[INFO] Attempt {idx}/{len(statistics_destinations)}")
-            print(f"[INFO] Sending statistics request to: {statistics_destination}")
-            print(f"[INFO] Reply-to: {reply_queue}")
+            log.info(f"Attempt {idx}/{len(statistics_destinations)}: sending statistics request to {statistics_destination}",
+                     reply_to=reply_queue)
 
-            # Reset response flag for each attempt
-            listener.response_received = False
             listener.raw_response = None
-
+            listener.begin_round()
             try:
                 conn.send(
                     body='',  # Empty body
                     destination=statistics_destination,
                     headers={'reply-to': reply_queue}
                 )
-                print("[SUCCESS] Request sent successfully")
+                log.info("Request sent successfully")
             except Exception as send_error:
-                print(f"[ERROR] Failed to send statistics request: {send_error}")
-                print("  This likely means:")
-                print("    - User doesn't have permission to write to Statistics destinations")
-                print("    - Statistics destination doesn't exist/isn't accessible")
+                log.error(f"Failed to send statistics request: {send_error} (no permission to write to "
+                          "Statistics destinations, or the destination isn't accessible?)")
                 continue  # Try next destination instead of failing
 
-            print("[INFO] Waiting for responses (may receive multiple)...")
-
-            # Wait for all responses - since wildcard returns one message per destination
-            # We'll wait longer and check for a pause in messages
-            timeout = 15
-            last_response_time = time.time()
-
-            for i in range(timeout, 0, -1):
-                if listener.response_received:
-                    # Reset timer when we receive a message
-                    last_response_time = time.time()
-                    listener.response_received = False  # Reset to detect next message
-
-                # If no response for 3 seconds after last one, we're probably done
-                if listener.queues or listener.topics:
-                    time_since_last = time.time() - last_response_time
-                    if time_since_last > 3:
-                        print(f"\n[INFO] No more responses for 3 seconds, assuming complete")
-                        break
-
-                print(f"[INFO] Waiting... {i}s remaining (Queues: {len(listener.queues)}, Topics: {len(listener.topics)})", end='\r')
-                time.sleep(1)
-
-            print("\n")
+            # The wildcard returns one reply per destination; wake on each and stop once they dry up
+            status = listener.wait_for_round()
+            log.info(f"Replies {'timed out' if status == 'timeout' else 'complete'} after "
+                     f"{time.monotonic() - listener.round_started:.3f}s", category='discovery',
+                     replies=listener.round_replies, destinations=listener.round_destinations)
 
             # If we got a response with queue/topic data, stop trying other destinations
             if listener.queues or listener.topics:
-                print(f"[SUCCESS] Found {len(listener.queues)} queues and {len(listener.topics)} topics using: {statistics_destination}")
+                log.info(f"Found {len(listener.queues)} queues and {len(listener.topics)} topics using: {statistics_destination}")
                 break
             else:
-                print(f"[WARN] No destination statistics found. Trying next destination...")
+                log.warning("No destination statistics found. Trying next destination...")
 
         if not listener.any_response_received:
-            print("[WARN] No response received within timeout period")
-            print("\nTroubleshooting:")
-            print("  1. Verify StatisticsBrokerPlugin is enabled in broker configuration")
-            print("  2. Check user permissions for ActiveMQ.Statistics.* destinations")
-            print("  3. Ensure broker is accessible and responsive")
+            log.warning("No response received within timeout period. Verify StatisticsBrokerPlugin is enabled, "
+                        "the user may use ActiveMQ.Statistics.* destinations, and the broker is reachable")
 
         return listener
 
     except Exception as e:
-        print(f"[ERROR] Connection failed: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"Connection failed: {e}")
         return None
     finally:
         if conn.is_connected():
             conn.disconnect()
 
+def growing_queues(snapshot, window=MONITOR_RATE_WINDOW_SECONDS):
+    """Names of the queues whose backlog grew over the last `window` seconds (consumers not keeping up)"""
+    if snapshot.store is None:
+        return []
+    growing = []
+    for name in snapshot.queues:
+        rates = snapshot.store.rates('queue', name, window)
+        if rates and rates['backlog_growth'] and rates['backlog_growth'] > 0:
+            growing.append(name)
+    return growing
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+
+def print_rates(store, kind, name, width):
+    """Rate lines for one destination from the store's samples over MONITOR_RATE_WINDOW_SECONDS"""
+    rates = store.rates(kind, name, MONITOR_RATE_WINDOW_SECONDS)
+    if rates is None:
+        print(f"  {'Rates':.<{width}} (need two samples within {MONITOR_RATE_WINDOW_SECONDS:g}s)")
+        return
+    over = f"over {format_duration(rates['window_seconds'])}, {rates['samples']} samples"
+    for key, label in (('enqueue_rate', 'Enqueue Rate (msg/s)'), ('dequeue_rate', 'Dequeue Rate (msg/s)')):
+        if rates[key] is not None:
+            print(f"  {label:.<{width}} {rates[key]:.2f}  ({over})")
+    if kind != 'queue' or rates['backlog_growth'] is None:
+        return
+    print(f"  {'Backlog Growth (msg/s)':.<{width}} {rates['backlog_growth']:+.2f}")
+    if rates['drain_seconds'] is not None:
+        drain = 'empty' if rates['drain_seconds'] == 0 else format_duration(rates['drain_seconds'])
+    else:
+        drain = 'not draining (consumers behind)'
+    print(f"  {'Estimated Drain Time':.<{width}} {drain}")
+
+
 def print_results(listener):
     """Print discovered queues and topics in a formatted way"""
     print("\n" + "=" * 80)
@@ -253,6 +568,9 @@ def print_results(listener):
                         print(f"  {label:.<35} {stats[key]}")
                         found_any = True
 
+                if found_any and listener.store is not None:
+                    print_rates(listener.store, 'queue', queue_name, 35)
+
                 if not found_any:
                     # No standard metrics found, print all stats
                     print(f"  [Available metrics: {', '.join(stats.keys())}]")
@@ -288,6 +606,9 @@ def print_results(listener):
                     if key in stats:
                         print(f"  {label:.<40} {stats[key]}")
 
+                if listener.store is not None:
+                    print_rates(listener.store, 'topic', topic_name, 40)
+
                 # Print any additional metrics not in key_metrics
                 printed_keys = {k for k, _ in key_metrics}
                 other_stats = {k: v for k, v in stats.items() if k not in printed_keys and k not in ['destinationName', 'brokerId', 'brokerName']}
@@ -310,12 +631,31 @@ def print_results(listener):
     print("\n" + "=" * 80 + "\n")
 
 def main():
+    store = TimeSeriesStore(MONITOR_HISTORY_SAMPLES, MONITOR_HISTORY_DIR or None)
+    try:
+        run(store)
+    finally:
+        store.close()
+
+
+def run(store):
+    if MONITOR_INTERVAL_SECONDS > 0:
+        monitor = StatisticsMonitor(MONITOR_INTERVAL_SECONDS, MONITOR_STALE_INTERVALS, MONITOR_REPORT_EVERY,
+                                    MONITOR_DESTINATIONS, store)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: monitor.stop())
+        monitor.run()
+        flush_logs()
+        return
+
     print("\n" + "=" * 80)
     print("AWS MQ / ActiveMQ Queue Discovery Tool")
     print("(Using StatisticsBrokerPlugin Request/Response Pattern)")
     print("=" * 80)
 
-    listener = discover_destinations()
+    listener = discover_destinations(store)
+    # The report goes straight to stdout; let queued log lines land first
+    flush_logs()
 
     if listener:
         print_results(listener)
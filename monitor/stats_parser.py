@@ -0,0 +1,141 @@
+"""
+Fast parsing of StatisticsBrokerPlugin replies (jms-map-xml MapMessage bodies).
+
+    <map>
+      <entry>
+        <string>size</string>
+        <long>42</long>
+      </entry>
+      ...
+    </map>
+
+A single regular expression scans the body entry by entry, without building an
+element tree. Only the metrics in METRICS are kept, converted to native numbers
+and stored in a `DestinationStats` record with `__slots__`, so thousands of
+destinations cost a few hundred bytes each instead of a dict of strings.
+"""
+import re
+import sys
+from xml.sax.saxutils import unescape
+
+# Per-destination metrics kept from a reply; anything else in the map is skipped
+METRICS = (
+    'size', 'enqueueCount', 'dequeueCount', 'dispatchCount', 'inflightCount', 'expiredCount',
+    'consumerCount', 'producerCount', 'messagesCached',
+    'averageEnqueueTime', 'minEnqueueTime', 'maxEnqueueTime',
+    'averageMessageSize', 'minMessageSize', 'maxMessageSize',
+    'memoryUsage', 'memoryLimit', 'memoryPercentUsage',
+)
+
+_ENTRY = re.compile(r'<entry>\s*<string>([^<]*)</string>\s*<([a-z]+)>([^<]*)</[a-z]+>\s*</entry>')
+
+_CONVERT = {'long': int, 'int': int, 'short': int, 'byte': int, 'double': float, 'float': float,
+            'boolean': lambda text: text == 'true'}
+
+# Key name -> record slot; keys are interned so every record shares one copy
+_SLOTS = {sys.intern(name): sys.intern(name) for name in METRICS}
+_SLOTS['destinationName'] = 'destinationName'
+
+_KINDS = (('queue://', 'queue'), ('topic://', 'topic'), ('temp-queue://', 'temp-queue'), ('temp-topic://', 'temp-topic'))
+
+
+class DestinationStats:
+    """
+    Statistics of one destination.
+
+    Metrics the broker did not report are None. The record also reads like a
+    mapping of the reported metrics (`'size' in stats`, `stats['size']`,
+    `stats.items()`).
+    """
+
+    __slots__ = ('kind', 'name') + METRICS
+
+    def __init__(self, kind=None, name=None, **metrics):
+        self.kind = kind
+        self.name = name
+        for metric in METRICS:
+            setattr(self, metric, metrics.get(metric))
+
+    def keys(self):
+        return [m for m in METRICS if getattr(self, m) is not None]
+
+    def items(self):
+        return [(m, getattr(self, m)) for m in METRICS if getattr(self, m) is not None]
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in _SLOTS else None
+        return default if value is None else value
+
+    def as_dict(self):
+        return dict(self.items())
+
+    def __contains__(self, key):
+        return key in _SLOTS and getattr(self, key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __repr__(self):
+        return f"DestinationStats({self.kind}://{self.name}, size={self.size}, enqueueCount={self.enqueueCount}, dequeueCount={self.dequeueCount})"
+
+
+def split_destination(name):
+    """('queue', 'orders') from 'queue://orders'; (None, name) if it has no known prefix"""
+    for prefix, kind in _KINDS:
+        if name.startswith(prefix):
+            return kind, sys.intern(name[len(prefix):])
+    return None, sys.intern(name)
+
+
+def parse_map(body, keys=None):
+    """
+    Entries of a jms-map-xml body as {key: value} with numbers converted.
+
+    Only `keys` are kept when given (all entries otherwise). Bodies that are not
+    a map give an empty dict.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    values = {}
+    if not body or '<map' not in body:
+        return values
+    for key, tag, text in _ENTRY.findall(body):
+        if keys is not None and key not in keys:
+            continue
+        values[sys.intern(key)] = _value(tag, text)
+    return values
+
+
+def _value(tag, text):
+    convert = _CONVERT.get(tag)
+    if convert is None:
+        return unescape(text) if '&' in text else text
+    try:
+        return convert(text)
+    except ValueError:
+        return text
+
+
+def parse_destination_stats(body):
+    """DestinationStats from a reply body; None for non-map bodies and broker-level replies"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    if not body or '<map' not in body:
+        return None
+    record = DestinationStats()
+    name = None
+    for key, tag, text in _ENTRY.findall(body):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            continue
+        if slot == 'destinationName':
+            name = unescape(text) if '&' in text else text
+        else:
+            setattr(record, slot, _value(tag, text))
+    if name is None:
+        return None
+    record.kind, record.name = split_destination(name)
+    return record
@@ -0,0 +1,164 @@
+"""
+Microbenchmark of the statistics reply parsers.
+
+Parses the same synthetic ActiveMQ replies (jms-map-xml, one per destination)
+with:
+
+- etree:    the ElementTree walk StatisticsListener used before stats_parser
+- backup:   the variant in backup/request_based_queue_discovery.py (its
+            `./*[2]` lookup only matches string values, so it keeps just the
+            three string entries and no metrics - see the `kept` column)
+- streaming: stats_parser.parse_destination_stats
+
+and reports the time per reply, the entries kept per destination and the
+memory held by the parsed results.
+
+    python stats_parser_bench.py --destinations 5000 --repeat 5
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from stats_parser import parse_destination_stats
+
+
+def reply_body(index):
+    """A destination reply shaped like ActiveMQ's (same keys, types and layout)"""
+    entries = [
+        ('brokerName', 'string', 'b-1234abcd-1.mq.eu-west-1.amazonaws.com'),
+        ('brokerId', 'string', 'ID:b-1234abcd-1-36467-1700000000000-0:1'),
+        ('destinationName', 'string', f'queue://orders.region{index % 50}.shard{index}'),
+        ('size', 'long', str(index % 1000)),
+        ('enqueueCount', 'long', str(index * 131)),
+        ('dequeueCount', 'long', str(index * 127)),
+        ('dispatchCount', 'long', str(index * 128)),
+        ('expiredCount', 'long', '0'),
+        ('inflightCount', 'long', str(index % 20)),
+        ('messagesCached', 'long', str(index % 100)),
+        ('consumerCount', 'long', str(index % 4)),
+        ('producerCount', 'long', str(index % 3)),
+        ('averageEnqueueTime', 'double', f'{index * 0.37:.3f}'),
+        ('minEnqueueTime', 'long', '0'),
+        ('maxEnqueueTime', 'long', str(index * 3)),
+        ('averageMessageSize', 'long', '1024'),
+        ('minMessageSize', 'long', '512'),
+        ('maxMessageSize', 'long', '4096'),
+        ('memoryUsage', 'long', str(index * 1024)),
+        ('memoryLimit', 'long', '1048576'),
+        ('memoryPercentUsage', 'int', '0'),
+    ]
+    parts = ['<map>']
+    for key, tag, text in entries:
+        parts.append(f'\n  <entry>\n    <string>{key}</string>\n    <{tag}>{text}</{tag}>\n  </entry>')
+    parts.append('\n</map>')
+    return ''.join(parts)
+
+
+def parse_etree(body):
+    # StatisticsListener.on_message before stats_parser
+    if body and '<map>' in body:
+        root = ET.fromstring(body)
+        stats = {}
+        destination_name = None
+        for entry in root.findall('.//entry'):
+            children = list(entry)
+            if len(children) >= 2:
+                key_elem = children[0]
+                value_elem = children[1]
+                if key_elem.tag == 'string' and key_elem.text:
+                    key_name = key_elem.text
+                    value = value_elem.text if value_elem.text is not None else ''
+                    stats[key_name] = value
+                    if key_name == 'destinationName':
+                        destination_name = value
+        if destination_name and destination_name.startswith('queue://'):
+            return destination_name.replace('queue://', ''), stats
+    return None
+
+
+def parse_backup(body):
+    # backup/request_based_queue_discovery.py StatisticsListener.on_message
+    if body and '<map>' in body:
+        root = ET.fromstring(body)
+        stats = {}
+        destination_name = None
+        for entry in root.findall('.//entry'):
+            key = entry.find('string')
+            value_elem = entry.find('./*[2]')
+            if key is not None and value_elem is not None:
+                key_name = key.text
+                value = value_elem.text
+                stats[key_name] = value
+                if key_name == 'destinationName':
+                    destination_name = value
+        if destination_name and destination_name.startswith('queue://'):
+            return destination_name.replace('queue://', ''), stats
+    return None
+
+
+def parse_streaming(body):
+    stats = parse_destination_stats(body)
+    return (stats.name, stats) if stats is not None else None
+
+
+PARSERS = {'etree': parse_etree, 'backup': parse_backup, 'streaming': parse_streaming}
+
+
+def run(name, parse, bodies, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for body in bodies:
+            parse(body)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory held by one full discovery's results
+    tracemalloc.start()
+    results = {}
+    for body in bodies:
+        name_and_stats = parse(body)
+        if name_and_stats is not None:
+            results[name_and_stats[0]] = name_and_stats[1]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+
+    return {
+        'parser': name,
+        'replies': len(bodies),
+        'us_per_reply': round(best / len(bodies) * 1e6, 2),
+        'kept': len(parse(bodies[1])[1].keys()),
+        'replies_per_sec': round(len(bodies) / best),
+        'bytes_per_destination': round(held / len(bodies)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statistics reply parser microbenchmark')
+    parser.add_argument('--destinations', type=int, default=5000, help='replies to parse per run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per parser (best one is reported)')
+    parser.add_argument('--parser', action='append', choices=sorted(PARSERS), help='parsers to run (default: all)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    bodies = [reply_body(i) for i in range(args.destinations)]
+    # The parsers must agree before their speed means anything
+    reference = parse_etree(bodies[1])[1]
+    streamed = parse_streaming(bodies[1])[1]
+    assert streamed['size'] == int(reference['size']) and streamed['averageEnqueueTime'] == float(reference['averageEnqueueTime'])
+
+    results = [run(name, PARSERS[name], bodies, args.repeat) for name in (args.parser or PARSERS)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'parser':<12}{'us/reply':>10}{'replies/s':>12}{'kept':>6}{'bytes/dest':>12}")
+    for r in results:
+        print(f"{r['parser']:<12}{r['us_per_reply']:>10}{r['replies_per_sec']:>12}{r['kept']:>6}{r['bytes_per_destination']:>12}")
+
+
+if __name__ == '__main__':
+    main()
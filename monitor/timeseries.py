@@ -0,0 +1,291 @@
+"""
+Time series of destination statistics, with rates derived over sliding windows.
+
+Every statistics reply becomes one sample: the wall-clock time and the values
+of FIELDS. Each destination keeps its latest `capacity` samples in a ring of
+typed arrays (one column per field), so memory is fixed no matter how long the
+monitor runs.
+
+With a directory, every sample is also appended to columnar files there:
+
+    destinations.txt   one "kind://name" per line; the line number is the destination id
+    time.f64           sample times (seconds since the epoch; 0 marks unused space)
+    destination.u32    destination id of each sample
+    <field>.f64        one file per field, NaN where the broker did not report it
+
+The column files are memory-mapped and grown in CHUNK_ROWS steps, and
+reopening the directory reloads the newest samples into the rings, so rates
+survive restarts and are available to one-shot runs.
+"""
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
+
+FIELDS = ('size', 'enqueueCount', 'dequeueCount', 'consumerCount', 'producerCount',
+          'inflightCount', 'dispatchCount', 'expiredCount')
+# Cumulative counters: a drop means the broker restarted
+COUNTERS = ('enqueueCount', 'dequeueCount', 'dispatchCount', 'expiredCount')
+
+CHUNK_ROWS = 65536
+
+
+class SeriesRing:
+    """The latest `capacity` samples of one destination"""
+
+    def __init__(self, capacity, fields=FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.times = array('d', bytes(8 * capacity))
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in fields}
+        # Index of the oldest sample, and how many are held
+        self.start = 0
+        self.count = 0
+
+    def append(self, t, values):
+        i = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.times[i] = t
+        for field in self.fields:
+            value = values.get(field)
+            self.columns[field][i] = math.nan if value is None else value
+
+    def _index(self, n):
+        return (self.start + n) % self.capacity
+
+    def latest(self):
+        """{'time': t, field: value} of the newest sample, None if empty"""
+        if not self.count:
+            return None
+        i = self._index(self.count - 1)
+        return dict({'time': self.times[i]}, **{f: self.columns[f][i] for f in self.fields})
+
+    def window(self, seconds, now=None):
+        """Ring indices of the samples no older than `seconds`, oldest first"""
+        if not self.count:
+            return []
+        newest = self.times[self._index(self.count - 1)]
+        cutoff = (now if now is not None else newest) - seconds
+        # Walk back from the newest sample so the cost follows the window, not the capacity
+        indices = []
+        for n in range(self.count - 1, -1, -1):
+            i = self._index(n)
+            if self.times[i] < cutoff:
+                break
+            indices.append(i)
+        indices.reverse()
+        return indices
+
+    def rates(self, seconds, now=None):
+        """
+        What the last `seconds` of samples say about this destination, or None
+        with fewer than two samples:
+
+        - enqueue_rate / dequeue_rate: messages per second in and out
+        - backlog_growth: change of `size` per second (negative while draining)
+        - drain_seconds: time to empty the backlog at the current net rate;
+          0 when empty, None when it is not shrinking
+        """
+        indices = self.window(seconds, now)
+        # Counters restart from zero with the broker: only use samples since the last reset
+        for n in range(len(indices) - 1, 0, -1):
+            if any(self.columns[c][indices[n]] < self.columns[c][indices[n - 1]] for c in COUNTERS if c in self.columns):
+                indices = indices[n:]
+                break
+        if len(indices) < 2:
+            return None
+        first, last = indices[0], indices[-1]
+        elapsed = self.times[last] - self.times[first]
+        if elapsed <= 0:
+            return None
+
+        def per_second(field):
+            column = self.columns.get(field)
+            if column is None or math.isnan(column[first]) or math.isnan(column[last]):
+                return None
+            return (column[last] - column[first]) / elapsed
+
+        enqueue_rate, dequeue_rate, growth = per_second('enqueueCount'), per_second('dequeueCount'), per_second('size')
+        size = self.columns['size'][last] if 'size' in self.columns else math.nan
+        if math.isnan(size):
+            drain = None
+        elif size == 0:
+            drain = 0.0
+        else:
+            # Prefer the net of the two rates; fall back to the observed backlog trend
+            net = dequeue_rate - enqueue_rate if enqueue_rate is not None and dequeue_rate is not None else None
+            if net is None and growth is not None:
+                net = -growth
+            drain = size / net if net and net > 0 else None
+        return {
+            'window_seconds': round(elapsed, 3),
+            'samples': len(indices),
+            'size': None if math.isnan(size) else size,
+            'enqueue_rate': enqueue_rate,
+            'dequeue_rate': dequeue_rate,
+            'backlog_growth': growth,
+            'drain_seconds': drain,
+        }
+
+
+class _Column:
+    """One memory-mapped, append-only column file"""
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        self.file = open(path, 'a+b')
+        self.map = None
+        self.view = None
+        size = os.fstat(self.file.fileno()).st_size
+        self._map(max(size // self.itemsize, CHUNK_ROWS))
+
+    def _map(self, rows):
+        self.release()
+        if os.fstat(self.file.fileno()).st_size < rows * self.itemsize:
+            self.file.truncate(rows * self.itemsize)
+        self.map = mmap.mmap(self.file.fileno(), rows * self.itemsize)
+        self.view = memoryview(self.map).cast(self.typecode)
+
+    @property
+    def rows(self):
+        return len(self.view)
+
+    def ensure(self, rows):
+        if rows > self.rows:
+            self._map(self.rows + max(CHUNK_ROWS, rows - self.rows))
+
+    def release(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+        self.release()
+        self.file.close()
+
+
+class ColumnStore:
+    """Append-only columnar sample files in `directory` (see the module docstring)"""
+
+    def __init__(self, directory, fields=FIELDS):
+        os.makedirs(directory, exist_ok=True)
+        self.fields = fields
+        self.times = _Column(os.path.join(directory, 'time.f64'), 'd')
+        self.destination_ids = _Column(os.path.join(directory, 'destination.u32'), 'I')
+        self.columns = {field: _Column(os.path.join(directory, f'{field}.f64'), 'd') for field in fields}
+        self.names_path = os.path.join(directory, 'destinations.txt')
+        self.names = []
+        if os.path.exists(self.names_path):
+            with open(self.names_path, encoding='utf-8') as f:
+                self.names = [line.rstrip('\n') for line in f]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self._names_file = open(self.names_path, 'a', encoding='utf-8')
+        self.rows = self._used_rows()
+
+    def _used_rows(self):
+        # Rows are written in time order and unused space reads as 0.0: binary search for the first empty row
+        low, high = 0, self.times.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.times.view[middle] > 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def destination_id(self, key):
+        destination_id = self.ids.get(key)
+        if destination_id is None:
+            destination_id = self.ids[key] = len(self.names)
+            self.names.append(key)
+            self._names_file.write(key + '\n')
+            self._names_file.flush()
+        return destination_id
+
+    def append(self, key, t, values):
+        row = self.rows
+        for column in (self.times, self.destination_ids, *self.columns.values()):
+            column.ensure(row + 1)
+        self.destination_ids.view[row] = self.destination_id(key)
+        for field, column in self.columns.items():
+            value = values.get(field)
+            column.view[row] = math.nan if value is None else value
+        # Time last: a row only counts as written once it has one
+        self.times.view[row] = t
+        self.rows = row + 1
+
+    def tail(self, rows):
+        """(key, time, {field: value}) of the newest `rows` samples, oldest first"""
+        for row in range(max(0, self.rows - rows), self.rows):
+            values = {field: column.view[row] for field, column in self.columns.items()}
+            yield self.names[self.destination_ids.view[row]], self.times.view[row], values
+
+    def close(self):
+        for column in (self.times, self.destination_ids, *self.columns.values()):
+            column.close()
+        self._names_file.close()
+
+
+class TimeSeriesStore:
+    """
+    Samples of every destination: rings in memory, optionally persisted to a
+    ColumnStore in `directory`. Destinations are keyed "kind://name".
+    """
+
+    def __init__(self, capacity=720, directory=None, fields=FIELDS):
+        self.capacity = max(2, capacity)
+        self.fields = fields
+        self.rings = {}
+        self._lock = threading.Lock()
+        self.disk = ColumnStore(directory, fields) if directory else None
+        if self.disk is not None:
+            # Enough rows for every known destination to refill its ring
+            for key, t, values in self.disk.tail(self.capacity * max(1, len(self.disk.names))):
+                self._ring(key).append(t, values)
+
+    def _ring(self, key):
+        ring = self.rings.get(key)
+        if ring is None:
+            ring = self.rings[key] = SeriesRing(self.capacity, self.fields)
+        return ring
+
+    def record(self, kind, name, stats, t=None):
+        """Add one sample; `stats` is anything with .get(field) (a DestinationStats or a dict)"""
+        t = t if t is not None else time.time()
+        values = {field: stats.get(field) for field in self.fields}
+        key = f'{kind}://{name}'
+        with self._lock:
+            self._ring(key).append(t, values)
+            if self.disk is not None:
+                self.disk.append(key, t, values)
+
+    def rates(self, kind, name, window, now=None):
+        """SeriesRing.rates over the `window` seconds before `now` (default: the current time)"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            ring = self.rings.get(f'{kind}://{name}')
+            # Measured from now, not the newest sample, so a destination that stopped being sampled goes stale
+            return ring.rates(window, now) if ring is not None else None
+
+    def latest(self, kind, name):
+        with self._lock:
+            ring = self.rings.get(f'{kind}://{name}')
+            return ring.latest() if ring is not None else None
+
+    def close(self):
+        with self._lock:
+            if self.disk is not None:
+                self.disk.close()
+                self.disk = None
@@ -1,9 +1,26 @@
 import os
+import time
+import json
+import socket
+import ssl
+import uuid
+import atexit
+import threading
 import stomp
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, g, render_template, jsonify, request
 from dotenv import load_dotenv
+from connection_pool import ConnectionPool, ReceiptTracker
+from write_behind import WriteBehindBuffer, BufferFull
+from codec import encode_body, resolve_compression
+from broker_selector import BrokerSelector, BrokerHealthListener, stomp_probe
+from metrics import CONTENT_TYPE, Registry
+from tracing import TRACE_ID_HEADER, trace_headers
+from structured_log import get_logger, setup_logging, dropped as log_records_dropped
+
+log = get_logger('publisher')
 
 load_dotenv()
+setup_logging()
 
 app = Flask(__name__)
 
@@ -16,53 +33,250 @@ ACTIVEMQ_PASSWORD = os.getenv('ACTIVEMQ_PASSWORD', 'admin')
 ACTIVEMQ_QUEUE = os.getenv('ACTIVEMQ_QUEUE', '/queue/test')
 USE_SSL = os.getenv('USE_SSL', 'true').lower() == 'true'
 
+# Connection pool settings
+POOL_SIZE = int(os.getenv('PUBLISH_POOL_SIZE', 4))
+# Connections the health check keeps open even when idle
+POOL_MIN_SIZE = int(os.getenv('PUBLISH_POOL_MIN_SIZE', 1))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('PUBLISH_POOL_ACQUIRE_TIMEOUT', 5))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('PUBLISH_POOL_HEALTH_CHECK_INTERVAL', 15))
+HEARTBEAT_MS = int(os.getenv('PUBLISH_HEARTBEAT_MS', 10000))
+
+# Batch publish settings
+BATCH_MAX_SIZE = int(os.getenv('PUBLISH_BATCH_MAX_SIZE', 1000))
+BATCH_TX_TIMEOUT = float(os.getenv('PUBLISH_BATCH_TX_TIMEOUT', 10))
+
+# Body compression for large messages ('none', 'zlib' or 'lz4'); consumers decode it from the header
+COMPRESSION = resolve_compression(os.getenv('PUBLISH_COMPRESSION', 'none'))
+COMPRESSION_MIN_BYTES = int(os.getenv('PUBLISH_COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_LEVEL = int(os.getenv('PUBLISH_COMPRESSION_LEVEL', 6))
+
+# Streaming ingestion settings
+STREAM_CHUNK_SIZE = int(os.getenv('PUBLISH_STREAM_CHUNK_SIZE', 65536))
+STREAM_MAX_RECORD_BYTES = int(os.getenv('PUBLISH_STREAM_MAX_RECORD_BYTES', 1048576))
+STREAM_RECEIPT_EVERY = int(os.getenv('PUBLISH_STREAM_RECEIPT_EVERY', 1000))
+STREAM_PROGRESS_EVERY = int(os.getenv('PUBLISH_STREAM_PROGRESS_EVERY', 100000))
+
+# Publish mode: 'sync' sends on the request path, 'async' buffers and sends in the background
+PUBLISH_MODE = os.getenv('PUBLISH_MODE', 'sync').lower()
+WRITE_BEHIND_CAPACITY = int(os.getenv('WRITE_BEHIND_CAPACITY', 10000))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 100))
+WRITE_BEHIND_LINGER_MS = float(os.getenv('WRITE_BEHIND_LINGER_MS', 5))
+WRITE_BEHIND_FULL_POLICY = os.getenv('WRITE_BEHIND_FULL_POLICY', 'block').lower()
+WRITE_BEHIND_BLOCK_TIMEOUT = float(os.getenv('WRITE_BEHIND_BLOCK_TIMEOUT', 1))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', 5))
+
 # Build initial broker hosts list for discovery
 BROKER_HOSTS_INITIAL = [(ACTIVEMQ_URL, ACTIVEMQ_PORT)]
 if ACTIVEMQ_URL_SECONDARY:
     BROKER_HOSTS_INITIAL.append((ACTIVEMQ_URL_SECONDARY, ACTIVEMQ_PORT))
 
-# This will be set to the working broker after first successful connection
-WORKING_BROKER = None
+# Broker selection: all hosts are raced on connect, and re-probed in the background
+BROKER_CONNECT_TIMEOUT = float(os.getenv('BROKER_CONNECT_TIMEOUT', 10))
+BROKER_PROBE_INTERVAL = float(os.getenv('BROKER_PROBE_INTERVAL', 30))
 
 # Message counter
 message_counter = 0
+counter_lock = threading.Lock()
+
+# Created on first use so the Flask reloader parent never opens connections
+pool = None
+pool_lock = threading.Lock()
+
+# Only created when PUBLISH_MODE=async
+write_behind = None
+
+# Served on /metrics. `source` is the endpoint (or the write-behind sender) a message came through
+metrics = Registry()
+published_total = metrics.counter('publisher_messages_published', "Messages sent to the broker", ('source',))
+failed_total = metrics.counter('publisher_messages_failed', "Messages whose send failed", ('source',))
+request_seconds = metrics.histogram('publisher_http_request_seconds', "HTTP request time", ('endpoint', 'status'))
+pool_wait_seconds = metrics.histogram('publisher_pool_acquire_seconds', "Time waiting for a pooled connection")
+send_seconds = metrics.histogram('publisher_broker_send_seconds', "Time on the wire: one SEND, or a whole transaction up to the COMMIT receipt", ('operation',))
+connect_seconds = metrics.histogram('publisher_broker_connect_seconds', "STOMP CONNECT to CONNECTED time", ('broker',))
+metrics.gauge('publisher_pool_connections_replaced', "Dead pooled connections replaced (reconnects)",
+              lambda: pool.replaced if pool else 0, type='counter')
+metrics.gauge('publisher_write_behind_depth', "Messages buffered for the write-behind sender",
+              lambda: write_behind.stats()['depth'] if write_behind else None)
+metrics.gauge('publisher_write_behind_dropped', "Buffered messages dropped after all retries",
+              lambda: write_behind.dropped if write_behind else None, type='counter')
+metrics.gauge('log_records_dropped', "Log records dropped because the log queue was full", log_records_dropped, type='counter')
+
+
+def disable_nagle(conn):
+    """
+    Send small frames immediately. Without this, a COMMIT or receipt-carrying SEND
+    that follows a burst of frames waits on the peer's delayed ACK (~40 ms).
+    """
+    try:
+        conn.transport.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except Exception as e:
+        log.warning(f"Could not set TCP_NODELAY: {e}")
+
+
+def open_connection(host, port):
+    """Open a pooled-publisher STOMP connection to one specific broker"""
+    conn = stomp.Connection([(host, port)], heartbeats=(HEARTBEAT_MS, HEARTBEAT_MS), reconnect_attempts_max=1)
+
+    if USE_SSL:
+        conn.set_ssl(for_hosts=[(host, port)], ssl_version=ssl.PROTOCOL_TLS)
+
+    conn.set_listener('receipts', ReceiptTracker())
+    conn.set_listener('broker-health', BrokerHealthListener(broker_selector, host, port))
+
+    started = time.perf_counter()
+    conn.connect(ACTIVEMQ_USER, ACTIVEMQ_PASSWORD, wait=True,
+                 headers={'heart-beat': f'{HEARTBEAT_MS},{HEARTBEAT_MS}'})
+    connect_seconds.observe(time.perf_counter() - started, broker=f'{host}:{port}')
+    disable_nagle(conn)
+    return conn
+
+
+broker_selector = BrokerSelector(
+    BROKER_HOSTS_INITIAL,
+    open_connection,
+    probe_fn=stomp_probe(ACTIVEMQ_USER, ACTIVEMQ_PASSWORD, USE_SSL, BROKER_CONNECT_TIMEOUT),
+    connect_timeout=BROKER_CONNECT_TIMEOUT,
+    probe_interval=BROKER_PROBE_INTERVAL,
+)
 
 
 def get_connection():
-    """Create and return a STOMP connection - uses discovered working broker if known"""
-    import ssl
-    global WORKING_BROKER
+    """Create and return a STOMP connection to the best available broker"""
+    return broker_selector.connect()
+
 
-    # If we already know which broker works, use only that one
-    if WORKING_BROKER:
-        broker_hosts = [WORKING_BROKER]
-        conn = stomp.Connection(broker_hosts)
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global pool
+    if pool is None:
+        with pool_lock:
+            if pool is None:
+                pool = ConnectionPool(
+                    get_connection,
+                    size=POOL_SIZE,
+                    acquire_timeout=POOL_ACQUIRE_TIMEOUT,
+                    health_check_interval=POOL_HEALTH_CHECK_INTERVAL,
+                    min_size=POOL_MIN_SIZE,
+                )
+                log.info(f"Connection pool ready (size: {POOL_SIZE}, min: {POOL_MIN_SIZE})")
+    return pool
 
-        if USE_SSL:
-            conn.set_ssl(for_hosts=broker_hosts, ssl_version=ssl.PROTOCOL_TLS)
 
-        conn.connect(ACTIVEMQ_USER, ACTIVEMQ_PASSWORD, wait=True)
-        return conn
+def encode(body, headers=None):
+    """
+    Encode a body for sending, compressing it if configured and large enough.
 
-    # First time - try each broker individually to discover which one works
-    for host, port in BROKER_HOSTS_INITIAL:
+    Messages that were not stamped earlier get their trace headers here, at send time.
+    """
+    body, encoding_headers = encode_body(body, COMPRESSION, COMPRESSION_MIN_BYTES, COMPRESSION_LEVEL)
+    return body, {**trace_headers(), **(headers or {}), **(encoding_headers or {})}
+
+
+def send_pooled(body, destination, headers=None):
+    """Send one frame on a pooled connection, retrying once if the connection was dead"""
+    body, headers = encode(body, headers)
+    for attempt in range(2):
+        try:
+            started = time.perf_counter()
+            with get_pool().connection() as conn:
+                acquired = time.perf_counter()
+                conn.send(body=body, destination=destination, headers=headers)
+                send_seconds.observe(time.perf_counter() - acquired, operation='send')
+            pool_wait_seconds.observe(acquired - started)
+            return
+        except stomp.exception.NotConnectedException:
+            if broker_selector.working_broker:
+                broker_selector.mark_failed(*broker_selector.working_broker)
+            if attempt:
+                raise
+            log.warning("Pooled connection was dead, retrying on a fresh one")
+
+
+def send_transaction(bodies, destination, timeout, transaction=None):
+    """
+    Send all bodies inside one BEGIN/COMMIT on a pooled connection.
+
+    Items of `bodies` are bodies, or (body, headers) pairs.
+
+    Waits for the broker's receipt for the COMMIT and aborts the transaction if any
+    SEND fails or the whole exchange takes longer than `timeout` seconds.
+    Returns (commit_seconds, total_seconds).
+    """
+    acquiring = time.perf_counter()
+    with get_pool().connection() as conn:
+        started = time.perf_counter()
+        pool_wait_seconds.observe(started - acquiring)
+        transaction = conn.begin(transaction=transaction)
         try:
-            conn = stomp.Connection([(host, port)])
+            for body in bodies:
+                body, headers = encode(*body) if isinstance(body, tuple) else encode(body)
+                conn.send(body=body, destination=destination, headers=headers, transaction=transaction)
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f"Transaction exceeded {timeout}s")
+
+            # Ask for a receipt so the latency covers the broker applying the commit
+            receipts = conn.get_listener('receipts')
+            receipt = receipts.expect()
+            commit_started = time.perf_counter()
+            conn.commit(transaction, headers={'receipt': receipt})
+            receipts.wait(receipt, max(timeout - (commit_started - started), 0.1))
+            finished = time.perf_counter()
+        except Exception:
+            if conn.is_connected():
+                conn.abort(transaction)
+            raise
+
+    send_seconds.observe(finished - started, operation='transaction')
+    return finished - commit_started, finished - started
+
 
-            if USE_SSL:
-                conn.set_ssl(for_hosts=[(host, port)], ssl_version=ssl.PROTOCOL_TLS)
+def get_write_behind():
+    """Return the write-behind buffer, creating it and its sender thread on first use"""
+    global write_behind
+    if write_behind is None:
+        with pool_lock:
+            if write_behind is None:
+                write_behind = WriteBehindBuffer(
+                    send_write_behind_batch,
+                    capacity=WRITE_BEHIND_CAPACITY,
+                    batch_size=WRITE_BEHIND_BATCH_SIZE,
+                    linger_ms=WRITE_BEHIND_LINGER_MS,
+                    full_policy=WRITE_BEHIND_FULL_POLICY,
+                    block_timeout=WRITE_BEHIND_BLOCK_TIMEOUT,
+                    max_retries=WRITE_BEHIND_MAX_RETRIES,
+                )
+                atexit.register(write_behind.close)
+                log.info(f"Write-behind publishing enabled (capacity: {WRITE_BEHIND_CAPACITY}, "
+                      f"batch: {WRITE_BEHIND_BATCH_SIZE}, when full: {WRITE_BEHIND_FULL_POLICY})")
+    return write_behind
 
-            conn.connect(ACTIVEMQ_USER, ACTIVEMQ_PASSWORD, wait=True)
 
-            # Success! Save this broker
-            WORKING_BROKER = (host, port)
-            print(f"[INFO] Discovered working broker: {host}:{port}")
-            return conn
-        except Exception as e:
-            continue
+def send_write_behind_batch(bodies):
+    """
+    Sender-thread callback: one message goes as a plain SEND, more as one transaction.
 
-    # If we get here, all brokers failed
-    raise Exception("Failed to connect to any broker")
+    Items are (body, headers) pairs, stamped with trace headers when the request was accepted.
+    """
+    if len(bodies) == 1:
+        body, headers = bodies[0]
+        send_pooled(body, ACTIVEMQ_QUEUE, headers)
+    else:
+        send_transaction(bodies, ACTIVEMQ_QUEUE, BATCH_TX_TIMEOUT)
+    published_total.inc(len(bodies), source='write_behind')
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'metrics_endpoint':
+        request_seconds.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                status=response.status_code)
+    return response
 
 
 @app.route('/')
@@ -75,25 +289,248 @@ def publish():
     """Publish a message to ActiveMQ"""
     global message_counter
     try:
-        message_counter += 1
-        conn = get_connection()
-        
-        message = f"Message #{message_counter}"
-        conn.send(body=message, destination=ACTIVEMQ_QUEUE)
-        
-        conn.disconnect()
-        
+        with counter_lock:
+            message_counter += 1
+            counter = message_counter
+
+        message = f"Message #{counter}"
+        # Stamped on arrival so the publish time includes any write-behind buffering
+        headers = trace_headers()
+
+        if PUBLISH_MODE == 'async':
+            try:
+                get_write_behind().submit((message, headers))
+            except BufferFull as e:
+                response = jsonify({
+                    'status': 'error',
+                    'message': str(e)
+                })
+                response.headers['Retry-After'] = '1'
+                return response, 429
+            return jsonify({
+                'status': 'success',
+                'message': f'Accepted: {message}',
+                'counter': counter,
+                'trace_id': headers[TRACE_ID_HEADER]
+            }), 202
+
+        send_pooled(message, ACTIVEMQ_QUEUE, headers)
+        published_total.inc(source='publish')
+
         return jsonify({
             'status': 'success',
             'message': f'Published: {message}',
-            'counter': message_counter
+            'counter': counter,
+            'trace_id': headers[TRACE_ID_HEADER]
         })
     except Exception as e:
+        failed_total.inc(source='publish')
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
 
+@app.route('/publish/batch', methods=['POST'])
+def publish_batch():
+    """
+    Publish many messages in one request inside a single STOMP transaction.
+
+    Body: {"messages": ["text", {...}, ...]} - non-string items are sent as JSON.
+    The batch is all-or-nothing: the transaction is aborted if any SEND fails or
+    the broker does not confirm the COMMIT within PUBLISH_BATCH_TX_TIMEOUT.
+    """
+    global message_counter
+    payload = request.get_json(silent=True) or {}
+    messages = payload.get('messages')
+
+    if not isinstance(messages, list) or not messages:
+        return jsonify({
+            'status': 'error',
+            'message': "Request body must contain a non-empty 'messages' list"
+        }), 400
+    if len(messages) > BATCH_MAX_SIZE:
+        return jsonify({
+            'status': 'error',
+            'message': f'Batch of {len(messages)} exceeds PUBLISH_BATCH_MAX_SIZE ({BATCH_MAX_SIZE})'
+        }), 413
+
+    bodies = [m if isinstance(m, str) else json.dumps(m) for m in messages]
+    transaction = uuid.uuid4().hex
+    try:
+        commit_seconds, batch_seconds = send_transaction(bodies, ACTIVEMQ_QUEUE, BATCH_TX_TIMEOUT, transaction)
+        published_total.inc(len(bodies), source='batch')
+
+        with counter_lock:
+            message_counter += len(bodies)
+            counter = message_counter
+
+        return jsonify({
+            'status': 'success',
+            'message': f'Published batch of {len(bodies)} messages',
+            'count': len(bodies),
+            'transaction': transaction,
+            'commit_latency_ms': round(commit_seconds * 1000, 3),
+            'batch_latency_ms': round(batch_seconds * 1000, 3),
+            'counter': counter
+        })
+    except Exception as e:
+        # The transaction was aborted, so none of the batch was delivered
+        failed_total.inc(len(bodies), source='batch')
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'transaction': transaction
+        }), 500
+
+
+def send_record(conn, body, destination, with_receipt):
+    """Send one JSON record, optionally blocking until the broker confirms it"""
+    body, headers = encode(body)
+    if not with_receipt:
+        conn.send(body=body, destination=destination, content_type='application/json', headers=headers)
+        return
+    receipts = conn.get_listener('receipts')
+    receipt = receipts.expect()
+    conn.send(body=body, destination=destination, content_type='application/json',
+              headers={**(headers or {}), 'receipt': receipt})
+    receipts.wait(receipt, BATCH_TX_TIMEOUT)
+
+
+def iter_ndjson_lines(stream, chunk_size, max_record_bytes):
+    """
+    Yield (line_number, bytes) for each line of an NDJSON body as it arrives.
+
+    Only the current chunk and one partial line are held in memory. Lines longer
+    than `max_record_bytes` are yielded as None so the caller can count them.
+    """
+    pending = b''
+    line_number = 0
+    oversized = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            line_number += 1
+            # A chunk can hold whole lines over the limit, not just the tail in `pending`
+            yield line_number, None if oversized or len(line) > max_record_bytes else line
+            oversized = False
+        if len(pending) > max_record_bytes:
+            # Keep discarding the rest of this line rather than buffering it
+            pending = b''
+            oversized = True
+    if pending or oversized:
+        yield line_number + 1, None if oversized else pending
+
+
+@app.route('/publish/stream', methods=['POST'])
+def publish_stream():
+    """
+    Bulk-ingest an NDJSON (optionally chunked) upload into ACTIVEMQ_QUEUE.
+
+    Each line is parsed and sent as soon as the next one is read, so uploads of any
+    size run in constant memory. Every PUBLISH_STREAM_RECEIPT_EVERY records the broker is
+    asked for a receipt, which both confirms progress and keeps the sender from
+    running ahead of the broker. Lines that are not valid JSON are skipped and
+    counted. The response summarises the stream once it ends.
+    """
+    global message_counter
+    records = 0
+    confirmed = 0
+    invalid = 0
+    invalid_lines = []
+    total_bytes = 0
+    started = time.perf_counter()
+
+    try:
+        with get_pool().connection() as conn:
+            # Each record is sent when the next one arrives, so the last record of
+            # the stream can carry the receipt that confirms the tail
+            previous = None
+            for line_number, line in iter_ndjson_lines(request.stream, STREAM_CHUNK_SIZE, STREAM_MAX_RECORD_BYTES):
+                if line is not None:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        line = None
+                if line is None:
+                    invalid += 1
+                    if len(invalid_lines) < 10:
+                        invalid_lines.append(line_number)
+                    continue
+
+                if previous is not None:
+                    checkpoint = (records + 1) % STREAM_RECEIPT_EVERY == 0
+                    send_record(conn, previous, ACTIVEMQ_QUEUE, checkpoint)
+                    records += 1
+                    total_bytes += len(previous)
+                    if checkpoint:
+                        confirmed = records
+                    if records % STREAM_PROGRESS_EVERY == 0:
+                        elapsed = time.perf_counter() - started
+                        log.info(f"Stream progress: {records} records, {records / elapsed:.0f} records/s",
+                                 category='stream', records=records)
+                previous = line
+
+            if previous is not None:
+                send_record(conn, previous, ACTIVEMQ_QUEUE, True)
+                records += 1
+                total_bytes += len(previous)
+                confirmed = records
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        published_total.inc(records, source='stream')
+        failed_total.inc(source='stream')
+        return jsonify({
+            'status': 'error',
+            'message': str(e),
+            'records': records,
+            'confirmed': confirmed,
+            'invalid': invalid
+        }), 500
+
+    with counter_lock:
+        message_counter += records
+    published_total.inc(records, source='stream')
+
+    return jsonify({
+        'status': 'success',
+        'message': f'Streamed {records} records to {ACTIVEMQ_QUEUE}',
+        'records': records,
+        'confirmed': confirmed,
+        'invalid': invalid,
+        'invalid_lines': invalid_lines,
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 3),
+        'records_per_sec': round(records / elapsed, 1) if elapsed else 0.0,
+        'mb_per_sec': round(total_bytes / elapsed / 1e6, 3) if elapsed else 0.0
+    })
+
+
+@app.route('/publish/stats')
+def publish_stats():
+    """Connection pool and write-behind buffer statistics"""
+    return jsonify({
+        'mode': PUBLISH_MODE,
+        'counter': message_counter,
+        'pool': pool.stats() if pool else None,
+        'brokers': broker_selector.stats(),
+        'write_behind': write_behind.stats() if write_behind else None
+    })
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
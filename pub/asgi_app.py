@@ -0,0 +1,190 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+from async_stomp import AsyncStompClient
+from codec import encode_body, resolve_compression
+from metrics import CONTENT_TYPE, Registry
+from tracing import TRACE_ID_HEADER, trace_headers
+from structured_log import get_logger, setup_logging, dropped as log_records_dropped
+
+log = get_logger('publisher')
+
+load_dotenv()
+setup_logging()
+
+# ActiveMQ Configuration from .env (same variables as app.py)
+ACTIVEMQ_URL = os.getenv('ACTIVEMQ_URL', 'localhost')
+ACTIVEMQ_URL_SECONDARY = os.getenv('ACTIVEMQ_URL_SECONDARY', '')
+ACTIVEMQ_PORT = int(os.getenv('ACTIVEMQ_PORT', 61614))
+ACTIVEMQ_USER = os.getenv('ACTIVEMQ_USERNAME', 'admin')
+ACTIVEMQ_PASSWORD = os.getenv('ACTIVEMQ_PASSWORD', 'admin')
+ACTIVEMQ_QUEUE = os.getenv('ACTIVEMQ_QUEUE', '/queue/test')
+USE_SSL = os.getenv('USE_SSL', 'true').lower() == 'true'
+
+# Number of multiplexed broker connections shared by all requests
+ASYNC_CONNECTIONS = int(os.getenv('ASYNC_PUBLISH_CONNECTIONS', 2))
+# Wait for a broker RECEIPT before answering (slower, but confirms each message)
+ASYNC_RECEIPTS = os.getenv('ASYNC_PUBLISH_RECEIPTS', 'false').lower() == 'true'
+HEARTBEAT_MS = int(os.getenv('PUBLISH_HEARTBEAT_MS', 10000))
+# Broker selection, as in app.py
+BROKER_CONNECT_TIMEOUT = float(os.getenv('BROKER_CONNECT_TIMEOUT', 10))
+BROKER_PROBE_INTERVAL = float(os.getenv('BROKER_PROBE_INTERVAL', 30))
+
+COMPRESSION = resolve_compression(os.getenv('PUBLISH_COMPRESSION', 'none'))
+COMPRESSION_MIN_BYTES = int(os.getenv('PUBLISH_COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_LEVEL = int(os.getenv('PUBLISH_COMPRESSION_LEVEL', 6))
+
+BROKER_HOSTS_INITIAL = [(ACTIVEMQ_URL, ACTIVEMQ_PORT)]
+if ACTIVEMQ_URL_SECONDARY:
+    BROKER_HOSTS_INITIAL.append((ACTIVEMQ_URL_SECONDARY, ACTIVEMQ_PORT))
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')
+
+client = AsyncStompClient(BROKER_HOSTS_INITIAL, ACTIVEMQ_USER, ACTIVEMQ_PASSWORD,
+                          use_ssl=USE_SSL, connections=ASYNC_CONNECTIONS, heartbeat_ms=HEARTBEAT_MS,
+                          connect_timeout=BROKER_CONNECT_TIMEOUT, probe_interval=BROKER_PROBE_INTERVAL)
+
+# Message counter - only touched from the event loop, so no lock is needed
+message_counter = 0
+
+# Same metric names as app.py, served on /metrics
+metrics = Registry()
+published_total = metrics.counter('publisher_messages_published', "Messages sent to the broker", ('source',))
+failed_total = metrics.counter('publisher_messages_failed', "Messages whose send failed", ('source',))
+request_seconds = metrics.histogram('publisher_http_request_seconds', "HTTP request time", ('endpoint', 'status'))
+send_seconds = metrics.histogram('publisher_broker_send_seconds', "Time on the wire: one SEND (up to its receipt with ASYNC_PUBLISH_RECEIPTS)", ('operation',))
+metrics.gauge('log_records_dropped', "Log records dropped because the log queue was full", log_records_dropped, type='counter')
+
+
+async def send_response(send, status, body, content_type='application/json'):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('ascii')),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    """Drain the request body so the connection can be reused"""
+    chunks = []
+    more = True
+    while more:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def index(scope, receive, send):
+    with open(TEMPLATE_PATH, 'rb') as f:
+        await send_response(send, 200, f.read(), 'text/html; charset=utf-8')
+
+
+async def publish(scope, receive, send):
+    """Publish a message to ActiveMQ - same contract as the Flask /publish route"""
+    global message_counter
+    await read_body(receive)
+    try:
+        message_counter += 1
+        counter = message_counter
+
+        message = f"Message #{counter}"
+        traced = trace_headers()
+        body, headers = encode_body(message, COMPRESSION, COMPRESSION_MIN_BYTES, COMPRESSION_LEVEL)
+        headers = {**traced, **(headers or {})}
+        started = time.perf_counter()
+        await client.send(ACTIVEMQ_QUEUE, body, headers, receipt=ASYNC_RECEIPTS)
+        send_seconds.observe(time.perf_counter() - started, operation='send')
+        published_total.inc(source='publish')
+
+        await send_response(send, 200, {
+            'status': 'success',
+            'message': f'Published: {message}',
+            'counter': counter,
+            'trace_id': traced[TRACE_ID_HEADER]
+        })
+    except Exception as e:
+        failed_total.inc(source='publish')
+        await send_response(send, 500, {
+            'status': 'error',
+            'message': str(e)
+        })
+
+
+async def publish_stats(scope, receive, send):
+    await read_body(receive)
+    await send_response(send, 200, {'brokers': client.stats()})
+
+
+async def metrics_endpoint(scope, receive, send):
+    await send_response(send, 200, metrics.render().encode('utf-8'), CONTENT_TYPE)
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('POST', '/publish'): publish,
+    ('GET', '/publish/stats'): publish_stats,
+    ('GET', '/metrics'): metrics_endpoint,
+}
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await client.start()
+                log.info(f"Async publisher ready ({ASYNC_CONNECTIONS} broker connections, queue: {ACTIVEMQ_QUEUE})")
+            except Exception as e:
+                # Keep serving; connections are retried on the first publish
+                log.warning(f"Could not connect at startup: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await client.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await read_body(receive)
+        await send_response(send, 404, {'status': 'error', 'message': 'Not found'})
+        return
+    if handler is metrics_endpoint:
+        await handler(scope, receive, send)
+        return
+
+    # Capture the status as the response starts
+    started = time.perf_counter()
+    status = []
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        await send(message)
+
+    try:
+        await handler(scope, receive, send_and_record)
+    finally:
+        request_seconds.observe(time.perf_counter() - started, endpoint=handler.__name__,
+                                status=status[0] if status else 500)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000, log_level='warning')
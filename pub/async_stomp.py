@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import ssl
+import time
+from broker_selector import AsyncBrokerSelector, stomp_probe
+from structured_log import get_logger
+
+log = get_logger('async_stomp')
+
+
+class StompError(Exception):
+    """Raised for ERROR frames and failed connections"""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\r', '\\r').replace('\n', '\\n').replace(':', '\\c')
+
+
+def encode_frame(command, headers, body=b''):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    lines = [command]
+    if command in ('CONNECT', 'STOMP'):
+        # STOMP 1.2: CONNECT headers are never escaped (a ':' or '\\' in the passcode is sent as is)
+        lines.extend(f'{k}:{v}' for k, v in headers.items())
+    else:
+        lines.extend(f'{_escape(k)}:{_escape(v)}' for k, v in headers.items())
+    if body:
+        lines.append(f'content-length:{len(body)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8') + body + b'\x00'
+
+
+def stomp_ssl_context():
+    """
+    The TLS settings stomp.py uses for set_ssl(for_hosts=..., ssl_version=ssl.PROTOCOL_TLS)
+    in app.py and the consumer: no CA bundle, so the broker certificate is not verified
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class AsyncStompConnection:
+    """
+    Minimal non-blocking STOMP 1.2 producer connection on asyncio streams.
+
+    SEND frames are written straight into the transport buffer, so any number of
+    coroutines can publish over the same connection concurrently; `drain()` keeps
+    the buffer bounded. Receipts are matched to waiting futures by a reader task,
+    and heart-beats are sent/checked by background tasks.
+    """
+
+    def __init__(self, host, port, login, passcode, use_ssl=True, heartbeat_ms=10000, connect_timeout=10.0):
+        self.host = host
+        self.port = port
+        self.login = login
+        self.passcode = passcode
+        self.use_ssl = use_ssl
+        self.heartbeat_ms = heartbeat_ms
+        self.connect_timeout = connect_timeout
+
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self._receipts = {}
+        self._receipt_ids = itertools.count(1)
+        self._tasks = []
+        self._last_received = 0.0
+        self._send_interval = 0
+        self._receive_timeout = 0
+
+    async def connect(self):
+        ssl_context = stomp_ssl_context() if self.use_ssl else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context,
+                                    server_hostname=self.host if ssl_context else None),
+            self.connect_timeout)
+
+        self.writer.write(encode_frame('CONNECT', {
+            'accept-version': '1.2',
+            'host': self.host,
+            'login': self.login,
+            'passcode': self.passcode,
+            'heart-beat': f'{self.heartbeat_ms},{self.heartbeat_ms}',
+        }))
+        await self.writer.drain()
+
+        command, headers, body = await asyncio.wait_for(self._read_frame(), self.connect_timeout)
+        if command != 'CONNECTED':
+            self.writer.close()
+            raise StompError(headers.get('message') or body.decode('utf-8', 'replace') or command)
+
+        sx, sy = (int(v) for v in headers.get('heart-beat', '0,0').split(','))
+        if self.heartbeat_ms and sy:
+            self._send_interval = max(self.heartbeat_ms, sy) / 1000
+        if self.heartbeat_ms and sx:
+            self._receive_timeout = max(self.heartbeat_ms, sx) * 2 / 1000
+
+        self.connected = True
+        self._last_received = time.monotonic()
+        self._tasks.append(asyncio.create_task(self._read_loop()))
+        if self._send_interval:
+            self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        if self._receive_timeout:
+            self._tasks.append(asyncio.create_task(self._watchdog_loop()))
+        return self
+
+    async def _read_frame(self):
+        # Skip heart-beat EOLs between frames
+        line = b'\n'
+        while line in (b'\n', b'\r\n'):
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed by broker")
+            self._last_received = time.monotonic()
+        command = line.decode('utf-8').rstrip('\r\n')
+
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('utf-8').rstrip('\r\n')
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            headers.setdefault(key, value)
+
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+            await self.reader.readexactly(1)
+        else:
+            body = (await self.reader.readuntil(b'\x00'))[:-1]
+        self._last_received = time.monotonic()
+        return command, headers, body
+
+    async def _read_loop(self):
+        try:
+            while True:
+                command, headers, body = await self._read_frame()
+                if command == 'RECEIPT':
+                    future = self._receipts.pop(headers.get('receipt-id'), None)
+                    if future and not future.done():
+                        future.set_result(None)
+                elif command == 'ERROR':
+                    error = StompError(headers.get('message') or body.decode('utf-8', 'replace'))
+                    future = self._receipts.pop(headers.get('receipt-id'), None)
+                    if future and not future.done():
+                        future.set_exception(error)
+                    else:
+                        raise error
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e)
+
+    async def _heartbeat_loop(self):
+        while self.connected:
+            await asyncio.sleep(self._send_interval)
+            try:
+                self.writer.write(b'\n')
+            except Exception as e:
+                self._fail(e)
+
+    async def _watchdog_loop(self):
+        # Any bytes count as a sign of life, heart-beat EOLs included (_read_frame stamps _last_received)
+        while self.connected:
+            await asyncio.sleep(self._receive_timeout / 2)
+            silent = time.monotonic() - self._last_received
+            if silent > self._receive_timeout:
+                self._fail(StompError(f"No data from broker for {silent:.1f}s"))
+
+    def _fail(self, error):
+        self.connected = False
+        for future in self._receipts.values():
+            if not future.done():
+                future.set_exception(StompError(f"Connection lost: {error}"))
+        self._receipts.clear()
+        if self.writer:
+            self.writer.close()
+
+    async def send(self, destination, body, headers=None, receipt=False):
+        """Write a SEND frame; with receipt=True, wait until the broker confirms it"""
+        if not self.connected:
+            raise StompError("Not connected")
+        frame_headers = dict(headers or {})
+        frame_headers['destination'] = destination
+        future = None
+        if receipt:
+            receipt_id = str(next(self._receipt_ids))
+            frame_headers['receipt'] = receipt_id
+            future = self._receipts[receipt_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(encode_frame('SEND', frame_headers, body))
+        await self.writer.drain()
+        if future is not None:
+            await future
+
+    async def close(self):
+        if self.connected:
+            self.connected = False
+            try:
+                self.writer.write(encode_frame('DISCONNECT', {}))
+                await self.writer.drain()
+            except Exception:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        if self.writer:
+            self.writer.close()
+
+
+class AsyncStompClient:
+    """
+    Spreads publishes over a small set of multiplexed connections.
+
+    Connections are opened through an AsyncBrokerSelector: the working broker
+    first, otherwise a race of every host in `hosts`, with the same health
+    scores and background re-probes as the threaded publisher. A connection
+    found dead is reported with `mark_failed()` and replaced on demand.
+    """
+
+    def __init__(self, hosts, login, passcode, use_ssl=True, connections=2, heartbeat_ms=10000,
+                 connect_timeout=10.0, probe_interval=30.0):
+        self.login = login
+        self.passcode = passcode
+        self.use_ssl = use_ssl
+        self.size = connections
+        self.heartbeat_ms = heartbeat_ms
+        self.connect_timeout = connect_timeout
+        self.selector = AsyncBrokerSelector(
+            hosts, self._open_host,
+            probe_fn=stomp_probe(login, passcode, use_ssl, connect_timeout),
+            connect_timeout=connect_timeout,
+            probe_interval=probe_interval,
+        )
+        self._conns = [None] * connections
+        self._locks = [asyncio.Lock() for _ in range(connections)]
+        self._next = itertools.count()
+
+    async def _open_host(self, host, port):
+        return await AsyncStompConnection(host, port, self.login, self.passcode, self.use_ssl,
+                                          self.heartbeat_ms, self.connect_timeout).connect()
+
+    async def _connection(self, slot):
+        conn = self._conns[slot]
+        if conn is not None and conn.connected:
+            return conn
+        async with self._locks[slot]:
+            conn = self._conns[slot]
+            if conn is None or not conn.connected:
+                if conn is not None:
+                    # Lost underneath us (EOF, ERROR frame or heart-beat silence)
+                    self.selector.mark_failed(conn.host, conn.port)
+                conn = self._conns[slot] = await self.selector.connect()
+            return conn
+
+    async def start(self):
+        await asyncio.gather(*(self._connection(slot) for slot in range(self.size)))
+
+    async def send(self, destination, body, headers=None, receipt=False):
+        slot = next(self._next) % self.size
+        conn = await self._connection(slot)
+        try:
+            await conn.send(destination, body, headers, receipt)
+        except (StompError, ConnectionError) as e:
+            if conn.connected:
+                raise
+            # The connection died underneath us - retry once on a fresh one
+            log.warning(f"Connection lost during send, retrying: {e}")
+            conn = await self._connection(slot)
+            await conn.send(destination, body, headers, receipt)
+
+    def stats(self):
+        return self.selector.stats()
+
+    async def close(self):
+        await asyncio.gather(*(c.close() for c in self._conns if c is not None), return_exceptions=True)
@@ -0,0 +1,151 @@
+"""
+Compare publish throughput/latency of the Flask (app.py) and ASGI (asgi_app.py) publishers.
+
+Start both publishers against the same broker, then e.g.:
+
+    python benchmark.py --target flask=http://localhost:5001/publish \
+                        --target asgi=http://localhost:5010/publish \
+                        --concurrency 200 --requests 20000
+
+Each of the `--concurrency` clients keeps one HTTP/1.1 keep-alive connection open
+and issues POSTs back to back, so the numbers reflect the server, not connection setup.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class HttpClient:
+    """One keep-alive HTTP/1.1 connection issuing bodiless POSTs"""
+
+    def __init__(self, host, port, path):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def post(self):
+        if self.writer is None:
+            await self._connect()
+        self.writer.write(
+            f'POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: 0\r\n\r\n'.encode('ascii'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        length = None
+        keep_alive = status_line.startswith(b'HTTP/1.1')
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value.strip())
+            elif name == 'connection':
+                keep_alive = value.strip().lower() == 'keep-alive'
+        if length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            keep_alive = False
+        if not keep_alive:
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def run_target(name, url, concurrency, total, timeout):
+    parts = urlsplit(url)
+    host, port, path = parts.hostname, parts.port or 80, parts.path or '/'
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        client = HttpClient(host, port, path)
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(client.post(), timeout)
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+                await client.close()
+        await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'target': name,
+        'url': url,
+        'concurrency': concurrency,
+        'requests': total,
+        'succeeded': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Flask vs ASGI publisher benchmark')
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='publish endpoint to benchmark (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per target')
+    parser.add_argument('--timeout', type=float, default=30.0, help='per-request timeout in seconds')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target:
+        name, _, url = target.partition('=')
+        if not url:
+            name = url = target
+        print(f"[INFO] Benchmarking {name}: {args.requests} requests, concurrency {args.concurrency}")
+        results.append(await run_target(name, url, args.concurrency, args.requests, args.timeout))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'target':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['target']:<12}{r['requests_per_sec']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,335 @@
+import asyncio
+import ssl
+import queue
+import threading
+import time
+
+import stomp
+from structured_log import get_logger
+
+log = get_logger('broker_selector')
+
+
+class BrokerHealth:
+    """Rolling health record for one broker host"""
+
+    __slots__ = ('host', 'port', 'latency', 'failures', 'last_success', 'last_failure')
+
+    # Weight of the newest sample in the latency moving average
+    ALPHA = 0.3
+    # Seconds added to the score per recent failure
+    FAILURE_PENALTY = 5.0
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.latency = None
+        self.failures = 0.0
+        self.last_success = None
+        self.last_failure = None
+
+    def record_success(self, latency):
+        self.latency = latency if self.latency is None else self.ALPHA * latency + (1 - self.ALPHA) * self.latency
+        # Failures fade out as the host keeps answering
+        self.failures /= 2
+        self.last_success = time.time()
+
+    def record_failure(self):
+        self.failures += 1
+        self.last_failure = time.time()
+
+    @property
+    def healthy(self):
+        if self.last_failure is None:
+            return True
+        return self.last_success is not None and self.last_success > self.last_failure
+
+    @property
+    def score(self):
+        """Lower is better; unknown latency ranks between healthy and failing hosts"""
+        latency = self.latency if self.latency is not None else 1.0
+        return latency + self.failures * self.FAILURE_PENALTY
+
+    def as_dict(self):
+        return {
+            'host': f'{self.host}:{self.port}',
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'recent_failures': round(self.failures, 2),
+            'healthy': self.healthy,
+            'score': round(self.score, 3),
+        }
+
+
+def stomp_probe(user, password, use_ssl, timeout=5.0):
+    """Build a probe that opens and closes a bare STOMP session to a host"""
+    def probe(host, port):
+        conn = stomp.Connection([(host, port)], timeout=timeout, reconnect_attempts_max=1)
+        if use_ssl:
+            conn.set_ssl(for_hosts=[(host, port)], ssl_version=ssl.PROTOCOL_TLS)
+        conn.connect(user, password, wait=True)
+        conn.disconnect()
+    return probe
+
+
+class BrokerHealthListener(stomp.ConnectionListener):
+    """Reports heart-beat timeouts on a live connection back to the selector"""
+
+    def __init__(self, selector, host, port):
+        self.selector = selector
+        self.host_port = (host, port)
+
+    def on_heartbeat_timeout(self):
+        self.selector.mark_failed(*self.host_port)
+
+
+class BrokerSelector:
+    """
+    Picks the broker to connect to out of BROKER_HOSTS_INITIAL.
+
+    `connect()` first tries the current working broker when it looks healthy.
+    Otherwise (or if that fails) it starts a CONNECT to every host at once and
+    returns the first that succeeds, so a dead primary no longer costs a full
+    connect timeout before the secondary is tried. Late winners are closed.
+
+    Every attempt feeds a per-host health record (latency moving average and
+    decaying failure count). `mark_failed()` drops the working broker, and an
+    optional background thread re-probes all hosts every `probe_interval`
+    seconds so a recovered or faster broker is picked up again.
+
+    `connect_fn(host, port)` must return a connected stomp.Connection;
+    `probe_fn(host, port)` (default: connect_fn + disconnect) is used for
+    background probes.
+    """
+
+    def __init__(self, hosts, connect_fn, probe_fn=None, connect_timeout=10.0, probe_interval=30.0):
+        self.hosts = list(hosts)
+        self.connect_fn = connect_fn
+        self.probe_fn = probe_fn or self._connect_and_close
+        self.connect_timeout = connect_timeout
+        self.probe_interval = probe_interval
+
+        self.health = {(h, p): BrokerHealth(h, p) for h, p in self.hosts}
+        self.working_broker = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    def _connect_and_close(self, host, port):
+        self.connect_fn(host, port).disconnect()
+
+    def _record(self, host, port, started=None):
+        """Feed one attempt into the host's health: a success if it started at `started`, else a failure"""
+        with self._lock:
+            if started is None:
+                self.health[(host, port)].record_failure()
+            else:
+                self.health[(host, port)].record_success(time.perf_counter() - started)
+
+    def _timed(self, fn, host, port):
+        started = time.perf_counter()
+        try:
+            result = fn(host, port)
+        except Exception:
+            self._record(host, port)
+            raise
+        self._record(host, port, started)
+        return result
+
+    def ranked(self):
+        """Hosts ordered best first"""
+        with self._lock:
+            return sorted(self.hosts, key=lambda hp: self.health[hp].score)
+
+    def mark_failed(self, host, port):
+        with self._lock:
+            self.health[(host, port)].record_failure()
+            if self.working_broker == (host, port):
+                self.working_broker = None
+                log.warning(f"Broker {host}:{port} failed, will re-select on next connect")
+
+    def _set_working(self, host, port):
+        with self._lock:
+            changed = self.working_broker != (host, port)
+            self.working_broker = (host, port)
+        if changed:
+            log.info(f"Discovered working broker: {host}:{port}")
+
+    def connect(self):
+        """Return a connection to the best reachable broker"""
+        self._ensure_probe_thread()
+
+        working = self.working_broker
+        if working and self.health[working].healthy:
+            try:
+                conn = self._timed(self.connect_fn, *working)
+                return conn
+            except Exception as e:
+                log.warning(f"Working broker {working[0]}:{working[1]} failed ({e}), racing all brokers")
+                self.mark_failed(*working)
+
+        return self._race()
+
+    def _race(self):
+        results = queue.Queue()
+        lock = threading.Lock()
+        state = {'winner': None, 'abandoned': False}
+
+        def attempt(host, port):
+            try:
+                conn = self._timed(self.connect_fn, host, port)
+            except Exception as e:
+                results.put((host, port, None, e))
+                return
+            with lock:
+                won = state['winner'] is None and not state['abandoned']
+                if won:
+                    state['winner'] = (host, port)
+            if won:
+                results.put((host, port, conn, None))
+            else:
+                # Someone else was faster - drop this connection
+                try:
+                    conn.disconnect()
+                except Exception:
+                    pass
+                results.put((host, port, None, None))
+
+        for host, port in self.ranked():
+            threading.Thread(target=attempt, args=(host, port), name=f'broker-race-{host}', daemon=True).start()
+
+        deadline = time.monotonic() + self.connect_timeout
+        errors = []
+        for _ in self.hosts:
+            remaining = deadline - time.monotonic()
+            try:
+                host, port, conn, error = results.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                break
+            if conn is not None:
+                self._set_working(host, port)
+                return conn
+            if error is not None:
+                errors.append(f"{host}:{port}: {error}")
+
+        with lock:
+            # Make any straggler close its connection
+            state['abandoned'] = True
+            late_winner = state['winner']
+        if late_winner is not None:
+            # A host won right at the deadline and is about to hand over its connection
+            while True:
+                host, port, conn, error = results.get()
+                if conn is not None:
+                    self._set_working(host, port)
+                    return conn
+        raise Exception(f"Failed to connect to any broker ({'; '.join(errors) or 'timed out'})")
+
+    def _ensure_probe_thread(self):
+        if self.probe_interval <= 0 or self._probe_thread is not None:
+            return
+        with self._lock:
+            if self._probe_thread is None:
+                self._probe_thread = threading.Thread(target=self._probe_loop, name='broker-probe', daemon=True)
+                self._probe_thread.start()
+
+    def probe_all(self):
+        """Probe every host concurrently and update health scores"""
+        threads = []
+        for host, port in self.hosts:
+            t = threading.Thread(target=self._probe_one, args=(host, port), daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join(self.connect_timeout)
+
+    def _probe_one(self, host, port):
+        try:
+            self._timed(self.probe_fn, host, port)
+        except Exception:
+            pass
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self.probe_all()
+            working = self.working_broker
+            if working and not self.health[working].healthy:
+                self.mark_failed(*working)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'working_broker': f'{self.working_broker[0]}:{self.working_broker[1]}' if self.working_broker else None,
+                'hosts': [self.health[hp].as_dict() for hp in self.hosts],
+            }
+
+
+class AsyncBrokerSelector(BrokerSelector):
+    """
+    BrokerSelector for asyncio clients: `connect_fn(host, port)` is a coroutine
+    function and `connect()` is awaited.
+
+    The race runs as tasks on the event loop; late winners are closed with their
+    own `close()` coroutine. Health records, `mark_failed()` and the background
+    probe thread are shared with the threaded selector, so `probe_fn` must be a
+    blocking probe such as `stomp_probe()`.
+    """
+
+    def __init__(self, hosts, connect_fn, probe_fn, connect_timeout=10.0, probe_interval=30.0):
+        super().__init__(hosts, connect_fn, probe_fn, connect_timeout, probe_interval)
+
+    async def _timed_async(self, host, port):
+        started = time.perf_counter()
+        try:
+            result = await self.connect_fn(host, port)
+        except Exception:
+            self._record(host, port)
+            raise
+        self._record(host, port, started)
+        return result
+
+    async def connect(self):
+        """Return a connection to the best reachable broker"""
+        self._ensure_probe_thread()
+
+        working = self.working_broker
+        if working and self.health[working].healthy:
+            try:
+                return await self._timed_async(*working)
+            except Exception as e:
+                log.warning(f"Working broker {working[0]}:{working[1]} failed ({e}), racing all brokers")
+                self.mark_failed(*working)
+
+        return await self._race()
+
+    async def _race(self):
+        attempts = {asyncio.ensure_future(self._timed_async(host, port)): (host, port) for host, port in self.ranked()}
+        pending = set(attempts)
+        deadline = time.monotonic() + self.connect_timeout
+        errors = []
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(f"{attempts[task][0]}:{attempts[task][1]}: {task.exception()}")
+                elif winner is None:
+                    winner = task
+                else:
+                    # Finished in the same step as the winner
+                    self._close_loser(task)
+
+        # Stragglers still count towards health; drop any connection they open
+        for task in pending:
+            task.add_done_callback(self._close_loser)
+        if winner is None:
+            raise Exception(f"Failed to connect to any broker ({'; '.join(errors) or 'timed out'})")
+        self._set_working(*attempts[winner])
+        return winner.result()
+
+    @staticmethod
+    def _close_loser(task):
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(task.result().close())
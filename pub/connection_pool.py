@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import stomp
+from structured_log import get_logger
+
+log = get_logger('connection_pool')
+
+
+class PoolExhausted(Exception):
+    """Raised when no pooled connection becomes available within the timeout"""
+
+
+class ReceiptTracker(stomp.ConnectionListener):
+    """
+    Listener that lets callers block until the broker confirms a frame.
+
+    Register a receipt id with `expect()` before sending the frame, then `wait()`
+    on it. ERROR frames carrying the receipt id and disconnects fail the wait.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def expect(self):
+        receipt = uuid.uuid4().hex
+        with self._lock:
+            self._pending[receipt] = [threading.Event(), None]
+        return receipt
+
+    def wait(self, receipt, timeout):
+        with self._lock:
+            entry = self._pending.get(receipt)
+        if entry is None:
+            raise KeyError(receipt)
+        try:
+            if not entry[0].wait(timeout):
+                raise TimeoutError(f"No receipt from broker within {timeout}s")
+            if entry[1] is not None:
+                raise Exception(entry[1])
+        finally:
+            with self._lock:
+                self._pending.pop(receipt, None)
+
+    def _complete(self, receipt, error=None):
+        with self._lock:
+            entry = self._pending.get(receipt)
+        if entry is not None:
+            entry[1] = error
+            entry[0].set()
+
+    def on_receipt(self, frame):
+        self._complete(frame.headers.get('receipt-id'))
+
+    def on_error(self, frame):
+        receipt = frame.headers.get('receipt-id')
+        if receipt:
+            self._complete(receipt, frame.headers.get('message', 'Broker returned an ERROR frame'))
+
+    def on_disconnected(self):
+        with self._lock:
+            receipts = list(self._pending)
+        for receipt in receipts:
+            self._complete(receipt, 'Connection lost before the broker confirmed')
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived STOMP connections.
+
+    Connections are created lazily by `factory` (up to `size`), handed out one
+    request at a time and returned to the pool afterwards, so a publish only pays
+    for the SEND frame instead of a TCP/TLS handshake plus STOMP CONNECT.
+
+    Idle connections are kept alive by STOMP heart-beats (negotiated by the
+    factory) and a background health check periodically drops connections the
+    transport has marked dead and opens replacements until at least `min_size`
+    are open again.
+    """
+
+    def __init__(self, factory, size=4, acquire_timeout=5.0, health_check_interval=15.0, min_size=1):
+        self.factory = factory
+        self.size = size
+        self.min_size = min(min_size, size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+        self.replaced = 0
+
+        self._health_thread = threading.Thread(target=self._health_loop, name='stomp-pool-health', daemon=True)
+        self._health_thread.start()
+
+    def _open(self):
+        """Reserve a slot and open a new connection, releasing the slot on failure"""
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            if conn.is_connected():
+                conn.disconnect()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        """Return a live connection, opening one if the pool is below its size"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+                if conn is not None:
+                    return conn
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f"No STOMP connection available after {timeout}s (pool size {self.size})")
+                try:
+                    conn = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if conn.is_connected():
+                return conn
+
+            # Dead connection sitting in the pool - drop it and try again
+            self._discard(conn)
+            self.replaced += 1
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if it is broken"""
+        if discard or self._closed or not conn.is_connected():
+            self._discard(conn)
+            if not self._closed:
+                self.replaced += 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a `with` block"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            # The error may have struck mid-frame or left a receipt or transaction pending: the
+            # connection is in an unknown state even if the socket is still up, so never reuse it
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'min_size': self.min_size,
+            'open': self._created,
+            'idle': self._idle.qsize(),
+            'replaced': self.replaced,
+        }
+
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_check_interval)
+            if self._closed:
+                break
+
+            # Check every idle connection once; busy ones are checked on release
+            alive = []
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if conn.is_connected():
+                    alive.append(conn)
+                else:
+                    log.warning("Dropping dead pooled connection")
+                    self._discard(conn)
+                    self.replaced += 1
+
+            for conn in alive:
+                self._idle.put(conn)
+
+            # Top the pool back up so the next requests do not pay for a handshake
+            while not self._closed and self._created < self.min_size:
+                try:
+                    conn = self._open()
+                except Exception as e:
+                    log.warning(f"Could not open replacement connection: {e}")
+                    break
+                if conn is None:
+                    break
+                self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
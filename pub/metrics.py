@@ -0,0 +1,293 @@
+"""
+In-process metrics in the Prometheus text format (pub and sub each keep a copy).
+
+    metrics = Registry()
+    sent = metrics.counter('publisher_messages_published', "Messages sent", ('source',))
+    sent.inc(source='publish')
+    metrics.render()  # served on /metrics
+
+Counters and histograms are updated without taking a lock: every thread owns
+its cells and the registry merges them on scrape.
+"""
+import bisect
+import json
+import math
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond broker sends up to slow handlers
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _sample_name(name, type):
+    # Counters are exposed with the conventional _total suffix
+    return name + '_total' if type == 'counter' and not name.endswith('_total') else name
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Owner:
+    """Held only by a thread's threading.local: collected when that thread exits"""
+
+
+class _PerThread:
+    """
+    Base for metrics updated from many threads.
+
+    Each thread writes only to its own cells (no lock on the hot path); the
+    cells of every thread are merged when the registry is scraped. When a
+    thread exits, its cells are folded into a shared base, so totals never go
+    backwards and short-lived threads (one per HTTP request) do not pile up.
+    """
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        # id(owner) -> cells of each live thread
+        self._all = {}
+        self._base = {}
+        self._lock = threading.Lock()
+
+    def _cells(self):
+        cells = getattr(self._local, 'cells', None)
+        if cells is None:
+            owner = self._local.owner = _Owner()
+            cells = self._local.cells = {}
+            with self._lock:
+                self._all[id(owner)] = cells
+            weakref.finalize(owner, self._retire, id(owner))
+        return cells
+
+    def _retire(self, owner_id):
+        with self._lock:
+            cells = self._all.pop(owner_id, None)
+            if cells:
+                self._merge_into(self._base, cells)
+
+    def _merge_into(self, target, cells):
+        """Add `cells` into `target` without mutating values `target` already holds"""
+        raise NotImplementedError
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def _snapshot(self):
+        with self._lock:
+            return [dict(self._base)] + [dict(cells) for cells in self._all.values()]
+
+
+class Counter(_PerThread):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        cells = self._cells()
+        key = self._key(labels)
+        cells[key] = cells.get(key, 0) + amount
+
+    def _merge_into(self, target, cells):
+        for key, value in list(cells.items()):
+            target[key] = target.get(key, 0) + value
+
+    def values(self):
+        merged = {}
+        for cells in self._snapshot():
+            self._merge_into(merged, cells)
+        return merged
+
+    def render(self):
+        name = _sample_name(self.name, self.type)
+        return [f'{name}{_labels(self.labelnames, key)} {_number(value)}' for key, value in sorted(self.values().items())]
+
+
+class Histogram(_PerThread):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        cells = self._cells()
+        key = self._key(labels)
+        cell = cells.get(key)
+        if cell is None:
+            # per-bucket counts (last one is +Inf), sum, count
+            cell = cells[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        cell[0][bisect.bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+        cell[2] += 1
+
+    def _merge_into(self, target, cells):
+        for key, (counts, total, count) in list(cells.items()):
+            # A fresh cell: snapshots of the base share its old ones
+            m = target.get(key) or [[0] * (len(self.buckets) + 1), 0.0, 0]
+            target[key] = [[a + b for a, b in zip(m[0], list(counts))], m[1] + total, m[2] + count]
+
+    def merged(self):
+        merged = {}
+        for cells in self._snapshot():
+            self._merge_into(merged, cells)
+        return merged
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self.merged().items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                le = _labels(self.labelnames, key, [('le', _number(float(bound)))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Gauge:
+    """
+    Value read at scrape time from `fn()`.
+
+    `fn` returns a number, or a dict of label-value tuples to numbers when
+    `labelnames` is set. Use `type='counter'` for totals kept elsewhere.
+    """
+
+    def __init__(self, name, help, fn, labelnames=(), type='gauge'):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def render(self):
+        value = self.fn()
+        if value is None:
+            return []
+        name = _sample_name(self.name, self.type)
+        if not self.labelnames:
+            return [f'{name} {_number(value)}']
+        return [f'{name}{_labels(self.labelnames, key)} {_number(v)}'
+                for key, v in sorted(value.items()) if v is not None]
+
+
+class Summary:
+    """
+    Quantiles computed elsewhere, read at scrape time.
+
+    `fn(quantiles)` returns {label-value tuple: ({quantile: value}, sum, count)}.
+    """
+
+    type = 'summary'
+
+    def __init__(self, name, help, fn, labelnames=(), quantiles=(0.5, 0.9, 0.99)):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.quantiles = tuple(quantiles)
+
+    def render(self):
+        lines = []
+        for key, (values, total, count) in sorted(self.fn(self.quantiles).items()):
+            for q in self.quantiles:
+                if values.get(q) is not None:
+                    labels = _labels(self.labelnames, key, [('quantile', _number(q))])
+                    lines.append(f'{self.name}{labels} {_number(values[q])}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, labelnames=(), type='gauge'):
+        return self.register(Gauge(name, help, fn, labelnames, type))
+
+    def summary(self, name, help, fn, labelnames=(), quantiles=(0.5, 0.9, 0.99)):
+        return self.register(Summary(name, help, fn, labelnames, quantiles))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        out = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                lines = metric.render()
+            except Exception as e:
+                lines = [f'# {metric.name} unavailable: {_escape(e)}']
+            name = _sample_name(metric.name, metric.type)
+            out.append(f'# HELP {name} {metric.help}')
+            out.append(f'# TYPE {name} {metric.type}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+def start_http_server(registry, port, host='0.0.0.0', json_routes=None):
+    """
+    Serve GET /metrics from a daemon thread.
+
+    `json_routes` maps extra paths to `fn(query)` returning something JSON
+    serializable; `query` is the parsed query string ({name: first value}).
+    """
+    json_routes = json_routes or {}
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/metrics':
+                body, content_type = registry.render().encode('utf-8'), CONTENT_TYPE
+            elif url.path in json_routes:
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                body, content_type = json.dumps(json_routes[url.path](query)).encode('utf-8'), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are not worth a log line each
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,175 @@
+"""
+Message tracing shared by pub and sub (each service keeps its own copy).
+
+The publisher stamps every message with `trace_headers()`: a trace ID and its
+wall-clock publish time in nanoseconds. The broker adds its own `timestamp`
+(milliseconds) on arrival, so the consumer can split each message's latency
+into publish -> broker, broker -> consume and end to end. The broker-side
+stages compare clocks of different hosts: keep them NTP-synced, and read
+sub-millisecond values as "under the broker's resolution".
+"""
+import math
+import threading
+import time
+import uuid
+
+TRACE_ID_HEADER = 'trace-id'
+PUBLISH_TS_HEADER = 'publish-ts-ns'
+
+STAGES = ('publish_to_broker', 'broker_to_consume', 'end_to_end')
+
+
+def trace_headers():
+    """Headers to send with a message: a fresh trace ID and the publish time"""
+    return {TRACE_ID_HEADER: uuid.uuid4().hex, PUBLISH_TS_HEADER: str(time.time_ns())}
+
+
+def _int_header(headers, name):
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def stage_latencies(headers, received_ns):
+    """Seconds spent in each stage a message's headers allow measuring (negative skew is clamped to 0)"""
+    published = _int_header(headers, PUBLISH_TS_HEADER)
+    broker_ms = _int_header(headers, 'timestamp')
+    broker = broker_ms * 1_000_000 if broker_ms else None
+    latencies = {}
+    if published is not None and broker is not None:
+        latencies['publish_to_broker'] = max(broker - published, 0) / 1e9
+    if broker is not None:
+        latencies['broker_to_consume'] = max(received_ns - broker, 0) / 1e9
+    if published is not None:
+        latencies['end_to_end'] = max(received_ns - published, 0) / 1e9
+    return latencies
+
+
+class LatencyDistribution:
+    """
+    Log-bucketed latency histogram with about 2% relative error.
+
+    Memory grows with the spread of the values (a few hundred buckets from a
+    microsecond to an hour), not with how many were recorded.
+    """
+
+    SMALLEST = 1e-6
+    GROWTH = 1.04
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = int(math.log(seconds / self.SMALLEST, self.GROWTH)) if seconds > self.SMALLEST else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric middle of the bucket, never above the largest value seen
+                return min(self.SMALLEST * self.GROWTH ** (index + 0.5), self.max)
+        return self.max
+
+    def summary(self):
+        def ms(seconds):
+            return round(seconds * 1000, 3) if seconds is not None else None
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.quantile(0.5)),
+            'p90_ms': ms(self.quantile(0.9)),
+            'p99_ms': ms(self.quantile(0.99)),
+            'max_ms': ms(self.max) if self.count else None,
+        }
+
+
+class LatencyTracker:
+    """
+    Per-destination distributions of each latency stage.
+
+    Besides the totals since start, recent values are kept in two rotating
+    slices of `window_seconds`, so `query(recent=True)` answers "how slow is
+    this queue now" (between one and two windows of data) and shows queueing
+    delay growing with the backlog.
+    """
+
+    def __init__(self, window_seconds=60):
+        self.window = window_seconds
+        self._totals = {}
+        self._previous = {}
+        self._current = {}
+        self._slice_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rotate_locked(self, now):
+        if now - self._slice_started >= self.window:
+            # A slice that ended more than a window ago is stale too
+            stale = now - self._slice_started >= 2 * self.window
+            self._previous = {} if stale else self._current
+            self._current = {}
+            self._slice_started = now
+
+    def record(self, destination, headers, received_ns=None):
+        """Record one message from its headers; returns the stage latencies in seconds"""
+        latencies = stage_latencies(headers, received_ns if received_ns is not None else time.time_ns())
+        if not latencies:
+            return latencies
+        with self._lock:
+            self._rotate_locked(time.monotonic())
+            for stage, seconds in latencies.items():
+                key = (destination, stage)
+                for series in (self._totals, self._current):
+                    distribution = series.get(key)
+                    if distribution is None:
+                        distribution = series[key] = LatencyDistribution()
+                    distribution.record(seconds)
+        return latencies
+
+    def distributions(self, recent=True):
+        """{(destination, stage): LatencyDistribution}, merged copies safe to read"""
+        with self._lock:
+            self._rotate_locked(time.monotonic())
+            sources = (self._previous, self._current) if recent else (self._totals,)
+            merged = {}
+            for series in sources:
+                for key, distribution in series.items():
+                    merged.setdefault(key, LatencyDistribution()).merge(distribution)
+            return merged
+
+    def query(self, destination=None, recent=True):
+        """{destination: {stage: summary}}, optionally for one destination"""
+        result = {}
+        for (dest, stage), distribution in sorted(self.distributions(recent).items()):
+            if destination is None or dest == destination:
+                result.setdefault(dest, {})[stage] = distribution.summary()
+        return result
+
+    def summary_samples(self, quantiles):
+        """Samples for a metrics Summary: recent quantiles, cumulative sum and count"""
+        recent = self.distributions(recent=True)
+        samples = {}
+        for key, total in self.distributions(recent=False).items():
+            distribution = recent.get(key)
+            values = {q: distribution.quantile(q) if distribution else None for q in quantiles}
+            samples[key] = (values, total.total, total.count)
+        return samples
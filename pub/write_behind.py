@@ -0,0 +1,157 @@
+import queue
+import threading
+import time
+from structured_log import get_logger
+
+log = get_logger('write_behind')
+
+
+class BufferFull(Exception):
+    """Raised when the write-behind buffer cannot accept a message in time"""
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process buffer drained to the broker by a background sender thread.
+
+    `submit()` only enqueues, so the HTTP request returns without waiting on the
+    broker. The sender takes up to `batch_size` messages at a time (waiting at most
+    `linger_ms` for a batch to fill) and hands them to `send_batch(bodies)`, which
+    is expected to publish them atomically. Failed batches are retried with backoff
+    and dropped after `max_retries` attempts.
+
+    When the buffer is full, `full_policy` decides what happens to new messages:
+    'block' waits up to `block_timeout` seconds for space, 'reject' fails at once.
+    Either way BufferFull is raised instead of letting memory grow without bound.
+    """
+
+    def __init__(self, send_batch, capacity=10000, batch_size=100, linger_ms=5,
+                 full_policy='block', block_timeout=1.0, max_retries=5):
+        if full_policy not in ('block', 'reject'):
+            raise ValueError(f"full_policy must be 'block' or 'reject', not {full_policy!r}")
+
+        self.send_batch = send_batch
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+
+        self._queue = queue.Queue(maxsize=capacity)
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.accepted = 0
+        self.rejected = 0
+        self.sent = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.drain_rate = 0.0
+        self._rate_window_start = time.monotonic()
+        self._rate_window_sent = 0
+
+        self._thread = threading.Thread(target=self._drain_loop, name='write-behind-sender', daemon=True)
+        self._thread.start()
+
+    def submit(self, body):
+        """Queue a message for sending, applying backpressure when the buffer is full"""
+        if self._stopping.is_set():
+            raise BufferFull("Write-behind buffer is shutting down")
+        try:
+            if self.full_policy == 'block':
+                self._queue.put(body, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(body)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise BufferFull(f"Write-behind buffer full ({self.capacity} messages)")
+        with self._stats_lock:
+            self.accepted += 1
+
+    def _next_batch(self):
+        """Block for the first message, then gather more until the batch is full or linger expires"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send_with_retry(self, batch):
+        delay = 0.1
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.send_batch(batch)
+                return True
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed_batches += 1
+                log.warning(f"Write-behind batch of {len(batch)} failed (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+        return False
+
+    def _drain_loop(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            ok = self._send_with_retry(batch)
+            with self._stats_lock:
+                if ok:
+                    self.sent += len(batch)
+                    self.batches += 1
+                    self._rate_window_sent += len(batch)
+                else:
+                    self.dropped += len(batch)
+                    log.error(f"Dropped {len(batch)} buffered messages after {self.max_retries} attempts")
+            for _ in batch:
+                self._queue.task_done()
+
+    def stats(self):
+        with self._stats_lock:
+            # Drain rate is measured over windows of at least one second
+            now = time.monotonic()
+            elapsed = now - self._rate_window_start
+            if elapsed >= 1.0:
+                self.drain_rate = self._rate_window_sent / elapsed
+                self._rate_window_start = now
+                self._rate_window_sent = 0
+            return {
+                'depth': self._queue.qsize(),
+                'capacity': self.capacity,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'drain_rate_per_sec': round(self.drain_rate, 1),
+                'full_policy': self.full_policy,
+            }
+
+    def close(self, timeout=10.0):
+        """Stop accepting messages and give the sender up to `timeout` seconds to flush"""
+        self._stopping.set()
+        self._thread.join(timeout)
+        remaining = self._queue.qsize()
+        if remaining:
+            log.warning(f"Write-behind buffer closed with {remaining} unsent messages")
@@ -0,0 +1,181 @@
+import threading
+import time
+from structured_log import get_logger
+
+log = get_logger('acker')
+
+ACK_MODES = ('auto', 'client', 'client-individual')
+
+
+def ack_args(frame):
+    """ACK/NACK arguments for a MESSAGE: STOMP 1.2 uses the ack header, 1.1 message-id + subscription"""
+    if 'ack' in frame.headers:
+        return (frame.headers['ack'],)
+    return (frame.headers['message-id'], frame.headers['subscription'])
+
+
+class BatchAcker:
+    """
+    Acknowledges processed messages in batches for one connection.
+
+    `done(frame)` is called after a message has been handled successfully; an
+    ACK goes out once `batch_size` messages are pending or `interval_ms` has
+    passed since the oldest one, whichever comes first. In `client` mode one
+    ACK per subscription, for its newest message, covers everything before it
+    (cumulative); in `client-individual` mode every pending message gets its
+    own ACK frame.
+
+    When messages are processed in parallel they can finish out of order, and a
+    cumulative ACK must never cover a message that is still running. Call
+    `received(frame)` in dispatch order: in `client` mode completed messages are
+    then only released for acknowledgement once every earlier one on the same
+    subscription is done.
+
+    `failed(frame)` flushes what was processed so far and NACKs the message so
+    the broker redelivers it. Anything still pending when the connection drops
+    is simply forgotten - the broker redelivers unacknowledged messages, which
+    is what gives at-least-once delivery. In `auto` mode every call is a no-op.
+
+    `hold(sub_id)` keeps a subscription's acks back until `release(sub_id)`, so
+    the broker stops dispatching to it once its prefetch is used up.
+    """
+
+    def __init__(self, conn, mode='auto', batch_size=100, interval_ms=500):
+        if mode not in ACK_MODES:
+            raise ValueError(f"Unsupported ack mode: {mode} (expected one of {', '.join(ACK_MODES)})")
+        self.conn = conn
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.interval = interval_ms / 1000
+
+        self._pending = []
+        self._oldest = None
+        # client mode: subscription -> {ack args: None (running), True (done) or False (failed)} in dispatch order
+        self._outstanding = {}
+        self._held = set()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.acked = 0
+        self.ack_frames = 0
+        self.nacked = 0
+
+        if mode != 'auto' and self.interval > 0:
+            threading.Thread(target=self._flush_loop, name='ack-flush', daemon=True).start()
+
+    def received(self, frame):
+        if self.mode == 'client':
+            with self._lock:
+                self._outstanding.setdefault(frame.headers.get('subscription'), {})[ack_args(frame)] = None
+
+    def done(self, frame):
+        if self.mode == 'auto':
+            return
+        with self._lock:
+            sub_id, args = frame.headers.get('subscription'), ack_args(frame)
+            outstanding = self._outstanding.get(sub_id, {})
+            if args in outstanding:
+                outstanding[args] = True
+                self._release_locked(sub_id, outstanding)
+            else:
+                self._add_locked(sub_id, args)
+
+    def failed(self, frame):
+        if self.mode == 'auto':
+            return
+        with self._lock:
+            sub_id, args = frame.headers.get('subscription'), ack_args(frame)
+            outstanding = self._outstanding.get(sub_id, {})
+            if args in outstanding:
+                outstanding[args] = False
+                self._release_locked(sub_id, outstanding)
+            else:
+                self._nack_locked(args)
+
+    def _add_locked(self, sub_id, args):
+        if not self._pending:
+            self._oldest = time.monotonic()
+        self._pending.append((sub_id, args))
+        if len(self._pending) >= self.batch_size:
+            self._flush_locked()
+
+    def _nack_locked(self, args):
+        # Ack the good ones first so a cumulative NACK cannot sweep them up
+        self._flush_locked()
+        try:
+            self.conn.nack(*args)
+            self.nacked += 1
+        except Exception as e:
+            log.warning(f"NACK failed: {e}")
+
+    def _release_locked(self, sub_id, outstanding):
+        """Move the finished prefix of one subscription's dispatch order to the pending batch"""
+        while outstanding:
+            args, state = next(iter(outstanding.items()))
+            if state is None:
+                return
+            del outstanding[args]
+            if state:
+                self._add_locked(sub_id, args)
+            else:
+                self._nack_locked(args)
+
+    def hold(self, sub_id):
+        with self._lock:
+            self._held.add(sub_id)
+
+    def release(self, sub_id):
+        """Stop holding a subscription's acks and send them"""
+        with self._lock:
+            self._held.discard(sub_id)
+            self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        pending, self._pending, self._oldest = self._pending, [], None
+        if self._held:
+            held = [(sub_id, args) for sub_id, args in pending if sub_id in self._held]
+            if held:
+                pending = [(sub_id, args) for sub_id, args in pending if sub_id not in self._held]
+                self._pending, self._oldest = held, time.monotonic()
+                if not pending:
+                    return
+        try:
+            if self.mode == 'client':
+                # Cumulative acks are per subscription: ack the newest message of each
+                latest = {}
+                for sub_id, args in pending:
+                    latest[sub_id] = args
+                for args in latest.values():
+                    self.conn.ack(*args)
+                self.ack_frames += len(latest)
+            else:
+                for _, args in pending:
+                    self.conn.ack(*args)
+                self.ack_frames += len(pending)
+        except Exception as e:
+            # Connection is gone; the broker will redeliver
+            log.warning(f"Batched ack failed: {e}")
+            return
+        self.acked += len(pending)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.interval / 2):
+            with self._lock:
+                if self._oldest is not None and time.monotonic() - self._oldest >= self.interval:
+                    self._flush_locked()
+
+    def reset(self):
+        """Drop pending acks after the connection is lost"""
+        with self._lock:
+            self._pending = []
+            self._oldest = None
+            self._outstanding.clear()
+            self._held.clear()
+
+    def close(self):
+        self._closed.set()
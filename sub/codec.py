@@ -0,0 +1,76 @@
+import zlib
+from structured_log import get_logger
+
+log = get_logger('codec')
+
+try:
+    import lz4.frame
+except ImportError:  # lz4 is optional
+    lz4 = None
+
+# STOMP header naming the compression applied to the body
+ENCODING_HEADER = 'content-encoding'
+
+SUPPORTED = ('zlib', 'lz4') if lz4 is not None else ('zlib',)
+
+
+def resolve_compression(name):
+    """Map a configured compression name to one this process can produce"""
+    name = (name or 'none').lower()
+    if name in ('', 'none', 'off', 'false'):
+        return None
+    if name == 'lz4' and lz4 is None:
+        log.warning("lz4 requested but the lz4 package is not installed, using zlib")
+        return 'zlib'
+    if name not in ('zlib', 'lz4'):
+        raise ValueError(f"Unsupported compression: {name}")
+    return name
+
+
+def encode_body(body, compression=None, min_size=1024, level=6):
+    """
+    Return (bytes, headers) ready for conn.send.
+
+    The body is always sent as bytes so stomp.py's automatic content-length counts
+    bytes, not characters, which keeps non-ASCII text and binary payloads framed
+    correctly. Bodies of at least `min_size` bytes are compressed when
+    `compression` is set and the header tells the consumer how to undo it.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if compression is None or len(body) < min_size:
+        return body, {}
+
+    if compression == 'lz4':
+        packed = lz4.frame.compress(body)
+    else:
+        packed = zlib.compress(body, level)
+
+    # Incompressible payloads go out as they are
+    if len(packed) >= len(body):
+        return body, {}
+    return packed, {ENCODING_HEADER: compression}
+
+
+def decode_body(body, headers):
+    """Undo encode_body using the frame headers; always returns bytes"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    encoding = headers.get(ENCODING_HEADER)
+    if not encoding or encoding == 'identity':
+        return body
+    if encoding == 'zlib':
+        return zlib.decompress(body)
+    if encoding == 'lz4':
+        if lz4 is None:
+            raise ValueError("Message is lz4-compressed but the lz4 package is not installed")
+        return lz4.frame.decompress(body)
+    raise ValueError(f"Unknown {ENCODING_HEADER}: {encoding}")
+
+
+def to_text(body):
+    """Render a decoded body for logging; undecodable payloads are summarised"""
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        return f"<{len(body)} bytes binary>"
@@ -1,10 +1,28 @@
 import os
 import time
 import ssl
+import signal
+import threading
 import stomp
 from dotenv import load_dotenv
+from codec import to_text
+from broker_selector import BrokerSelector, BrokerHealthListener, stomp_probe
+from acker import BatchAcker
+from engine import ProcessingEngine
+from subscriptions import load_subscriptions
+from handlers import HANDLERS
+from reconnect import Backoff, ReconnectStats
+from dedup import DedupCache
+from flow_control import FlowController
+from queue_stats import QueueStatsClient
+from metrics import Registry, start_http_server
+from tracing import LatencyTracker
+from structured_log import get_logger, setup_logging, dropped as log_records_dropped
+
+log = get_logger('consumer')
 
 load_dotenv()
+setup_logging()
 ACTIVEMQ_URL = os.getenv('ACTIVEMQ_URL', 'localhost')
 ACTIVEMQ_URL_SECONDARY = os.getenv('ACTIVEMQ_URL_SECONDARY', '')
 PORT = int(os.getenv('ACTIVEMQ_PORT', 61614))
@@ -18,88 +36,454 @@ BROKER_HOSTS_INITIAL = [(ACTIVEMQ_URL, PORT)]
 if ACTIVEMQ_URL_SECONDARY:
     BROKER_HOSTS_INITIAL.append((ACTIVEMQ_URL_SECONDARY, PORT))
 
-# This will be set to the working broker after first successful connection
-WORKING_BROKER = None
+# Broker selection: all hosts are raced on connect, and re-probed in the background
+BROKER_CONNECT_TIMEOUT = float(os.getenv('BROKER_CONNECT_TIMEOUT', 10))
+BROKER_PROBE_INTERVAL = float(os.getenv('BROKER_PROBE_INTERVAL', 30))
+
+# Reconnects start as soon as the connection drops (disconnect or heart-beat timeout);
+# failed attempts back off exponentially with full jitter between 0 and the current ceiling
+RECONNECT_BACKOFF_INITIAL_MS = int(os.getenv('RECONNECT_BACKOFF_INITIAL_MS', 100))
+RECONNECT_BACKOFF_MAX_MS = int(os.getenv('RECONNECT_BACKOFF_MAX_MS', 30000))
+# Heart-beats are what detect a silently dead broker: expect silence to be noticed within ~2x this
+HEARTBEAT_MS = int(os.getenv('CONSUMER_HEARTBEAT_MS', 10000))
+# On SIGTERM the consumer stops taking work, waits up to this long for the work in flight, acks it and unsubscribes
+DRAIN_TIMEOUT = float(os.getenv('CONSUMER_DRAIN_TIMEOUT', 30))
+
+# Subscription tuning. 'auto' acks on dispatch (messages are lost if processing crashes);
+# 'client' / 'client-individual' ack after processing, in batches of N messages or T ms
+ACK_MODE = os.getenv('CONSUMER_ACK_MODE', 'auto').lower()
+PREFETCH = int(os.getenv('CONSUMER_PREFETCH', 1))
+# Default to half the prefetch window so the broker keeps dispatching while acks are in flight
+ACK_BATCH_SIZE = int(os.getenv('CONSUMER_ACK_BATCH_SIZE', max(1, PREFETCH // 2)))
+ACK_INTERVAL_MS = int(os.getenv('CONSUMER_ACK_INTERVAL_MS', 500))
+
+# Message processing runs on a worker pool: 'thread', or 'process' for CPU-bound handlers.
+# Messages with the same ORDER_HEADER value are processed in order, one at a time
+WORKER_MODE = os.getenv('CONSUMER_WORKER_MODE', 'thread').lower()
+WORKERS = int(os.getenv('CONSUMER_WORKERS', 1))
+ORDER_HEADER = os.getenv('CONSUMER_ORDER_HEADER', 'JMSXGroupID')
+# Defaults to max(prefetch, workers * batch size) per subscription
+MAX_IN_FLIGHT = os.getenv('CONSUMER_MAX_IN_FLIGHT')
+# Micro-batching: the handler gets up to BATCH_SIZE messages at once, waiting at most
+# BATCH_LINGER_MS after the first; the batch is acked only if the handler succeeds
+BATCH_SIZE = int(os.getenv('CONSUMER_BATCH_SIZE', 1))
+BATCH_LINGER_MS = int(os.getenv('CONSUMER_BATCH_LINGER_MS', 0))
+
+# Redelivery dedup: skip messages whose DEDUP_KEY_HEADER value was processed recently.
+# The exact LRU holds DEDUP_LRU_SIZE keys; DEDUP_BLOOM_CAPACITY > 0 adds a Bloom tier
+# that covers millions of keys in fixed memory (false-positive rate DEDUP_BLOOM_ERROR_RATE)
+DEDUP = os.getenv('CONSUMER_DEDUP', 'false').lower() == 'true'
+DEDUP_KEY_HEADER = os.getenv('CONSUMER_DEDUP_KEY_HEADER', 'message-id')
+DEDUP_LRU_SIZE = int(os.getenv('CONSUMER_DEDUP_LRU_SIZE', 100000))
+DEDUP_WINDOW_SECONDS = float(os.getenv('CONSUMER_DEDUP_WINDOW_SECONDS', 0))
+DEDUP_BLOOM_CAPACITY = int(os.getenv('CONSUMER_DEDUP_BLOOM_CAPACITY', 0))
+DEDUP_BLOOM_ERROR_RATE = float(os.getenv('CONSUMER_DEDUP_BLOOM_ERROR_RATE', 1e-6))
+
+# Adaptive flow control: every FLOW_INTERVAL_SECONDS the in-flight window, the number of busy
+# workers and the broker prefetch are grown while the queue backlog grows and handler latency
+# holds, and cut back when latency climbs past FLOW_LATENCY_TOLERANCE or memory use passes
+# FLOW_MEMORY_HIGH (a fraction of FLOW_MEMORY_LIMIT_MB, or of the container's limit)
+FLOW_CONTROL = os.getenv('CONSUMER_FLOW_CONTROL', 'false').lower() == 'true'
+FLOW_INTERVAL_SECONDS = float(os.getenv('CONSUMER_FLOW_INTERVAL_SECONDS', 5))
+FLOW_MIN_WINDOW = int(os.getenv('CONSUMER_FLOW_MIN_WINDOW', 1))
+FLOW_MAX_WINDOW = int(os.getenv('CONSUMER_FLOW_MAX_WINDOW', 1000))
+FLOW_MAX_WORKERS = int(os.getenv('CONSUMER_FLOW_MAX_WORKERS', 8))
+FLOW_LATENCY_TOLERANCE = float(os.getenv('CONSUMER_FLOW_LATENCY_TOLERANCE', 0.5))
+FLOW_MEMORY_HIGH = float(os.getenv('CONSUMER_FLOW_MEMORY_HIGH', 0.8))
+FLOW_MEMORY_LIMIT_MB = int(os.getenv('CONSUMER_FLOW_MEMORY_LIMIT_MB', 0))
+# Prefetch can only change by resubscribing, which first waits (up to FLOW_DRAIN_TIMEOUT) for the work in flight
+FLOW_RESUBSCRIBE_SECONDS = float(os.getenv('CONSUMER_FLOW_RESUBSCRIBE_SECONDS', 30))
+FLOW_DRAIN_TIMEOUT = float(os.getenv('CONSUMER_FLOW_DRAIN_TIMEOUT', 10))
+# Queue sizes come from the Statistics plugin; the user needs access to ActiveMQ.Statistics.*
+STATS_USER = os.getenv('CONSUMER_STATS_USERNAME', USER)
+STATS_PASSWORD = os.getenv('CONSUMER_STATS_PASSWORD', PASSWORD)
+
+# Prometheus metrics are served on http://<host>:METRICS_PORT/metrics (0 disables the endpoint)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+# Per-queue publish -> broker -> consume latencies (from the publisher's trace headers). Quantiles
+# cover the last one to two windows; the full distributions are served as JSON on /latency
+LATENCY_WINDOW_SECONDS = float(os.getenv('CONSUMER_LATENCY_WINDOW_SECONDS', 60))
+
+# Several destinations (or wildcards like /queue/orders.>) can share one connection: a comma-separated
+# list, or a JSON list of {"destination", "handler", "workers", "worker_mode", "order_header",
+# "max_in_flight", "prefetch", "batch_size", "linger_ms"} objects. Settings left out fall back to the CONSUMER_* values above
+SUBSCRIPTIONS = load_subscriptions(os.getenv('CONSUMER_SUBSCRIPTIONS') or QUEUE, {
+    'handler': 'print',
+    'workers': WORKERS,
+    'worker_mode': WORKER_MODE,
+    'order_header': ORDER_HEADER,
+    'max_in_flight': MAX_IN_FLIGHT,
+    'prefetch': PREFETCH,
+    'batch_size': BATCH_SIZE,
+    'linger_ms': BATCH_LINGER_MS,
+})
+SUBSCRIPTIONS_BY_ID = {s.id: s for s in SUBSCRIPTIONS}
+# Ids given up when flow control moved a subscription to a new prefetch; late messages for them are left unacked
+retired_ids = set()
+
+min_prefetch = min(s.prefetch for s in SUBSCRIPTIONS)
+if ACK_MODE != 'auto' and ACK_BATCH_SIZE > min_prefetch:
+    # The broker stops dispatching once a subscription's prefetch is unacknowledged
+    log.warning(f"CONSUMER_ACK_BATCH_SIZE={ACK_BATCH_SIZE} exceeds the prefetch of {min_prefetch}, using {min_prefetch}")
+    ACK_BATCH_SIZE = min_prefetch
+
+
+def ack_batch_size():
+    """ACK_BATCH_SIZE, capped at the smallest current prefetch (flow control may have lowered it)"""
+    return max(1, min([ACK_BATCH_SIZE] + [s.prefetch for s in SUBSCRIPTIONS]))
+
+log.debug(f"BROKER_HOSTS_INITIAL configured: {BROKER_HOSTS_INITIAL}")
+
+for subscription in SUBSCRIPTIONS:
+    if subscription.handler not in HANDLERS:
+        raise ValueError(f"Unknown handler '{subscription.handler}' for {subscription.destination} "
+                         f"(available: {', '.join(HANDLERS)})")
+
+
+# Time-to-resubscribe after each lost connection
+reconnect_stats = ReconnectStats()
+
+dedup = DedupCache(DEDUP_LRU_SIZE, DEDUP_WINDOW_SECONDS, DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR_RATE) if DEDUP else None
+
+
+def dedup_key(frame, subscription):
+    """Dedup key for a frame, scoped to its subscription; None when the header is missing"""
+    value = frame.headers.get(DEDUP_KEY_HEADER)
+    if value is None:
+        return None
+    return f"{subscription.key}:{value}"
+
+
+latency = LatencyTracker(LATENCY_WINDOW_SECONDS)
+# Set in main() when CONSUMER_FLOW_CONTROL is on
+flow = None
+
+metrics = Registry()
+consumed_total = metrics.counter('consumer_messages_consumed', "Messages processed successfully", ('destination',))
+failed_total = metrics.counter('consumer_messages_failed', "Messages the handler failed on (NACKed or redelivered)", ('destination',))
+duplicates_total = metrics.counter('consumer_duplicates_skipped', "Redeliveries skipped by the dedup cache", ('destination',))
+processing_seconds = metrics.histogram('consumer_batch_processing_seconds', "Handler time per micro-batch", ('destination',))
+queue_wait_seconds = metrics.histogram('consumer_queue_wait_seconds', "Time a message waited for its worker lane", ('destination',))
+connect_seconds = metrics.histogram('consumer_broker_connect_seconds', "STOMP CONNECT to CONNECTED time", ('broker',))
+resubscribe_seconds = metrics.histogram('consumer_resubscribe_seconds', "Time from a lost connection to being subscribed again")
+metrics.gauge('consumer_reconnects', "Reconnects after a lost connection", lambda: reconnect_stats.reconnects, type='counter')
+metrics.gauge('consumer_reconnect_failures', "Failed connection attempts", lambda: reconnect_stats.failed_attempts, type='counter')
+metrics.gauge('consumer_in_flight', "Messages queued or running in the worker pool", lambda: {
+    (s.destination,): s.engine.in_flight for s in SUBSCRIPTIONS if s.engine is not None}, ('destination',))
+metrics.gauge('consumer_dedup_hit_ratio', "Share of dedup lookups that found a recent key",
+              lambda: dedup.stats()['hit_ratio'] if dedup is not None else None)
+metrics.summary('consumer_message_latency_seconds', "Message latency by stage: publish_to_broker, broker_to_consume, end_to_end",
+                latency.summary_samples, ('destination', 'stage'))
+metrics.gauge('consumer_flow_window', "In-flight window chosen by flow control", lambda: {
+    (s.subscription.destination,): s.window for s in flow.states} if flow else None, ('destination',))
+metrics.gauge('consumer_flow_concurrency', "Workers allowed to run at once", lambda: {
+    (s.subscription.destination,): s.concurrency for s in flow.states} if flow else None, ('destination',))
+metrics.gauge('consumer_prefetch', "Broker prefetch of each subscription", lambda: {
+    (s.destination,): s.prefetch for s in SUBSCRIPTIONS}, ('destination',))
+metrics.gauge('consumer_memory_usage_ratio', "Resident memory against the limit flow control uses",
+              lambda: flow.memory if flow else None)
+metrics.gauge('log_records_dropped', "Log records dropped because the log queue was full", log_records_dropped, type='counter')
+
+
+def batch_observer(subscription):
+    """Engine `on_batch` callback feeding the metrics for one subscription"""
+    destination = subscription.destination
+
+    def on_batch(size, failed, run_seconds, wait_seconds):
+        consumed_total.inc(size - failed, destination=destination)
+        if failed:
+            failed_total.inc(failed, destination=destination)
+        processing_seconds.observe(run_seconds, destination=destination)
+        for seconds in wait_seconds:
+            queue_wait_seconds.observe(seconds, destination=destination)
+    return on_batch
 
-print(f"[DEBUG] BROKER_HOSTS_INITIAL configured: {BROKER_HOSTS_INITIAL}")
 
 class ConsumerListener(stomp.ConnectionListener):
+    def __init__(self, acker):
+        self.acker = acker
+        # Set once this connection is the one in use (race losers are disconnected quietly)
+        self.active = False
+        self.lost = threading.Event()
+        self.lost_at = None
+    def connection_lost(self, reason):
+        if self.active and not self.lost.is_set():
+            self.lost_at = time.monotonic()
+            log.warning(f"Connection lost ({reason})")
+            self.lost.set()
     def on_error(self, frame):
-        print(f"[ERROR] {frame.body}")
+        log.error("Broker ERROR frame", body=to_text(frame.body or b''), message=frame.headers.get('message'))
     def on_connected(self, frame):
-        print("[INFO] Connected")
+        log.info("Connected")
     def on_disconnected(self):
-        print("[INFO] Disconnected")
+        log.info("Disconnected")
+        # Unacked messages go back to the queue on the broker side
+        self.acker.reset()
+        self.acker.close()
+        self.connection_lost('disconnected')
+    def on_heartbeat_timeout(self):
+        self.connection_lost('heart-beat timeout')
     def on_message(self, frame):
-        print(f"[CONSUMED] {frame.body}")
+        received_ns = time.time_ns()
+        sub_id = frame.headers.get('subscription')
+        if sub_id in retired_ids:
+            # Being moved to a new prefetch: the broker redelivers this on the new subscription
+            log.debug(f"Leaving message {frame.headers.get('message-id')} for the new subscription")
+            return
+        subscription = SUBSCRIPTIONS_BY_ID.get(sub_id)
+        if subscription is None:
+            log.warning(f"Message {frame.headers.get('message-id')} for unknown subscription {frame.headers.get('subscription')}")
+            return
+        latency.record(frame.headers.get('destination'), frame.headers, received_ns)
+        # Acks are sent by the acker once the worker has finished with the message
+        self.acker.received(frame)
+        if dedup is not None:
+            key = dedup_key(frame, subscription)
+            if key is not None and dedup.seen(key):
+                log.info("Skipping duplicate", category='duplicate', key=frame.headers.get(DEDUP_KEY_HEADER),
+                         destination=frame.headers.get('destination'))
+                duplicates_total.inc(destination=subscription.destination)
+                self.acker.done(frame)
+                return
+            subscription.engine.submit(frame, lambda f: self.completed(f, subscription), self.acker.failed)
+            return
+        subscription.engine.submit(frame, self.acker.done, self.acker.failed)
+    def completed(self, frame, subscription):
+        # Only record keys once processing succeeded, so failed messages are retried
+        key = dedup_key(frame, subscription)
+        if key is not None:
+            dedup.record(key)
+        self.acker.done(frame)
+
+def open_connection(host, port):
+    """Connect a consumer connection (listener attached) to one specific broker"""
+    conn = stomp.Connection([(host, port)], heartbeats=(HEARTBEAT_MS, HEARTBEAT_MS), auto_decode=False, reconnect_attempts_max=1)
+
+    if USE_SSL:
+        conn.set_ssl(for_hosts=[(host, port)], ssl_version=ssl.PROTOCOL_TLS)
+
+    conn.set_listener('', ConsumerListener(BatchAcker(conn, ACK_MODE, ack_batch_size(), ACK_INTERVAL_MS)))
+    conn.set_listener('broker-health', BrokerHealthListener(broker_selector, host, port))
+    started = time.monotonic()
+    conn.connect(USER, PASSWORD, wait=True, headers={'heart-beat': f'{HEARTBEAT_MS},{HEARTBEAT_MS}'})
+    connect_seconds.observe(time.monotonic() - started, broker=f'{host}:{port}')
+    return conn
+
+
+broker_selector = BrokerSelector(
+    BROKER_HOSTS_INITIAL,
+    open_connection,
+    probe_fn=stomp_probe(USER, PASSWORD, USE_SSL, BROKER_CONNECT_TIMEOUT),
+    connect_timeout=BROKER_CONNECT_TIMEOUT,
+    probe_interval=BROKER_PROBE_INTERVAL,
+)
+
+
+# Connection in use, and the lock that keeps (re)subscribing in one thread at a time
+connection = None
+subscribe_lock = threading.Lock()
+
+
+def subscribe(conn, subscription):
+    conn.subscribe(destination=subscription.destination, id=subscription.id, ack=ACK_MODE,
+                   headers={'activemq.prefetchSize': str(subscription.prefetch)})
+
 
 def connect_and_subscribe():
-    """Connect to broker - uses discovered working broker if known, otherwise tries each one"""
-    global WORKING_BROKER
-
-    # If we already know which broker works, use only that one
-    if WORKING_BROKER:
-        broker_hosts = [WORKING_BROKER]
-        print(f"[INFO] Connecting to known working broker: {WORKING_BROKER[0]}:{WORKING_BROKER[1]} (SSL: {USE_SSL})")
-        print(f"[INFO] Queue: {QUEUE}")
-
-        conn = stomp.Connection(broker_hosts, heartbeats=(10000, 10000))
-        if USE_SSL:
-            conn.set_ssl(for_hosts=broker_hosts, ssl_version=ssl.PROTOCOL_TLS)
-        conn.set_listener('', ConsumerListener())
-        conn.connect(USER, PASSWORD, wait=True, headers={'heart-beat': '10000,10000'})
-        conn.subscribe(destination=QUEUE, id=1, ack='auto', headers={'activemq.prefetchSize': '1'})
-        print("[INFO] Successfully subscribed")
-        return conn
-
-    # First time - try each broker individually to discover which one works
-    print(f"[INFO] Discovering working broker... (SSL: {USE_SSL})")
-    print(f"[INFO] Queue: {QUEUE}")
-
-    for host, port in BROKER_HOSTS_INITIAL:
-        try:
-            print(f"[INFO] Trying broker: {host}:{port}")
-            conn = stomp.Connection([(host, port)], heartbeats=(10000, 10000))
+    """Connect to the best available broker (all hosts are tried concurrently) and subscribe"""
+    global connection
+    log.info(f"Connecting... (SSL: {USE_SSL})")
 
-            if USE_SSL:
-                conn.set_ssl(for_hosts=[(host, port)], ssl_version=ssl.PROTOCOL_TLS)
+    conn = broker_selector.connect()
+    with subscribe_lock:
+        for subscription in SUBSCRIPTIONS:
+            subscribe(conn, subscription)
+        connection = conn
+    log.info(f"Successfully subscribed to {len(SUBSCRIPTIONS)} destination(s) (ack: {ACK_MODE})")
+    listener = conn.get_listener('')
+    listener.active = True
+    if not conn.is_connected():
+        # Dropped before the listener was watching for it
+        listener.connection_lost('disconnected')
+    return conn
 
-            conn.set_listener('', ConsumerListener())
-            conn.connect(USER, PASSWORD, wait=True, headers={'heart-beat': '10000,10000'})
 
-            # Success! Save this broker and subscribe
-            WORKING_BROKER = (host, port)
-            print(f"[INFO] Discovered working broker: {host}:{port}")
+def wait_for_idle(subscription, timeout):
+    deadline = time.monotonic() + timeout
+    while subscription.engine.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not subscription.engine.in_flight
 
-            conn.subscribe(destination=QUEUE, id=1, ack='auto', headers={'activemq.prefetchSize': '1'})
-            print("[INFO] Successfully subscribed")
-            return conn
+
+def quiesce(subscription, acker, timeout, abandon=True):
+    """
+    Let a subscription's work in flight finish and stop taking more (client ack modes).
+
+    Acks are held first, so the broker stops dispatching once the prefetch is
+    used up. If the work does not finish within `timeout` and `abandon` is set,
+    the acks are released and False is returned. Otherwise the subscription id
+    is retired - messages still arriving on it are left unacked for the broker
+    to redeliver - and the acks go out.
+    """
+    sub_id = subscription.id
+    acker.hold(sub_id)
+    if not wait_for_idle(subscription, timeout) and abandon:
+        acker.release(sub_id)
+        return False
+    retired_ids.add(sub_id)
+    # Anything submitted just before the id was retired
+    wait_for_idle(subscription, timeout)
+    acker.release(sub_id)
+    return True
+
+
+def resubscribe(subscription, prefetch):
+    """
+    Move a live subscription to a new prefetch; STOMP cannot change it in place.
+
+    The subscription is quiesced (the move is abandoned if that takes longer
+    than FLOW_DRAIN_TIMEOUT) and replaced by one with a new id; the broker
+    redelivers the messages left unacked to it. In auto mode nothing is
+    unacked, so the swap is immediate and messages still arriving on the old id
+    are processed as usual.
+    """
+    with subscribe_lock:
+        conn = connection
+        if conn is None or not conn.is_connected() or stopping.is_set():
+            return False
+        acker = conn.get_listener('').acker
+        old_id = subscription.id
+        if ACK_MODE != 'auto' and not quiesce(subscription, acker, FLOW_DRAIN_TIMEOUT):
+            log.warning(f"Not moving {subscription.destination} to prefetch {prefetch}: "
+                        f"work in flight did not finish within {FLOW_DRAIN_TIMEOUT}s")
+            return False
+        try:
+            conn.unsubscribe(id=old_id)
+            subscription.id = subscription.next_id()
+            subscription.prefetch = prefetch
+            SUBSCRIPTIONS_BY_ID[subscription.id] = subscription
+            subscribe(conn, subscription)
         except Exception as e:
-            print(f"[INFO] Broker {host}:{port} failed, trying next...")
-            continue
+            # The connection is going away; the reconnect subscribes with the new settings
+            log.warning(f"Resubscribing {subscription.destination} failed: {e}")
+        acker.batch_size = ack_batch_size()
+        return True
 
-    # If we get here, all brokers failed
-    raise Exception("Failed to connect to any broker")
+
+# Set by SIGTERM: drain and exit instead of reconnecting
+stopping = threading.Event()
+
+
+def request_stop(signum, frame):
+    log.info("Stop requested, draining")
+    stopping.set()
+    if connection is not None:
+        # Wakes the main loop
+        connection.get_listener('').lost.set()
+
+
+def drain_and_stop(conn):
+    """Finish the work in flight, acknowledge it, unsubscribe and disconnect"""
+    if flow is not None:
+        flow.stop()
+    with subscribe_lock:
+        acker = conn.get_listener('').acker
+        if conn.is_connected() and ACK_MODE != 'auto':
+            # Hold every subscription first so none keeps receiving while the others drain
+            for subscription in SUBSCRIPTIONS:
+                acker.hold(subscription.id)
+            for subscription in SUBSCRIPTIONS:
+                if not quiesce(subscription, acker, DRAIN_TIMEOUT, abandon=False):
+                    log.warning(f"{subscription.destination}: work still running after {DRAIN_TIMEOUT}s, "
+                                f"the broker will redeliver it")
+        for subscription in SUBSCRIPTIONS:
+            try:
+                conn.unsubscribe(id=subscription.id)
+            except Exception:
+                pass
+    try:
+        conn.disconnect()
+    except Exception:
+        pass
+    # In auto mode queued messages are already acknowledged: finish them before leaving
+    for subscription in SUBSCRIPTIONS:
+        subscription.engine.close()
+    log.info(f"Drained, processed {sum(s.engine.processed for s in SUBSCRIPTIONS)} message(s)")
 
 def main():
-    conn = None
-    while True:
+    global flow
+    # Worker pools are started here, not at import, so process workers are not forked early
+    for subscription in SUBSCRIPTIONS:
+        handler = HANDLERS[subscription.handler](subscription)
+        # With flow control, lanes for up to FLOW_MAX_WORKERS are started and `workers` of them run at first
+        lanes = max(subscription.workers, FLOW_MAX_WORKERS) if FLOW_CONTROL else subscription.workers
+        subscription.engine = ProcessingEngine(handler, lanes, subscription.worker_mode,
+                                               subscription.order_header, subscription.max_in_flight,
+                                               subscription.batch_size, subscription.linger_ms,
+                                               on_batch=batch_observer(subscription),
+                                               concurrency=subscription.workers)
+        log.info(f"Subscription: {subscription.describe()}")
+
+    if FLOW_CONTROL:
+        stats_client = QueueStatsClient(
+            lambda: [broker_selector.working_broker or BROKER_HOSTS_INITIAL[0]],
+            STATS_USER, STATS_PASSWORD, USE_SSL)
+        flow = FlowController(SUBSCRIPTIONS, stats_client.queue_size, resubscribe, FLOW_INTERVAL_SECONDS,
+                              FLOW_MIN_WINDOW, FLOW_MAX_WINDOW, 1, FLOW_MAX_WORKERS, FLOW_LATENCY_TOLERANCE,
+                              FLOW_MEMORY_HIGH, FLOW_MEMORY_LIMIT_MB * 1024 * 1024, FLOW_RESUBSCRIBE_SECONDS)
+        flow.start()
+        log.info(f"Flow control on (window {FLOW_MIN_WINDOW}-{FLOW_MAX_WINDOW}, up to {FLOW_MAX_WORKERS} workers, "
+                 f"every {FLOW_INTERVAL_SECONDS:g}s)")
+
+    if METRICS_PORT:
+        start_http_server(metrics, METRICS_PORT, json_routes={
+            # ?destination=/queue/x for one queue, ?window=total for everything since start
+            '/latency': lambda query: latency.query(query.get('destination'), query.get('window') != 'total'),
+            '/flow': lambda query: flow.stats() if flow else {'enabled': False},
+        })
+        log.info(f"Metrics on http://0.0.0.0:{METRICS_PORT}/metrics (latencies on /latency)")
+
+    signal.signal(signal.SIGTERM, request_stop)
+
+    backoff = Backoff(RECONNECT_BACKOFF_INITIAL_MS / 1000, RECONNECT_BACKOFF_MAX_MS / 1000)
+    lost_at = None
+    while not stopping.is_set():
         try:
             conn = connect_and_subscribe()
-            while conn.is_connected():
-                time.sleep(10)
-            print("[INFO] Connection lost, will retry...")
         except Exception as e:
-            print(f"[RETRY] Connection failed: {e}")
-            if conn:
-                try:
-                    conn.disconnect()
-                except:
-                    pass
-                conn = None
-        finally:
-            print("[INFO] Retrying in 3 seconds...")
-            time.sleep(3)
+            reconnect_stats.record_failure()
+            delay = backoff.next_delay()
+            log.warning(f"Connection failed: {e}")
+            log.info(f"Retrying in {delay:.2f} seconds...")
+            time.sleep(delay)
+            continue
+
+        backoff.reset()
+        if lost_at is not None:
+            seconds = time.monotonic() - lost_at
+            reconnect_stats.record(seconds)
+            resubscribe_seconds.observe(seconds)
+            log.info(f"Resubscribed {seconds:.3f}s after the connection was lost", category='reconnect',
+                     resubscribe_seconds=round(seconds, 3))
+
+        # Sleep until the listener reports a disconnect or heart-beat timeout, or SIGTERM
+        listener = conn.get_listener('')
+        if stopping.is_set():
+            listener.lost.set()
+        listener.lost.wait()
+        if stopping.is_set():
+            drain_and_stop(conn)
+            break
+        lost_at = listener.lost_at
+        if broker_selector.working_broker:
+            broker_selector.mark_failed(*broker_selector.working_broker)
+        try:
+            conn.disconnect()
+        except:
+            pass
+
+        # Jitter even the first attempt so consumers that lost the same broker don't reconnect in lockstep
+        time.sleep(backoff.next_delay())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+def fingerprint(key):
+    """128-bit digest of a key as two 64-bit ints: fixed size however long the ID is"""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over fingerprints (double hashing for the k probes)"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _probes(self, fp):
+        h1, h2 = fp
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, fp):
+        for bit in self._probes(fp):
+            self.array[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def __contains__(self, fp):
+        return all(self.array[bit >> 3] & (1 << (bit & 7)) for bit in self._probes(fp))
+
+
+class DedupCache:
+    """
+    Remembers recently processed message keys so redeliveries can be skipped.
+
+    Two tiers, both keyed by the 16-byte `fingerprint()` of the key:
+
+    - an LRU of the last `lru_size` keys, optionally limited to the last
+      `window_seconds`. It stores only the first 8 bytes of the fingerprint
+      (a collision needs billions of live keys). A hit counts as a use: it
+      moves the key to the young end and restarts its window, so a message
+      that keeps being redelivered stays remembered;
+    - an optional Bloom tier for much larger windows. Two filters of
+      `bloom_capacity` keys each rotate (the older is dropped when the newer
+      fills up, or after `window_seconds`), so it always covers between one
+      and two capacities of recent keys in fixed memory. A hit here may be a
+      false positive at roughly `bloom_error_rate`.
+
+    Keys are recorded with `record()` once processing has completed, so a
+    message that failed is not mistaken for a duplicate when it comes back.
+    """
+
+    def __init__(self, lru_size=100000, window_seconds=0, bloom_capacity=0, bloom_error_rate=1e-6):
+        self.lru_size = lru_size
+        self.window = window_seconds
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+
+        self._lru = OrderedDict()
+        self._bloom = [BloomFilter(bloom_capacity, bloom_error_rate)] if bloom_capacity else []
+        self._bloom_started = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.bloom_hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def _expire_locked(self, now):
+        if self.window:
+            while self._lru:
+                fp, at = next(iter(self._lru.items()))
+                if now - at < self.window:
+                    break
+                del self._lru[fp]
+
+    def seen(self, key):
+        """True if `key` was recorded recently; counts a hit or a miss"""
+        fp = fingerprint(key)
+        now = time.monotonic()
+        with self._lock:
+            self._expire_locked(now)
+            if fp[0] in self._lru:
+                # Refresh the time as well: expiry walks the LRU from the old end
+                self._lru[fp[0]] = now
+                self._lru.move_to_end(fp[0])
+                self.hits += 1
+                return True
+            if any(fp in bloom for bloom in self._bloom):
+                self.bloom_hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def record(self, key):
+        fp = fingerprint(key)
+        now = time.monotonic()
+        with self._lock:
+            self._lru[fp[0]] = now
+            self._lru.move_to_end(fp[0])
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+            if self._bloom:
+                current = self._bloom[-1]
+                if current.count >= self.bloom_capacity or (self.window and now - self._bloom_started >= self.window):
+                    current = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+                    self._bloom = [self._bloom[-1], current]
+                    self._bloom_started = now
+                current.add(fp)
+            self.recorded += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.bloom_hits + self.misses
+            return {
+                'hits': self.hits,
+                'bloom_hits': self.bloom_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.bloom_hits) / lookups if lookups else None,
+                'recorded': self.recorded,
+                'lru_entries': len(self._lru),
+                'bloom_bytes': sum(len(b.array) for b in self._bloom),
+            }
@@ -0,0 +1,221 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from structured_log import get_logger
+
+log = get_logger('engine')
+
+WORKER_MODES = ('thread', 'process')
+
+_STOP = object()
+
+
+class Limiter:
+    """Counting semaphore whose limit can be changed while it is in use"""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.used >= self.limit:
+                self._cond.wait()
+            self.used += 1
+
+    def release(self, count=1):
+        with self._cond:
+            self.used -= count
+            self._cond.notify(count)
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+
+class ProcessingEngine:
+    """
+    Runs message handlers off the stomp.py receiver thread.
+
+    Work is spread over `workers` lanes. Each lane is one thread that handles
+    its messages strictly in arrival order, and messages sharing a value of
+    `order_header` (JMSXGroupID by default) always go to the same lane, so
+    per-group ordering holds while different groups run in parallel. Messages
+    without the header go to the least busy lane.
+
+    Lanes hand the handler micro-batches: `handler([(body, headers), ...])`
+    runs once `batch_size` messages are waiting or `linger_ms` has passed since
+    the first, and returns the indexes of messages that failed on their own
+    (raising fails the whole batch). With the defaults every batch holds one
+    message.
+
+    In `process` mode the lane threads hand each batch to a process pool of the
+    same size, so CPU-bound handlers use several cores while lanes still keep
+    groups in order. The handler must then be picklable.
+
+    At most `max_in_flight` messages are queued or running; `submit()` blocks
+    the receiver thread beyond that, which pushes back on the broker. At most
+    `concurrency` lanes (default: all of them) run a batch at the same time.
+    Both limits can be changed on the fly with `set_limits()`. The
+    `on_done` / `on_failed` callbacks run once the handler has finished the
+    batch, so acknowledgements are only sent for committed work.
+
+    `on_batch(size, failed, run_seconds, wait_seconds)` is called after each
+    batch for metrics: `run_seconds` is the handler time and `wait_seconds`
+    lists how long each message queued before its batch started.
+    """
+
+    def __init__(self, handler, workers=1, mode='thread', order_header='JMSXGroupID', max_in_flight=1,
+                 batch_size=1, linger_ms=0, on_batch=None, concurrency=None):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"Unsupported worker mode: {mode} (expected one of {', '.join(WORKER_MODES)})")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.order_header = order_header
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_size = max(1, batch_size)
+        self.linger = linger_ms / 1000
+        self.on_batch = on_batch
+
+        self.concurrency = min(self.workers, max(1, concurrency or self.workers))
+
+        self._window = Limiter(self.max_in_flight)
+        self._running = Limiter(self.concurrency)
+        self._lanes = [queue.Queue() for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        # Handler time summed over all batches, for latency and utilisation
+        self.run_seconds = 0.0
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers) if mode == 'process' else None
+        self._threads = []
+        for index, lane in enumerate(self._lanes):
+            t = threading.Thread(target=self._lane_loop, args=(lane,), name=f'worker-lane-{index}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _lane_for(self, headers):
+        key = headers.get(self.order_header)
+        if key is not None:
+            return self._lanes[hash(key) % self.workers]
+        # Ungrouped: shortest queue, ties broken round-robin
+        start = next(self._round_robin) % self.workers
+        order = self._lanes[start:] + self._lanes[:start]
+        return min(order, key=lambda lane: lane.qsize())
+
+    def submit(self, frame, on_done=None, on_failed=None):
+        """Queue a frame for processing; blocks while the in-flight window is full"""
+        self._window.acquire()
+        with self._lock:
+            self.in_flight += 1
+        self._lane_for(frame.headers).put((frame, on_done, on_failed, time.monotonic()))
+
+    def _next_batch(self, lane):
+        """Wait for a message, then collect more until the batch is full or has lingered long enough"""
+        item = lane.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = lane.get(timeout=remaining) if remaining > 0 else lane.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, batch):
+        messages = [(frame.body, dict(frame.headers)) for frame, _, _, _ in batch]
+        if self._executor is not None:
+            return self._executor.submit(self.handler, messages).result()
+        return self.handler(messages)
+
+    def _lane_loop(self, lane):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch(lane)
+            if not batch:
+                continue
+            self._running.acquire()
+            started = time.monotonic()
+            try:
+                failed = set(self._run(batch) or ())
+            except Exception as e:
+                log.error(f"Handler failed for a batch of {len(batch)} "
+                      f"(first message {batch[0][0].headers.get('message-id')}): {e}")
+                failed = set(range(len(batch)))
+            finished = time.monotonic()
+            self._running.release()
+            with self._lock:
+                self.processed += len(batch) - len(failed)
+                self.failed += len(failed)
+                self.batches += 1
+                self.run_seconds += finished - started
+            try:
+                if self.on_batch is not None:
+                    try:
+                        self.on_batch(len(batch), len(failed), finished - started,
+                                      [started - submitted for _, _, _, submitted in batch])
+                    except Exception as e:
+                        log.warning(f"Batch metrics callback failed: {e}")
+                # Completion callbacks run in arrival order so the acker sees the batch as dispatched
+                for index, (frame, on_done, on_failed, _) in enumerate(batch):
+                    callback = on_failed if index in failed else on_done
+                    if callback is not None:
+                        try:
+                            callback(frame)
+                        except Exception as e:
+                            log.warning(f"Completion callback failed: {e}")
+            finally:
+                # Only now is the batch out of flight: wait_for_idle() must not see 0 before acker.done() ran
+                with self._lock:
+                    self.in_flight -= len(batch)
+                self._window.release(len(batch))
+
+    def set_limits(self, max_in_flight=None, concurrency=None):
+        """Resize the in-flight window and/or the number of lanes that may run at once"""
+        if max_in_flight is not None:
+            self.max_in_flight = max(1, max_in_flight)
+            self._window.set_limit(self.max_in_flight)
+        if concurrency is not None:
+            self.concurrency = min(self.workers, max(1, concurrency))
+            self._running.set_limit(self.concurrency)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'workers': self.workers,
+                'concurrency': self.concurrency,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'processed': self.processed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'run_seconds': self.run_seconds,
+                'batch_size': self.batch_size,
+                'lane_depths': [lane.qsize() for lane in self._lanes],
+            }
+
+    def close(self, wait=True):
+        """Finish queued work, then stop the lanes (and the process pool)"""
+        for lane in self._lanes:
+            lane.put(_STOP)
+        if wait:
+            for t in self._threads:
+                t.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from structured_log import get_logger
+
+log = get_logger('flow-control')
+
+
+def _cgroup_memory_limit():
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def memory_usage(limit_bytes=None):
+    """Resident memory of this process as a fraction of `limit_bytes` (or the cgroup limit); None if unknown"""
+    limit = limit_bytes or _cgroup_memory_limit()
+    if not limit:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / limit
+
+
+class FlowState:
+    """Controller state for one subscription"""
+
+    def __init__(self, subscription, window, concurrency):
+        self.subscription = subscription
+        self.window = window
+        self.concurrency = concurrency
+        # Per-message handler time the subscription is expected to run at
+        self.baseline = None
+        self.last_size = None
+        self.last_processed = subscription.engine.processed
+        self.last_run_seconds = subscription.engine.run_seconds
+        self.last_resubscribe = time.monotonic()
+
+    def as_dict(self):
+        return {
+            'window': self.window,
+            'concurrency': self.concurrency,
+            'prefetch': self.subscription.prefetch,
+            'baseline_ms': round(self.baseline * 1000, 3) if self.baseline is not None else None,
+            'queue_size': self.last_size,
+        }
+
+
+class FlowController:
+    """
+    Tunes each subscription's in-flight window, worker concurrency and broker
+    prefetch from what it observes every `interval` seconds.
+
+    - Latency is the handler time per message over the last interval,
+      compared against a slowly moving baseline.
+    - Backlog is the queue `size` reported by the Statistics plugin.
+    - Memory is this process's resident size against the configured (or
+      cgroup) limit.
+
+    While latency stays within `latency_tolerance` of its baseline and the
+    backlog is growing (or more than a window deep), the window grows by half
+    and, if the lanes are busy, one more lane may run. When latency climbs
+    past the tolerance or memory passes `memory_high`, both are halved / cut
+    by one, so the controller backs off faster than it pushes.
+
+    Prefetch follows the window, but STOMP cannot change it on a live
+    subscription: `resubscribe(subscription, prefetch)` moves the
+    subscription, and is only asked to once the wanted prefetch differs from
+    the current one by half or more, at most every `resubscribe_every`
+    seconds.
+    """
+
+    def __init__(self, subscriptions, queue_size_fn, resubscribe=None, interval=5.0,
+                 min_window=1, max_window=1000, min_concurrency=1, max_concurrency=8,
+                 latency_tolerance=0.5, memory_high=0.8, memory_limit_bytes=None, resubscribe_every=30.0):
+        self.queue_size_fn = queue_size_fn
+        self.resubscribe = resubscribe
+        self.interval = interval
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, max_window)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.latency_tolerance = latency_tolerance
+        self.memory_high = memory_high
+        self.memory_limit_bytes = memory_limit_bytes
+        self.resubscribe_every = resubscribe_every
+
+        self.states = []
+        for subscription in subscriptions:
+            engine = subscription.engine
+            window = min(self.max_window, max(self.min_window, engine.max_in_flight))
+            concurrency = min(engine.workers, self.max_concurrency, max(self.min_concurrency, engine.concurrency))
+            engine.set_limits(window, concurrency)
+            self.states.append(FlowState(subscription, window, concurrency))
+
+        self.memory = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='flow-control', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                log.warning(f"Flow control tick failed: {e}")
+
+    def tick(self):
+        self.memory = memory_usage(self.memory_limit_bytes)
+        memory_pressure = self.memory is not None and self.memory >= self.memory_high
+        for state in self.states:
+            self._adjust(state, memory_pressure)
+
+    def _adjust(self, state, memory_pressure):
+        subscription = state.subscription
+        engine = subscription.engine
+        processed, run_seconds = engine.processed, engine.run_seconds
+        messages = processed - state.last_processed
+        busy = run_seconds - state.last_run_seconds
+        state.last_processed, state.last_run_seconds = processed, run_seconds
+
+        size = self.queue_size_fn(subscription.destination)
+        growing = size is not None and state.last_size is not None and size > state.last_size
+        deep = size is not None and size > state.window
+        if size is not None:
+            state.last_size = size
+
+        latency = busy / messages if messages else None
+        if latency is not None and state.baseline is None:
+            state.baseline = latency
+        slow = latency is not None and latency > state.baseline * (1 + self.latency_tolerance)
+        # Share of the interval the allowed lanes spent in the handler
+        utilisation = busy / (self.interval * state.concurrency)
+
+        window, concurrency = state.window, state.concurrency
+        if memory_pressure or slow:
+            window = max(self.min_window, window // 2)
+            concurrency = max(self.min_concurrency, concurrency - 1)
+            reason = 'memory' if memory_pressure else 'latency'
+            if slow:
+                # Drift towards a new normal so a lasting slowdown does not pin the window at its minimum
+                state.baseline *= 1.1
+        elif (growing or deep) and latency is not None:
+            window = min(self.max_window, window + max(1, window // 2))
+            if utilisation > 0.7:
+                concurrency = min(self.max_concurrency, engine.workers, concurrency + 1)
+            reason = 'backlog'
+        else:
+            reason = None
+        if latency is not None and not slow:
+            state.baseline = 0.8 * state.baseline + 0.2 * latency
+
+        if (window, concurrency) != (state.window, state.concurrency):
+            log.info(f"{subscription.destination}: window {state.window} -> {window}, "
+                     f"concurrency {state.concurrency} -> {concurrency} ({reason})", category='flow',
+                     destination=subscription.destination, queue_size=size,
+                     latency_ms=round(latency * 1000, 3) if latency is not None else None,
+                     memory=round(self.memory, 3) if self.memory is not None else None)
+            state.window, state.concurrency = window, concurrency
+            engine.set_limits(window, concurrency)
+
+        self._maybe_resubscribe(state)
+
+    def _maybe_resubscribe(self, state):
+        subscription = state.subscription
+        if self.resubscribe is None or time.monotonic() - state.last_resubscribe < self.resubscribe_every:
+            return
+        current = subscription.prefetch
+        if abs(state.window - current) * 2 < current:
+            return
+        state.last_resubscribe = time.monotonic()
+        if self.resubscribe(subscription, state.window):
+            log.info(f"{subscription.destination}: prefetch {current} -> {state.window}", category='flow',
+                     destination=subscription.destination)
+
+    def stats(self):
+        return {
+            'memory': round(self.memory, 3) if self.memory is not None else None,
+            'subscriptions': {s.subscription.destination: s.as_dict() for s in self.states},
+        }
@@ -0,0 +1,153 @@
+import itertools
+import ssl
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+import stomp
+from structured_log import get_logger
+
+log = get_logger('queue-stats')
+
+STATISTICS_DESTINATION_PREFIX = 'ActiveMQ.Statistics.Destination.'
+
+# jms-map-xml value elements and how to read them
+_TYPES = {'long': int, 'int': int, 'short': int, 'byte': int, 'double': float, 'float': float,
+          'boolean': lambda text: text == 'true'}
+
+
+def parse_map_xml(body):
+    """Entries of a jms-map-xml MapMessage body as a dict, with numeric values converted"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    stats = {}
+    for entry in ET.fromstring(body).iter('entry'):
+        children = list(entry)
+        if len(children) < 2 or children[0].tag != 'string' or not children[0].text:
+            continue
+        value = children[1]
+        text = value.text if value.text is not None else ''
+        try:
+            stats[children[0].text] = _TYPES.get(value.tag, str)(text)
+        except ValueError:
+            stats[children[0].text] = text
+    return stats
+
+
+def queue_name(destination):
+    """Statistics plugin name of a STOMP queue destination, None for topics and temp destinations"""
+    if destination.startswith('/queue/'):
+        return destination[len('/queue/'):]
+    return None
+
+
+class _ReplyListener(stomp.ConnectionListener):
+    def __init__(self, client):
+        self.client = client
+
+    def on_message(self, frame):
+        self.client._reply(frame)
+
+    def on_disconnected(self):
+        self.client._lost()
+
+
+class QueueStatsClient:
+    """
+    Asks ActiveMQ's StatisticsBrokerPlugin for queue statistics.
+
+    Uses its own connection (opened on first use, reopened after it drops), so
+    statistics requests never get in the way of message delivery on the
+    consumer connection. Each request carries a correlation-id and the replies
+    (one per matching queue for wildcards) are collected until `timeout`, or
+    until the first one for a plain queue name.
+    """
+
+    def __init__(self, hosts_fn, user, password, use_ssl=False, timeout=2.0):
+        self.hosts_fn = hosts_fn
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+
+        self._conn = None
+        self._reply_to = None
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._ids = itertools.count(1)
+
+    def _connect_locked(self):
+        if self._conn is not None and self._conn.is_connected():
+            return self._conn
+        hosts = self.hosts_fn()
+        conn = stomp.Connection(hosts, heartbeats=(10000, 10000), auto_decode=False, reconnect_attempts_max=1)
+        if self.use_ssl:
+            conn.set_ssl(for_hosts=hosts, ssl_version=ssl.PROTOCOL_TLS)
+        conn.set_listener('', _ReplyListener(self))
+        conn.connect(self.user, self.password, wait=True, headers={'heart-beat': '10000,10000'})
+        self._reply_to = f'/temp-queue/consumer.stats.{uuid.uuid4().hex[:8]}'
+        conn.subscribe(destination=self._reply_to, id='stats', ack='auto')
+        self._conn = conn
+        return conn
+
+    def _reply(self, frame):
+        request = self._requests.get(frame.headers.get('correlation-id'))
+        if request is None:
+            return
+        try:
+            stats = parse_map_xml(frame.body)
+        except ET.ParseError as e:
+            log.warning(f"Unreadable statistics reply: {e}")
+            return
+        replies, done, wildcard = request
+        replies.append(stats)
+        if not wildcard:
+            done.set()
+
+    def _lost(self):
+        for _, done, _ in list(self._requests.values()):
+            done.set()
+
+    def query(self, name):
+        """Statistics for queue `name` (wildcards allowed): {queue name: stats}, or None if the broker did not answer"""
+        correlation_id = f'stats-{next(self._ids)}'
+        wildcard = '>' in name or '*' in name
+        replies, done = [], threading.Event()
+        self._requests[correlation_id] = (replies, done, wildcard)
+        try:
+            with self._lock:
+                conn = self._connect_locked()
+                conn.send(destination=f'/queue/{STATISTICS_DESTINATION_PREFIX}{name}', body='',
+                          headers={'reply-to': self._reply_to, 'correlation-id': correlation_id})
+            done.wait(self.timeout)
+        except Exception as e:
+            log.warning(f"Statistics request for {name} failed: {e}")
+            return None
+        finally:
+            self._requests.pop(correlation_id, None)
+        if not replies:
+            return None
+        result = {}
+        for stats in replies:
+            destination = str(stats.get('destinationName', ''))
+            if destination.startswith('queue://'):
+                result[destination[len('queue://'):]] = stats
+        return result
+
+    def queue_size(self, destination):
+        """Messages waiting on a queue destination (summed over a wildcard), None if unknown"""
+        name = queue_name(destination)
+        if name is None:
+            return None
+        stats = self.query(name)
+        if stats is None:
+            return None
+        return sum(int(s.get('size', 0)) for s in stats.values())
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn.is_connected():
+                try:
+                    self._conn.disconnect()
+                except Exception:
+                    pass
+            self._conn = None
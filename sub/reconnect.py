@@ -0,0 +1,59 @@
+import random
+import threading
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter.
+
+    Each delay is drawn uniformly from [0, min(max_delay, initial * 2**attempt)],
+    so a fleet of consumers that lost the same broker spreads its reconnects
+    out instead of arriving together. `reset()` after a successful connect.
+    """
+
+    def __init__(self, initial=0.1, max_delay=30.0, multiplier=2.0):
+        self.initial = initial
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.attempt = 0
+
+    def next_delay(self):
+        ceiling = min(self.max_delay, self.initial * self.multiplier ** self.attempt)
+        self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ReconnectStats:
+    """Time from noticing a lost connection to being subscribed again"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reconnects = 0
+        self.failed_attempts = 0
+        self.last_seconds = None
+        self.max_seconds = 0.0
+        self.total_seconds = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self.reconnects += 1
+            self.last_seconds = seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.total_seconds += seconds
+
+    def record_failure(self):
+        with self._lock:
+            self.failed_attempts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'reconnects': self.reconnects,
+                'failed_attempts': self.failed_attempts,
+                'last_resubscribe_seconds': self.last_seconds,
+                'max_resubscribe_seconds': self.max_seconds,
+                'avg_resubscribe_seconds': self.total_seconds / self.reconnects if self.reconnects else None,
+            }
@@ -0,0 +1,264 @@
+"""
+Non-blocking structured logging shared by pub, sub and monitor (each service keeps its own copy).
+
+    log = get_logger('consumer')
+    log.info("Consumed message", category='consumed', destination=dest, body=text)
+
+Records are put on a bounded queue and formatted and written by a background
+thread, several lines per write, so the message path never waits on stdout or
+the docker log driver. When the queue is full, records are dropped and counted
+instead of blocking. The writer reports the drop count.
+
+Configuration (environment):
+    LOG_FORMAT          json (default) or text ("[INFO] message key=value")
+    LOG_LEVEL           minimum level (default INFO)
+    LOG_SAMPLE          per-category sampling, e.g. "consumed=100,werkzeug=10" keeps 1 in N
+    LOG_SAMPLE_LEVELS   per-level sampling, e.g. "debug=50"
+    LOG_QUEUE_SIZE      records buffered before dropping (default 10000)
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+# Keyword arguments that belong to logging itself rather than the record's fields
+_LOGGING_KWARGS = ('exc_info', 'stack_info', 'stacklevel')
+# Most records written in one go by the background writer
+_WRITE_BATCH = 512
+
+
+def _parse_rates(raw):
+    rates = {}
+    for part in (raw or '').split(','):
+        if '=' in part:
+            key, _, value = part.partition('=')
+            rates[key.strip().lower()] = max(1, int(value))
+    return rates
+
+
+class Sampler:
+    """Keeps 1 in N records per category and per level (deterministic, lock-free counters)"""
+
+    def __init__(self, categories, levels):
+        self.categories = categories
+        self.levels = levels
+        self._counters = {}
+
+    def _keep(self, key, every):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+        return next(counter) % every == 0
+
+    def keep(self, level_name, category):
+        every = self.levels.get(level_name)
+        if every and not self._keep(('level', level_name), every):
+            return False
+        every = self.categories.get(category) if category else None
+        if every and not self._keep(('category', category), every):
+            return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        category = getattr(record, 'category', None)
+        if category:
+            entry['category'] = category
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The services' original "[LEVEL] message" lines (INFO records tagged with their category), fields appended"""
+
+    def format(self, record):
+        category = getattr(record, 'category', None)
+        tag = category.upper() if category and record.levelno == logging.INFO else record.levelname
+        line = f"[{tag}] {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Samples records from other libraries (werkzeug access logs, stomp.py) by logger name"""
+
+    def __init__(self, sampler):
+        super().__init__()
+        self.sampler = sampler
+
+    def filter(self, record):
+        if hasattr(record, 'fields'):
+            # Came through StructuredLogger, already sampled
+            return True
+        return self.sampler.keep(record.levelname.lower(), record.name)
+
+
+class BackgroundHandler(logging.Handler):
+    """Queues records for a writer thread; never blocks the caller"""
+
+    def __init__(self, stream=None, capacity=10000):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.capacity = capacity
+        self.dropped = 0
+        self._reported = 0
+        self._start()
+
+    def _start(self):
+        self.queue = queue.Queue(self.capacity)
+        self._thread = threading.Thread(target=self._writer_loop, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def restart_after_fork(self):
+        # Threads do not survive fork(); worker processes get their own writer
+        self.dropped = self._reported = 0
+        self._start()
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < _WRITE_BATCH:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(records)
+            for _ in records:
+                self.queue.task_done()
+
+    def _write(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if self.dropped != self._reported:
+            lines.append(self.format(logging.makeLogRecord({
+                'name': 'logging', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Log queue full, dropped {self.dropped - self._reported} record(s)",
+            })))
+            self._reported = self.dropped
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        except Exception:
+            pass
+
+    def flush_pending(self, timeout=2.0):
+        """Wait until everything queued so far has been written"""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.queue.all_tasks_done.wait(remaining)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger taking structured fields as keyword arguments.
+
+    Sampling happens here, before a LogRecord is even created, so sampled-out
+    records cost almost nothing on the hot path. The logging layer is set up on
+    the first record, after the service has loaded its .env file.
+    """
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def log(self, level, msg, *args, category=None, **kwargs):
+        if _handler is None:
+            setup_logging()
+        if not self.logger.isEnabledFor(level):
+            return
+        if not _sampler.keep(logging.getLevelName(level).lower(), category):
+            return
+        options = {k: kwargs.pop(k) for k in _LOGGING_KWARGS if k in kwargs}
+        self.logger.log(level, msg, *args, extra={'category': category, 'fields': kwargs}, **options)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        kwargs.setdefault('exc_info', True)
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+_handler = None
+_sampler = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """Route the root logger (and so third-party loggers) through the background writer"""
+    global _handler, _sampler
+    with _setup_lock:
+        if _handler is not None:
+            return _handler
+        _sampler = Sampler(_parse_rates(os.getenv('LOG_SAMPLE')), _parse_rates(os.getenv('LOG_SAMPLE_LEVELS')))
+        handler = BackgroundHandler(capacity=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+        text = os.getenv('LOG_FORMAT', 'json').lower() == 'text'
+        handler.setFormatter(TextFormatter() if text else JsonFormatter())
+        handler.addFilter(SamplingFilter(_sampler))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+        if root.level > logging.DEBUG:
+            # stomp.py narrates every connect at INFO; keep its warnings and errors only
+            logging.getLogger('stomp.py').setLevel(max(root.level, logging.WARNING))
+        os.register_at_fork(after_in_child=handler.restart_after_fork)
+        atexit.register(handler.flush_pending)
+        _handler = handler
+        return handler
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name))
+
+
+def flush(timeout=2.0):
+    """Block until queued records are written, e.g. before printing a report to stdout"""
+    if _handler is not None:
+        _handler.flush_pending(timeout)
+
+
+def dropped():
+    """Records dropped because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
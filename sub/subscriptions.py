@@ -0,0 +1,76 @@
+import json
+
+
+class Subscription:
+    """One destination (or wildcard) subscribed on the shared connection"""
+
+    def __init__(self, sub_id, destination, handler='print', workers=1, worker_mode='thread',
+                 order_header='JMSXGroupID', max_in_flight=None, prefetch=1, batch_size=1, linger_ms=0):
+        # `id` is the STOMP subscription id, which changes when the subscription is moved
+        # to a new prefetch; `key` stays the same for the life of the process
+        self.key = self.id = str(sub_id)
+        self.generation = 0
+        self.destination = destination
+        self.handler = handler
+        self.workers = int(workers)
+        self.worker_mode = worker_mode
+        self.order_header = order_header
+        self.prefetch = int(prefetch)
+        self.batch_size = int(batch_size)
+        self.linger_ms = int(linger_ms)
+        # Room for every lane to fill a batch
+        default_in_flight = max(self.prefetch, self.workers * self.batch_size)
+        self.max_in_flight = int(max_in_flight) if max_in_flight is not None else default_in_flight
+        # Set by the consumer once the worker pool is started
+        self.engine = None
+
+    def next_id(self):
+        self.generation += 1
+        return f'{self.key}.{self.generation}'
+
+    def describe(self):
+        return (f"{self.destination} (id {self.id}, handler: {self.handler}, {self.workers} {self.worker_mode} "
+                f"worker(s), prefetch: {self.prefetch}, max in flight: {self.max_in_flight}, "
+                f"batch: {self.batch_size} msgs / {self.linger_ms} ms)")
+
+
+FIELDS = ('destination', 'handler', 'workers', 'worker_mode', 'order_header', 'max_in_flight', 'prefetch',
+          'batch_size', 'linger_ms')
+
+
+def parse_entries(raw, extra_fields=()):
+    """
+    Subscription entries of CONSUMER_SUBSCRIPTIONS as dicts.
+
+    `raw` is either a JSON list of objects with a `destination` and any of the
+    optional keys in FIELDS (or `extra_fields`), or a comma-separated list of
+    destinations.
+    """
+    raw = (raw or '').strip()
+    if raw.startswith('['):
+        entries = json.loads(raw)
+    else:
+        entries = [{'destination': d.strip()} for d in raw.split(',') if d.strip()]
+
+    allowed = set(FIELDS) | set(extra_fields)
+    parsed = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'destination': entry}
+        unknown = set(entry) - allowed
+        if unknown:
+            raise ValueError(f"Unknown subscription setting(s) {', '.join(sorted(unknown))} in {entry}")
+        if not entry.get('destination'):
+            raise ValueError(f"Subscription without a destination: {entry}")
+        parsed.append(entry)
+    return parsed
+
+
+def load_subscriptions(raw, defaults):
+    """Build the subscription list from CONSUMER_SUBSCRIPTIONS; missing keys come from `defaults` (the single-queue settings)"""
+    subscriptions = []
+    for index, entry in enumerate(parse_entries(raw), start=1):
+        settings = dict(defaults)
+        settings.update(entry)
+        subscriptions.append(Subscription(index, **settings))
+    return subscriptions
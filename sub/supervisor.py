@@ -0,0 +1,321 @@
+"""
+Runs consumer.py as N processes and scales N with the queues.
+
+CONSUMER_SUBSCRIPTIONS entries are run by process groups: all of them by one
+group unless entries name a "process_group". Every process of a group
+subscribes to all of the group's queues over its one connection (the
+multiplexed consumer), so the default is one process and one connection, as
+without the supervisor. Topic entries go to the group's first ("primary")
+process only, since every subscriber of a topic gets every message.
+
+Each interval the group's queue statistics are read from the Statistics plugin,
+and N is set from the summed backlog (`size`) and arrival and drain rates
+(`enqueueCount` / `dequeueCount` deltas), between SUPERVISOR_MIN_PROCESSES and
+SUPERVISOR_MAX_PROCESSES. Processes that exit are restarted; processes scaled
+away get SIGTERM, which makes the consumer finish its work in flight, ack it and
+unsubscribe.
+"""
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+from queue_stats import QueueStatsClient, queue_name
+from reconnect import Backoff
+from subscriptions import parse_entries
+from metrics import Registry, start_http_server
+from structured_log import get_logger, setup_logging
+
+log = get_logger('supervisor')
+
+load_dotenv()
+setup_logging()
+ACTIVEMQ_URL = os.getenv('ACTIVEMQ_URL', 'localhost')
+ACTIVEMQ_URL_SECONDARY = os.getenv('ACTIVEMQ_URL_SECONDARY', '')
+PORT = int(os.getenv('ACTIVEMQ_PORT', 61614))
+USER = os.getenv('ACTIVEMQ_USERNAME', 'admin')
+PASSWORD = os.getenv('ACTIVEMQ_PASSWORD', 'admin')
+QUEUE = os.getenv('ACTIVEMQ_QUEUE', '/queue/test-queue')
+USE_SSL = os.getenv('USE_SSL', 'true').lower() == 'true'
+STATS_USER = os.getenv('CONSUMER_STATS_USERNAME', USER)
+STATS_PASSWORD = os.getenv('CONSUMER_STATS_PASSWORD', PASSWORD)
+
+BROKER_HOSTS = [(ACTIVEMQ_URL, PORT)]
+if ACTIVEMQ_URL_SECONDARY:
+    BROKER_HOSTS.append((ACTIVEMQ_URL_SECONDARY, PORT))
+
+# Consumer processes per group; entries may override them with "min_processes" / "max_processes"
+MIN_PROCESSES = int(os.getenv('SUPERVISOR_MIN_PROCESSES', 1))
+MAX_PROCESSES = int(os.getenv('SUPERVISOR_MAX_PROCESSES', 4))
+INTERVAL_SECONDS = float(os.getenv('SUPERVISOR_INTERVAL_SECONDS', 10))
+# Enough processes to keep up with arrivals and clear the current backlog within this long
+TARGET_DRAIN_SECONDS = float(os.getenv('SUPERVISOR_TARGET_DRAIN_SECONDS', 60))
+# Scale down only after this many intervals in a row wanted fewer processes, one process at a time
+SCALE_DOWN_INTERVALS = int(os.getenv('SUPERVISOR_SCALE_DOWN_INTERVALS', 3))
+# A draining process is killed if it has not exited this long after SIGTERM
+STOP_TIMEOUT = float(os.getenv('SUPERVISOR_STOP_TIMEOUT', float(os.getenv('CONSUMER_DRAIN_TIMEOUT', 30)) + 15))
+
+# The supervisor's own metrics; consumer processes serve theirs on consecutive ports from
+# CONSUMER_METRICS_PORT_BASE (0 turns the consumers' endpoints off)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+CONSUMER_METRICS_PORT_BASE = int(os.getenv('CONSUMER_METRICS_PORT_BASE', 0))
+
+CONSUMER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'consumer.py')
+# A process that exits sooner than this after starting is restarted with backoff
+MIN_UPTIME_SECONDS = 10
+
+
+def desired_processes(current, size, arrival, drained, capacity, min_processes, max_processes):
+    """
+    Processes a group needs, from its backlog and rates.
+
+    `capacity` is what one process drains per second, learnt while the queue
+    was backlogged (None until then). Without it the group grows one process at
+    a time while the backlog does not shrink.
+    """
+    if not size and not arrival:
+        wanted = min_processes
+    elif capacity:
+        wanted = math.ceil((arrival + size / TARGET_DRAIN_SECONDS) / capacity)
+    elif size and arrival >= drained:
+        wanted = current + 1
+    else:
+        wanted = current
+    return min(max_processes, max(min_processes, wanted))
+
+
+SUPERVISOR_FIELDS = ('min_processes', 'max_processes', 'process_group')
+
+
+class ConsumerGroup:
+    """The consumer processes running one set of subscription entries"""
+
+    def __init__(self, name, entries, min_processes, max_processes):
+        self.name = name
+        # The consumer gets the entries without the supervisor's own settings
+        self.entries = [{k: v for k, v in e.items() if k not in SUPERVISOR_FIELDS} for e in entries]
+        # Scaled processes run the queue entries; topics only go to the primary
+        self.queue_entries = [e for e in self.entries if queue_name(e['destination']) is not None]
+        self.queues = [queue_name(e['destination']) for e in self.queue_entries]
+        # Entry overrides apply to the whole group; the largest one wins
+        self.min = max(0, max((int(e['min_processes']) for e in entries if 'min_processes' in e), default=min_processes))
+        self.max = max(self.min, max((int(e['max_processes']) for e in entries if 'max_processes' in e), default=max_processes))
+        if not self.queues and self.max > 1:
+            # Every subscriber of a topic gets every message: more processes would only duplicate work
+            log.warning(f"Group {self.name} has no queues, running a single process")
+            self.min, self.max = min(self.min, 1), 1
+        self.target = self.min
+
+        # [(process, started monotonic, metrics port, primary)]; processes being drained -> SIGTERM time
+        self.processes = []
+        self.draining = {}
+        self.backoff = Backoff(1.0, 60.0)
+        self.restart_at = 0.0
+
+        # Last statistics sample (monotonic, size, enqueueCount, dequeueCount, processes) and what one process drains per second
+        self.last = None
+        self.capacity = None
+        self.below = 0
+        self.rates = {}
+
+    def observe(self, stats, now):
+        """Update the target from a statistics sample of the group's queues ({queue: stats}, or None if the broker did not answer)"""
+        if not stats:
+            return
+        size = sum(int(s.get('size', 0)) for s in stats.values())
+        enqueued = sum(int(s.get('enqueueCount', 0)) for s in stats.values())
+        dequeued = sum(int(s.get('dequeueCount', 0)) for s in stats.values())
+        running = len(self.processes)
+        previous, self.last = self.last, (now, size, enqueued, dequeued, running)
+        if previous is None:
+            return
+        elapsed = now - previous[0]
+        if elapsed <= 0 or enqueued < previous[2] or dequeued < previous[3]:
+            # Counters went backwards: the broker restarted
+            return
+        arrival = (enqueued - previous[2]) / elapsed
+        drained = (dequeued - previous[3]) / elapsed
+        self.rates = {'size': size, 'arrival_per_second': round(arrival, 3), 'drain_per_second': round(drained, 3)}
+
+        # Only a backlogged, unchanged set of processes shows what a process can do
+        if size and previous[1] and running and running == previous[4]:
+            per_process = drained / running
+            self.capacity = per_process if self.capacity is None else 0.7 * self.capacity + 0.3 * per_process
+
+        wanted = desired_processes(running, size, arrival, drained, self.capacity, self.min, self.max)
+        if wanted > self.target:
+            self.below = 0
+            self._retarget(wanted, size, arrival, drained)
+        elif wanted < self.target:
+            self.below += 1
+            if self.below >= SCALE_DOWN_INTERVALS:
+                self.below = 0
+                self._retarget(self.target - 1, size, arrival, drained)
+        else:
+            self.below = 0
+
+    def _retarget(self, target, size, arrival, drained):
+        log.info(f"{self.name}: {self.target} -> {target} process(es)", category='scale',
+                 group=self.name, size=size, arrival_per_second=round(arrival, 3),
+                 drain_per_second=round(drained, 3),
+                 capacity_per_process=round(self.capacity, 3) if self.capacity is not None else None)
+        self.target = target
+
+    def supervise(self, ports, now):
+        """Reap exited processes, then start or drain processes until the target is met"""
+        for entry in list(self.processes):
+            process, started, port, _ = entry
+            if process.poll() is None:
+                continue
+            self.processes.remove(entry)
+            ports.discard(port)
+            log.warning(f"{self.name}: consumer {process.pid} exited with {process.returncode}", group=self.name)
+            if now - started < MIN_UPTIME_SECONDS:
+                self.restart_at = now + self.backoff.next_delay()
+            else:
+                self.backoff.reset()
+        for process, stopped in list(self.draining.items()):
+            if process.poll() is not None:
+                del self.draining[process]
+                log.info(f"{self.name}: consumer {process.pid} drained", category='scale',
+                         group=self.name, seconds=round(now - stopped, 3))
+            elif now - stopped > STOP_TIMEOUT:
+                log.warning(f"{self.name}: consumer {process.pid} still running {STOP_TIMEOUT}s "
+                            f"after SIGTERM, killing it", group=self.name)
+                process.kill()
+
+        while len(self.processes) > self.target:
+            # Keep the primary (and with it the topic subscriptions) for last
+            secondary = [e for e in self.processes if not e[3]]
+            entry = secondary[-1] if secondary else self.processes[-1]
+            self.processes.remove(entry)
+            self.drain(entry, ports, now)
+        while len(self.processes) < self.target and now >= self.restart_at:
+            self.processes.append(self.start(ports, now))
+
+    def start(self, ports, now):
+        # A replacement for a primary that exited becomes the primary
+        primary = not any(e[3] for e in self.processes)
+        entries = self.entries if primary else self.queue_entries
+        env = dict(os.environ, CONSUMER_SUBSCRIPTIONS=json.dumps(entries), METRICS_PORT='0')
+        port = 0
+        if CONSUMER_METRICS_PORT_BASE:
+            port = next(p for p in range(CONSUMER_METRICS_PORT_BASE, CONSUMER_METRICS_PORT_BASE + 65536)
+                        if p not in ports)
+            ports.add(port)
+            env['METRICS_PORT'] = str(port)
+        # Own session, so Ctrl-C reaches only the supervisor, which then drains the consumers
+        process = subprocess.Popen([sys.executable, CONSUMER], env=env, start_new_session=True)
+        log.info(f"{self.name}: started consumer {process.pid}", group=self.name, primary=primary,
+                 destinations=len(entries), metrics_port=port or None)
+        return process, now, port, primary
+
+    def drain(self, entry, ports, now):
+        process, _, port, _ = entry
+        ports.discard(port)
+        if process.poll() is None:
+            log.info(f"{self.name}: draining consumer {process.pid}", category='scale', group=self.name)
+            process.send_signal(signal.SIGTERM)
+            self.draining[process] = now
+
+    def as_dict(self):
+        return {
+            'destinations': [e['destination'] for e in self.entries],
+            'target': self.target,
+            'running': len(self.processes),
+            'draining': len(self.draining),
+            'min': self.min,
+            'max': self.max,
+            'capacity_per_process': round(self.capacity, 3) if self.capacity is not None else None,
+            **self.rates,
+        }
+
+
+def build_groups(entries):
+    """One ConsumerGroup per distinct "process_group" (entries without one share the "default" group)"""
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(str(entry.get('process_group', 'default')), []).append(entry)
+    return [ConsumerGroup(name, group_entries, MIN_PROCESSES, MAX_PROCESSES) for name, group_entries in grouped.items()]
+
+
+GROUPS = build_groups(parse_entries(os.getenv('CONSUMER_SUBSCRIPTIONS') or QUEUE, extra_fields=SUPERVISOR_FIELDS))
+
+metrics = Registry()
+metrics.gauge('supervisor_consumer_processes', "Consumer processes running per group", lambda: {
+    (g.name,): len(g.processes) for g in GROUPS}, ('group',))
+metrics.gauge('supervisor_consumer_processes_target', "Consumer processes wanted per group", lambda: {
+    (g.name,): g.target for g in GROUPS}, ('group',))
+metrics.gauge('supervisor_consumer_processes_draining', "Consumer processes finishing their work after SIGTERM", lambda: {
+    (g.name,): len(g.draining) for g in GROUPS}, ('group',))
+
+stopping = threading.Event()
+
+
+def request_stop(signum, frame):
+    stopping.set()
+
+
+def stop_all(ports):
+    """Drain every consumer and wait for them to exit"""
+    now = time.monotonic()
+    for group in GROUPS:
+        group.target = 0
+        while group.processes:
+            group.drain(group.processes.pop(), ports, now)
+    while any(group.draining for group in GROUPS):
+        time.sleep(0.2)
+        for group in GROUPS:
+            group.supervise(ports, time.monotonic())
+
+
+def group_stats(stats_client, queues):
+    """Statistics of every queue of a group as one {queue: stats}; None if any queue went unanswered"""
+    merged = {}
+    for queue in queues:
+        stats = stats_client.query(queue)
+        if not stats:
+            return None
+        merged.update(stats)
+    return merged
+
+
+def main():
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    stats_client = QueueStatsClient(lambda: BROKER_HOSTS, STATS_USER, STATS_PASSWORD, USE_SSL)
+    if METRICS_PORT:
+        start_http_server(metrics, METRICS_PORT, json_routes={
+            '/supervisor': lambda query: {g.name: g.as_dict() for g in GROUPS},
+        })
+        log.info(f"Metrics on http://0.0.0.0:{METRICS_PORT}/metrics (groups on /supervisor)")
+    for group in GROUPS:
+        log.info(f"Supervising group {group.name}: {group.min}-{group.max} consumer process(es)",
+                 destinations=', '.join(e['destination'] for e in group.entries))
+
+    ports = set()
+    next_check = time.monotonic()
+    while not stopping.is_set():
+        now = time.monotonic()
+        if now >= next_check:
+            next_check = now + INTERVAL_SECONDS
+            for group in GROUPS:
+                if group.queues:
+                    group.observe(group_stats(stats_client, group.queues), time.monotonic())
+        for group in GROUPS:
+            group.supervise(ports, time.monotonic())
+        stopping.wait(1.0)
+
+    log.info("Stopping: draining consumers")
+    stop_all(ports)
+    stats_client.close()
+    log.info("All consumers stopped")
+
+
+if __name__ == "__main__":
+    main()
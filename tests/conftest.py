@@ -0,0 +1,62 @@
+"""
+Tests run offline against bench/stomp_broker.py's StandInBroker.
+
+Every service directory is a standalone set of modules (pub/, sub/, monitor/),
+so they go on sys.path the way each service's own working directory would put
+them. The modules they share (metrics, structured_log, ...) are identical
+copies, so one session can import them all.
+"""
+import os
+import sys
+import time
+
+import pytest
+import stomp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('bench', 'monitor', 'sub', 'pub'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from stomp_broker import StandInBroker  # noqa: E402
+
+
+@pytest.fixture
+def broker():
+    """A stand-in broker on a free port, running on its own thread"""
+    broker = StandInBroker(port=0)
+    broker.start_in_thread()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def connect(broker):
+    """Open stomp.py connections to the stand-in broker; all are closed after the test"""
+    connections = []
+
+    def connect(**kwargs):
+        conn = stomp.Connection([(broker.host, broker.port)], **kwargs)
+        conn.connect('test', 'test', wait=True)
+        connections.append(conn)
+        return conn
+
+    yield connect
+    for conn in connections:
+        if conn.is_connected():
+            conn.disconnect()
+
+
+def queue_stats(broker, name):
+    """The stand-in broker's statistics for one queue (what ActiveMQ.Statistics.Destination would return)"""
+    return broker.call(lambda: broker.destination_stats(broker.destination('queue', name)))
+
+
+def wait_until(condition, timeout=5.0, interval=0.01):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
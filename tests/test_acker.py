@@ -0,0 +1,70 @@
+from stomp.utils import Frame
+
+from acker import BatchAcker
+
+
+class RecordingConnection:
+    """Stands in for a stomp.py connection: records ACK/NACK frames"""
+
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+
+    def ack(self, *args):
+        self.acks.append(args[0])
+
+    def nack(self, *args):
+        self.nacks.append(args[0])
+
+
+def message(ack_id, subscription='1'):
+    return Frame('MESSAGE', {'ack': ack_id, 'subscription': subscription, 'message-id': f'ID:{ack_id}'})
+
+
+def test_cumulative_ack_waits_for_the_finished_prefix():
+    conn = RecordingConnection()
+    acker = BatchAcker(conn, 'client', batch_size=3, interval_ms=0)
+    frames = [message(str(i)) for i in range(1, 5)]
+    for frame in frames:
+        acker.received(frame)
+
+    # 2 and 3 finish while 1 is still running: a cumulative ACK of 3 would also cover 1
+    acker.done(frames[2])
+    acker.done(frames[1])
+    acker.flush()
+    assert conn.acks == []
+
+    acker.done(frames[0])
+    assert conn.acks == ['3']
+    acker.done(frames[3])
+    acker.flush()
+    assert conn.acks == ['3', '4']
+    assert acker.acked == 4 and acker.ack_frames == 2
+
+
+def test_failed_message_is_nacked_after_acking_the_ones_before_it():
+    conn = RecordingConnection()
+    acker = BatchAcker(conn, 'client', batch_size=100, interval_ms=0)
+    frames = [message(str(i)) for i in range(1, 4)]
+    for frame in frames:
+        acker.received(frame)
+
+    acker.failed(frames[1])
+    acker.done(frames[0])
+    assert conn.acks == ['1'] and conn.nacks == ['2']
+
+    acker.done(frames[2])
+    acker.flush()
+    assert conn.acks == ['1', '3']
+
+
+def test_held_subscription_keeps_its_acks_until_released():
+    conn = RecordingConnection()
+    acker = BatchAcker(conn, 'client-individual', batch_size=1, interval_ms=0)
+    acker.hold('1')
+    acker.done(message('a', '1'))
+    acker.done(message('b', '2'))
+    assert conn.acks == ['b']
+
+    acker.release('1')
+    assert conn.acks == ['b', 'a']
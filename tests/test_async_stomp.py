@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from async_stomp import AsyncStompClient, AsyncStompConnection, StompError, encode_frame
+from stomp_broker import StandInBroker
+
+
+@pytest.fixture
+def heartbeat_broker():
+    broker = StandInBroker(port=0, heartbeats=(300, 300), users={'producer': 'p:a\\ss'})
+    broker.start_in_thread()
+    yield broker
+    broker.stop()
+
+
+def test_idle_producer_survives_on_heart_beats(heartbeat_broker):
+    async def run():
+        conn = AsyncStompConnection(heartbeat_broker.host, heartbeat_broker.port, 'producer', 'p:a\\ss',
+                                    use_ssl=False, heartbeat_ms=300)
+        await conn.connect()
+        try:
+            # Receipts off: nothing but heart-beat EOLs arrives for several receive timeouts
+            await asyncio.sleep(2.0)
+            assert conn.connected
+            await conn.send('/queue/async.idle', 'still here', receipt=True)
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+    assert heartbeat_broker.call(lambda: heartbeat_broker.destination('queue', 'async.idle').enqueue_count) == 1
+
+
+def test_silent_broker_is_detected():
+    async def run():
+        async def silent(reader, writer):
+            # Promise heart-beats every 100 ms, then send nothing
+            await reader.readuntil(b'\x00')
+            writer.write(b'CONNECTED\nversion:1.2\nheart-beat:100,100\n\n\x00')
+            await writer.drain()
+            await asyncio.sleep(5)
+
+        server = await asyncio.start_server(silent, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        conn = AsyncStompConnection('127.0.0.1', port, 'u', 'p', use_ssl=False, heartbeat_ms=100)
+        await conn.connect()
+        try:
+            await asyncio.sleep(0.6)
+            assert not conn.connected
+            with pytest.raises(StompError):
+                await conn.send('/queue/x', 'lost')
+        finally:
+            await conn.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_connect_headers_are_not_escaped():
+    frame = encode_frame('CONNECT', {'login': 'a:b', 'passcode': 'c\\d'})
+    assert b'login:a:b\n' in frame and b'passcode:c\\d\n' in frame
+
+    frame = encode_frame('SEND', {'destination': '/queue/x', 'note': 'a:b'})
+    assert b'note:a\\cb\n' in frame
+
+
+def test_client_races_brokers_and_reports_lost_connections(broker):
+    async def refuse(reader, writer):
+        writer.close()
+
+    async def run():
+        dead = await asyncio.start_server(refuse, '127.0.0.1', 0)
+        dead_host = ('127.0.0.1', dead.sockets[0].getsockname()[1])
+        client = AsyncStompClient([dead_host, (broker.host, broker.port)], 'test', 'test',
+                                  use_ssl=False, connections=1, probe_interval=0)
+        try:
+            await client.send('/queue/async.race', 'first')
+            stats = client.stats()
+            assert stats['working_broker'] == f'{broker.host}:{broker.port}'
+            assert [h['healthy'] for h in stats['hosts']] == [False, True]
+
+            broker.drop_connections()
+            await asyncio.sleep(0.2)
+            await client.send('/queue/async.race', 'second', receipt=True)
+            live = client.selector.health[(broker.host, broker.port)]
+            assert live.last_failure is not None and live.healthy
+        finally:
+            await client.close()
+            dead.close()
+
+    asyncio.run(run())
+    assert broker.call(lambda: broker.destination('queue', 'async.race').enqueue_count) == 2
@@ -0,0 +1,116 @@
+import importlib
+import sys
+
+import pytest
+import stomp
+
+from conftest import queue_stats, wait_until
+from connection_pool import ConnectionPool, PoolExhausted
+
+
+@pytest.fixture
+def pool(broker):
+    def factory():
+        conn = stomp.Connection([(broker.host, broker.port)], reconnect_attempts_max=1)
+        conn.connect('test', 'test', wait=True)
+        return conn
+
+    pool = ConnectionPool(factory, size=2, acquire_timeout=1.0, health_check_interval=60)
+    yield pool
+    pool.close()
+
+
+def test_send_reuses_the_pooled_connection(broker, pool):
+    with pool.connection() as first:
+        first.send(body='one', destination='/queue/pool.test')
+    with pool.connection() as second:
+        second.send(body='two', destination='/queue/pool.test')
+
+    assert second is first
+    assert pool.stats()['open'] == 1
+    assert wait_until(lambda: queue_stats(broker, 'pool.test')['enqueueCount'] == 2)
+
+
+def test_error_inside_the_block_discards_the_connection(pool):
+    with pytest.raises(TimeoutError):
+        with pool.connection() as conn:
+            # Still connected, but e.g. a receipt wait gave up half-way through an exchange
+            raise TimeoutError("No receipt from broker")
+
+    assert pool.stats()['replaced'] == 1
+    assert wait_until(lambda: not conn.is_connected())
+    with pool.connection() as fresh:
+        assert fresh is not conn and fresh.is_connected()
+
+
+def test_dead_connections_are_replaced_after_the_broker_drops_them(broker, pool):
+    with pool.connection() as conn:
+        pass
+    broker.drop_connections()
+    assert wait_until(lambda: not conn.is_connected())
+
+    with pool.connection() as fresh:
+        fresh.send(body='after failover', destination='/queue/pool.test')
+
+    assert fresh is not conn
+    assert pool.stats()['replaced'] == 1
+    assert wait_until(lambda: queue_stats(broker, 'pool.test')['enqueueCount'] == 1)
+
+
+def test_acquire_times_out_when_every_connection_is_borrowed(pool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(PoolExhausted):
+            pool.acquire(timeout=0.1)
+
+
+def test_health_check_refills_the_pool_to_its_minimum(broker):
+    def factory():
+        conn = stomp.Connection([(broker.host, broker.port)], reconnect_attempts_max=1)
+        conn.connect('test', 'test', wait=True)
+        return conn
+
+    pool = ConnectionPool(factory, size=4, health_check_interval=0.05, min_size=3)
+    try:
+        assert wait_until(lambda: pool.stats()['idle'] == 3)
+        with pool.connection():
+            pass
+        broker.drop_connections()
+
+        assert wait_until(lambda: pool.stats()['replaced'] == 3 and pool.stats()['idle'] == 3)
+        assert pool.stats()['open'] == 3
+        with pool.connection() as conn:
+            assert conn.is_connected()
+    finally:
+        pool.close()
+
+
+@pytest.fixture
+def app(broker, monkeypatch):
+    """pub/app.py configured for the stand-in broker (it reads its settings at import)"""
+    monkeypatch.setenv('ACTIVEMQ_URL', broker.host)
+    monkeypatch.setenv('ACTIVEMQ_PORT', str(broker.port))
+    monkeypatch.setenv('ACTIVEMQ_URL_SECONDARY', '')
+    monkeypatch.setenv('USE_SSL', 'false')
+    monkeypatch.setenv('PUBLISH_POOL_SIZE', '2')
+    sys.modules.pop('app', None)
+    app = importlib.import_module('app')
+    yield app
+    if app.pool is not None:
+        app.pool.close()
+    sys.modules.pop('app', None)
+
+
+def test_send_pooled_retries_once_on_a_dead_connection(broker, app, monkeypatch):
+    app.send_pooled('warm-up', '/queue/pool.retry')
+    with app.get_pool().connection() as stale:
+        pass
+
+    # The transport has not noticed yet: the first SEND fails on the wire
+    def dead_send(*args, **kwargs):
+        raise stomp.exception.NotConnectedException()
+    monkeypatch.setattr(stale, 'send', dead_send)
+
+    app.send_pooled('retried', '/queue/pool.retry')
+
+    assert app.get_pool().stats()['replaced'] == 1
+    assert wait_until(lambda: queue_stats(broker, 'pool.retry')['enqueueCount'] == 2)
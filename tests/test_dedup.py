@@ -0,0 +1,31 @@
+import dedup
+from dedup import DedupCache
+
+
+def test_hits_restart_the_window_and_expiry_stays_in_order(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(dedup.time, 'monotonic', lambda: clock[0])
+    cache = DedupCache(lru_size=10, window_seconds=10)
+    cache.record('a')
+    clock[0] = 5.0
+    cache.record('b')
+
+    clock[0] = 8.0
+    assert cache.seen('a')
+    # 'b' is now the oldest entry and expires first; 'a' was refreshed at 8
+    clock[0] = 16.0
+    assert not cache.seen('b')
+    assert cache.seen('a')
+    clock[0] = 26.0
+    assert not cache.seen('a')
+    assert cache.stats()['lru_entries'] == 0
+
+
+def test_lru_evicts_the_least_recently_used_key():
+    cache = DedupCache(lru_size=2)
+    cache.record('a')
+    cache.record('b')
+    assert cache.seen('a')
+    cache.record('c')
+
+    assert cache.seen('a') and cache.seen('c') and not cache.seen('b')
@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+
+import pytest
+import stomp
+from stomp.utils import Frame
+
+from acker import BatchAcker
+from conftest import queue_stats, wait_until
+from engine import ProcessingEngine
+
+
+def message(ack_id, subscription='1'):
+    return Frame('MESSAGE', {'ack': ack_id, 'subscription': subscription, 'message-id': f'ID:{ack_id}'})
+
+
+def test_batch_stays_in_flight_until_its_callbacks_ran():
+    finished = threading.Event()
+    engine = ProcessingEngine(lambda messages: None, max_in_flight=10)
+
+    def on_done(frame):
+        time.sleep(0.2)
+        finished.set()
+
+    try:
+        engine.submit(message('1'), on_done=on_done)
+        # What consumer.wait_for_idle() relies on before flushing acks and unsubscribing
+        assert wait_until(lambda: engine.in_flight == 0)
+        assert finished.is_set()
+    finally:
+        engine.close()
+
+
+class EngineListener(stomp.ConnectionListener):
+    """The consumer's dispatch path: receiver thread -> acker.received -> engine"""
+
+    def __init__(self, engine, acker):
+        self.engine = engine
+        self.acker = acker
+
+    def on_message(self, frame):
+        self.acker.received(frame)
+        self.engine.submit(frame, on_done=self.acker.done, on_failed=self.acker.failed)
+
+
+@pytest.mark.parametrize('mode', ['client', 'client-individual'])
+def test_engine_drain_acks_everything_without_redelivery(broker, connect, mode):
+    producer = connect()
+    for i in range(200):
+        producer.send(body=f'm{i}', destination='/queue/engine.drain', headers={'JMSXGroupID': f'g{i % 7}'})
+
+    processed = []
+    lock = threading.Lock()
+
+    def handler(messages):
+        # Lanes finish out of order
+        time.sleep(random.uniform(0, 0.003))
+        with lock:
+            processed.extend(body for body, _ in messages)
+
+    consumer = connect()
+    acker = BatchAcker(consumer, mode, batch_size=10, interval_ms=50)
+    engine = ProcessingEngine(handler, workers=4, max_in_flight=20, batch_size=4, linger_ms=2)
+    consumer.set_listener('engine', EngineListener(engine, acker))
+    consumer.subscribe('/queue/engine.drain', id='1', ack=mode, headers={'activemq.prefetchSize': '20'})
+    try:
+        assert wait_until(lambda: len(processed) == 200)
+
+        # The SIGTERM drain: hold acks, wait for the engine to go idle, then ack and leave
+        acker.hold('1')
+        assert wait_until(lambda: engine.in_flight == 0)
+        acker.release('1')
+        consumer.unsubscribe('1')
+        consumer.disconnect()
+    finally:
+        acker.close()
+        engine.close()
+
+    assert acker.acked == 200
+    # DISCONNECT does not wait for the broker to apply the ACKs before it
+    assert wait_until(lambda: queue_stats(broker, 'engine.drain')['dequeueCount'] == 200)
+    assert queue_stats(broker, 'engine.drain')['size'] == 0
+    assert sorted(processed) == sorted(f'm{i}' for i in range(200))
+
+    # Nothing was left unacknowledged, so a new consumer gets nothing redelivered
+    redelivered = []
+    listener = stomp.ConnectionListener()
+    listener.on_message = redelivered.append
+    late = connect()
+    late.set_listener('late', listener)
+    late.subscribe('/queue/engine.drain', id='2', ack='auto')
+    time.sleep(0.2)
+    assert redelivered == []
@@ -0,0 +1,30 @@
+import gc
+import threading
+
+from metrics import Registry
+
+
+def test_cells_of_exited_threads_are_folded_into_the_totals():
+    metrics = Registry()
+    published = metrics.counter('published', "Published", ('source',))
+    latency = metrics.histogram('request_seconds', "Request time", buckets=(0.1, 1.0))
+
+    def request():
+        published.inc(source='publish')
+        latency.observe(0.05)
+
+    # One thread per request, like the threaded HTTP server
+    for _ in range(300):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(published._all) == 0 and len(latency._all) == 0
+    assert published.values() == {('publish',): 300}
+    counts, total, count = latency.merged()[()]
+    assert counts == [300, 0, 0] and count == 300
+
+    published.inc(source='publish')
+    assert published.values() == {('publish',): 301}
+    assert 'published_total{source="publish"} 301' in metrics.render()
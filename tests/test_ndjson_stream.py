@@ -0,0 +1,22 @@
+import io
+
+import pytest
+
+from app import iter_ndjson_lines
+
+
+def lines_of(body, chunk_size, max_record_bytes=10):
+    return list(iter_ndjson_lines(io.BytesIO(body), chunk_size, max_record_bytes))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 64, 4096])
+def test_oversized_lines_are_flagged_whatever_the_chunk_size(chunk_size):
+    body = b'{"a":1}\n' + b'x' * 25 + b'\n{"b":2}\n' + b'y' * 11 + b'\n{"c":3}'
+
+    assert lines_of(body, chunk_size) == [
+        (1, b'{"a":1}'), (2, None), (3, b'{"b":2}'), (4, None), (5, b'{"c":3}'),
+    ]
+
+
+def test_oversized_last_line_without_a_newline():
+    assert lines_of(b'{"a":1}\n' + b'z' * 40, chunk_size=4096) == [(1, b'{"a":1}'), (2, None)]
@@ -0,0 +1,78 @@
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+import reconnect
+from conftest import ROOT, queue_stats, wait_until
+from reconnect import Backoff, ReconnectStats
+
+
+def test_backoff_ceiling_doubles_up_to_the_maximum_and_resets(monkeypatch):
+    # The upper end of each jittered range
+    monkeypatch.setattr(reconnect.random, 'uniform', lambda low, high: high)
+    backoff = Backoff(initial=0.1, max_delay=1.0)
+
+    assert [round(backoff.next_delay(), 3) for _ in range(6)] == [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+    backoff.reset()
+    assert backoff.next_delay() == 0.1
+
+
+def test_backoff_delays_are_jittered_within_the_ceiling():
+    backoff = Backoff(initial=0.5, max_delay=4.0)
+    delays = [backoff.next_delay() for _ in range(200)]
+
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    # Full jitter: a fleet retrying together does not land on the same instants
+    assert len({round(delay, 6) for delay in delays}) > 150
+
+
+def test_reconnect_stats_summarise_recoveries():
+    stats = ReconnectStats()
+    stats.record_failure()
+    stats.record(0.2)
+    stats.record(0.4)
+
+    summary = stats.as_dict()
+    assert summary['reconnects'] == 2 and summary['failed_attempts'] == 1
+    assert summary['max_resubscribe_seconds'] == 0.4
+    assert summary['avg_resubscribe_seconds'] == pytest.approx(0.3)
+
+
+@pytest.fixture
+def consumer(broker, tmp_path):
+    """sub/consumer.py as its own process, subscribed to /queue/reconnect.test on the stand-in broker"""
+    output = tmp_path / 'consumer.log'
+    env = dict(os.environ, USE_SSL='false', ACTIVEMQ_URL=broker.host, ACTIVEMQ_PORT=str(broker.port),
+               ACTIVEMQ_URL_SECONDARY='', ACTIVEMQ_QUEUE='/queue/reconnect.test', CONSUMER_SUBSCRIPTIONS='',
+               CONSUMER_ACK_MODE='client', METRICS_PORT='0', RECONNECT_BACKOFF_INITIAL_MS='50',
+               RECONNECT_BACKOFF_MAX_MS='500', PYTHONUNBUFFERED='1')
+    with open(output, 'w') as out:
+        process = subprocess.Popen([sys.executable, 'consumer.py'], cwd=os.path.join(ROOT, 'sub'), env=env,
+                                   stdout=out, stderr=subprocess.STDOUT)
+    yield process, output
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+
+
+def test_consumer_resubscribes_after_the_broker_drops_it(broker, connect, consumer):
+    process, output = consumer
+    assert wait_until(lambda: queue_stats(broker, 'reconnect.test')['consumerCount'] == 1, timeout=10)
+    producer = connect()
+    producer.send(body='before', destination='/queue/reconnect.test')
+    assert wait_until(lambda: queue_stats(broker, 'reconnect.test')['dequeueCount'] == 1, timeout=5)
+
+    broker.drop_connections()
+    assert wait_until(lambda: 'Resubscribed' in output.read_text(), timeout=10)
+
+    producer = connect()
+    producer.send(body='after', destination='/queue/reconnect.test')
+    assert wait_until(lambda: queue_stats(broker, 'reconnect.test')['dequeueCount'] == 2, timeout=5)
+
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=10) == 0
+    log = output.read_text()
+    assert 'before' in log and 'after' in log
@@ -0,0 +1,58 @@
+import queue
+
+import pytest
+import stomp
+
+from conftest import wait_until
+from stats_parser import DestinationStats, parse_destination_stats, parse_map, split_destination
+
+
+def statistics_replies(connect, destination, expected):
+    """Send one Statistics plugin request and collect `expected` reply bodies"""
+    replies = queue.Queue()
+    listener = stomp.ConnectionListener()
+    listener.on_message = lambda frame: replies.put(frame.body)
+    conn = connect()
+    conn.set_listener('stats', listener)
+    conn.subscribe('/temp-queue/stats.reply', id='1', ack='auto')
+    conn.send(body='', destination=destination, headers={'reply-to': '/temp-queue/stats.reply'})
+    return [replies.get(timeout=5) for _ in range(expected)]
+
+
+def test_destination_reply_parses_into_typed_stats(broker, connect):
+    producer = connect()
+    for i in range(3):
+        producer.send(body=f'order {i}', destination='/queue/orders.eu')
+    assert wait_until(lambda: broker.call(lambda: broker.destination('queue', 'orders.eu').enqueue_count) == 3)
+
+    [body] = statistics_replies(connect, '/queue/ActiveMQ.Statistics.Destination.orders.eu', 1)
+    stats = parse_destination_stats(body)
+
+    assert (stats.kind, stats.name) == ('queue', 'orders.eu')
+    assert stats['size'] == 3 and stats.enqueueCount == 3 and stats.dequeueCount == 0
+    assert isinstance(stats.averageEnqueueTime, float)
+    assert 'size' in stats and 'brokerName' not in stats
+    assert stats.get('producerCount') == 1 and stats.get('unknown', 'x') == 'x'
+    assert dict(stats.items()) == stats.as_dict()
+
+
+def test_broker_reply_is_not_destination_stats(broker, connect):
+    [body] = statistics_replies(connect, '/queue/ActiveMQ.Statistics.Broker', 1)
+
+    assert parse_destination_stats(body) is None
+    broker_stats = parse_map(body)
+    assert broker_stats['brokerName'] == 'localhost' and isinstance(broker_stats['memoryLimit'], int)
+    assert parse_map(body, keys={'size'}) == {'size': broker_stats['size']}
+
+
+def test_parser_handles_escaped_names_and_non_map_bodies():
+    body = ('<map><entry><string>destinationName</string><string>topic://a&amp;b</string></entry>'
+            '<entry><string>size</string><long>7</long></entry></map>')
+    stats = parse_destination_stats(body.encode())
+
+    assert (stats.kind, stats.name, stats.size) == ('topic', 'a&b', 7)
+    assert parse_destination_stats('not a map') is None
+    assert parse_map('') == {}
+    assert split_destination('orders') == (None, 'orders')
+    with pytest.raises(KeyError):
+        DestinationStats('queue', 'empty')['size']
@@ -0,0 +1,99 @@
+import queue
+
+import stomp
+
+from conftest import queue_stats, wait_until
+from stomp_broker import wildcard_match
+
+
+class Collector(stomp.ConnectionListener):
+    def __init__(self):
+        self.frames = queue.Queue()
+
+    def on_message(self, frame):
+        self.frames.put(frame)
+
+    def take(self, count, timeout=5):
+        return [self.frames.get(timeout=timeout) for _ in range(count)]
+
+
+def subscribe(connect, destination, **kwargs):
+    conn = connect()
+    listener = Collector()
+    conn.set_listener('collector', listener)
+    conn.subscribe(destination, id='1', **kwargs)
+    return conn, listener
+
+
+def test_wildcards_match_one_segment_or_the_rest():
+    assert wildcard_match('orders.*', 'orders.eu')
+    assert not wildcard_match('orders.*', 'orders.eu.late')
+    assert wildcard_match('orders.>', 'orders.eu.late')
+    assert not wildcard_match('orders.>', 'invoices.eu')
+
+
+def test_client_ack_is_cumulative(broker, connect):
+    producer = connect()
+    for i in range(5):
+        producer.send(body=f'm{i}', destination='/queue/broker.ack')
+    conn, listener = subscribe(connect, '/queue/broker.ack', ack='client')
+    frames = listener.take(5)
+
+    conn.ack(frames[2].headers['message-id'], '1')
+    assert wait_until(lambda: queue_stats(broker, 'broker.ack')['dequeueCount'] == 3)
+    assert queue_stats(broker, 'broker.ack')['inflightCount'] == 2
+
+
+def test_prefetch_limits_unacked_deliveries(broker, connect):
+    producer = connect()
+    for i in range(5):
+        producer.send(body=f'm{i}', destination='/queue/broker.prefetch')
+    conn, listener = subscribe(connect, '/queue/broker.prefetch', ack='client-individual',
+                               headers={'activemq.prefetchSize': '2'})
+    first = listener.take(2)
+    assert listener.frames.empty() and queue_stats(broker, 'broker.prefetch')['inflightCount'] == 2
+
+    conn.ack(first[0].headers['message-id'], '1')
+    [third] = listener.take(1)
+    assert third.body == 'm2'
+
+
+def test_nack_redelivers_with_the_redelivered_flag(broker, connect):
+    producer = connect()
+    producer.send(body='retry me', destination='/queue/broker.nack')
+    conn, listener = subscribe(connect, '/queue/broker.nack', ack='client-individual')
+    [first] = listener.take(1)
+    assert 'redelivered' not in first.headers
+
+    conn.nack(first.headers['message-id'], '1')
+    [again] = listener.take(1)
+    assert again.body == 'retry me' and again.headers['redelivered'] == 'true'
+
+
+def test_statistics_replies_echo_the_correlation_id(broker, connect):
+    producer = connect()
+    for name in ('stats.a', 'stats.b', 'other'):
+        producer.send(body='x', destination=f'/queue/{name}')
+    assert wait_until(lambda: queue_stats(broker, 'other')['enqueueCount'] == 1)
+
+    conn, listener = subscribe(connect, '/temp-queue/stats.reply', ack='auto')
+    conn.send(body='', destination='/queue/ActiveMQ.Statistics.Destination.stats.*',
+              headers={'reply-to': '/temp-queue/stats.reply', 'correlation-id': 'poll-7'})
+    replies = listener.take(2)
+
+    assert all(frame.headers['correlation-id'] == 'poll-7' for frame in replies)
+    assert all(frame.headers['transformation'] == 'jms-map-xml' for frame in replies)
+    assert sorted('stats.a' in frame.body for frame in replies) == [False, True]
+    assert listener.frames.empty()
+
+
+def test_dropped_connections_requeue_their_unacked_messages(broker, connect):
+    producer = connect()
+    producer.send(body='in flight', destination='/queue/broker.drop')
+    conn, listener = subscribe(connect, '/queue/broker.drop', ack='client')
+    listener.take(1)
+
+    broker.drop_connections()
+    assert wait_until(lambda: not conn.is_connected())
+    stats = queue_stats(broker, 'broker.drop')
+    assert stats['consumerCount'] == 0 and stats['size'] == 1 and stats['inflightCount'] == 0
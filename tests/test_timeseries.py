@@ -0,0 +1,106 @@
+import math
+import time
+
+import pytest
+
+from conftest import queue_stats, wait_until
+from timeseries import SeriesRing, TimeSeriesStore
+
+
+def ring_with(samples, capacity=10):
+    ring = SeriesRing(capacity)
+    for t, size, enqueued, dequeued in samples:
+        ring.append(t, {'size': size, 'enqueueCount': enqueued, 'dequeueCount': dequeued})
+    return ring
+
+
+def test_rates_and_drain_time_of_a_draining_queue():
+    # 10 msg/s in, 15 msg/s out: the backlog shrinks by 5 msg/s
+    ring = ring_with([(100.0 + i, 100 - 5 * i, 10 * i, 15 * i) for i in range(5)])
+    rates = ring.rates(60)
+
+    assert rates['enqueue_rate'] == 10 and rates['dequeue_rate'] == 15
+    assert rates['backlog_growth'] == -5
+    assert rates['size'] == 80 and rates['drain_seconds'] == 80 / 5
+    assert rates['samples'] == 5 and rates['window_seconds'] == 4
+
+
+def test_growing_queue_never_drains_and_empty_queue_is_drained():
+    growing = ring_with([(0.0, 10, 0, 0), (10.0, 30, 40, 20)]).rates(60)
+    assert growing['backlog_growth'] == 2 and growing['drain_seconds'] is None
+
+    empty = ring_with([(0.0, 0, 0, 0), (10.0, 0, 50, 50)]).rates(60)
+    assert empty['drain_seconds'] == 0
+
+
+def test_rates_only_use_the_window_and_need_two_samples():
+    ring = ring_with([(0.0, 0, 0, 0), (100.0, 0, 1000, 1000), (110.0, 0, 1100, 1100)])
+
+    assert ring.rates(30)['samples'] == 2 and ring.rates(30)['enqueue_rate'] == 10
+    assert ring.rates(500)['samples'] == 3
+    assert ring_with([(0.0, 5, 5, 0)]).rates(60) is None
+
+
+def test_counter_reset_starts_the_rates_over():
+    # The broker restarted between t=2 and t=3: counters dropped back to near zero
+    ring = ring_with([(0.0, 0, 1000, 1000), (1.0, 0, 1100, 1100), (2.0, 0, 1200, 1200),
+                      (3.0, 4, 4, 0), (5.0, 2, 10, 8)])
+    rates = ring.rates(60)
+
+    assert rates['samples'] == 2
+    assert rates['enqueue_rate'] == 3 and rates['dequeue_rate'] == 4
+
+
+def test_ring_keeps_only_the_newest_samples():
+    ring = ring_with([(float(t), 0, t, t) for t in range(25)], capacity=4)
+
+    assert ring.count == 4
+    assert ring.latest()['enqueueCount'] == 24
+    assert ring.rates(1000)['samples'] == 4 and ring.rates(1000)['window_seconds'] == 3
+    assert math.isnan(ring.latest()['consumerCount'])
+
+
+def test_store_persists_samples_and_reloads_them(tmp_path):
+    store = TimeSeriesStore(capacity=5, directory=str(tmp_path))
+    for i in range(8):
+        store.record('queue', 'orders', {'size': 50 - i, 'enqueueCount': 10 * i, 'dequeueCount': 11 * i}, t=1000.0 + i)
+    store.record('topic', 'events', {'enqueueCount': 1}, t=1000.0)
+    before = store.rates('queue', 'orders', 60, now=1007.0)
+    assert before['samples'] == 5
+    store.close()
+
+    reopened = TimeSeriesStore(capacity=5, directory=str(tmp_path))
+    try:
+        assert reopened.disk.rows == 9
+        assert reopened.rates('queue', 'orders', 60, now=1007.0) == before
+        assert reopened.latest('topic', 'events')['enqueueCount'] == 1
+        reopened.record('queue', 'orders', {'size': 42, 'enqueueCount': 80, 'dequeueCount': 88}, t=1008.0)
+        assert reopened.disk.rows == 10
+    finally:
+        reopened.close()
+
+
+def test_store_records_live_statistics(broker, connect):
+    store = TimeSeriesStore(capacity=10)
+    producer = connect()
+    now = time.time()
+    for t, sent, total in ((now - 2.0, 4, 4), (now, 6, 10)):
+        for _ in range(sent):
+            producer.send(body='x', destination='/queue/rates.live')
+        assert wait_until(lambda: queue_stats(broker, 'rates.live')['enqueueCount'] == total)
+        store.record('queue', 'rates.live', queue_stats(broker, 'rates.live'), t=t)
+
+    rates = store.rates('queue', 'rates.live', 60)
+    assert rates['enqueue_rate'] == pytest.approx(3) and rates['dequeue_rate'] == 0
+    assert rates['backlog_growth'] == pytest.approx(3) and rates['drain_seconds'] is None
+
+
+def test_store_rates_of_a_series_that_stopped_updating_are_stale():
+    store = TimeSeriesStore(capacity=10)
+    now = time.time()
+    for i in range(5):
+        store.record('queue', 'gone', {'size': 10, 'enqueueCount': i, 'dequeueCount': 0}, t=now - 300 + i)
+
+    assert store.rates('queue', 'gone', 60) is None
+    assert store.rates('queue', 'gone', 600)['samples'] == 5
+    assert store.rates('queue', 'missing', 60) is None